@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+GripAI - Benchmark van de cold start
+Meet hoe lang het importeren van src/main.py en het starten van de CLI duurt,
+elk in een vers proces, en welke modules het meeste importtijd kosten.
+Controleert ook dat de zware SDKs (anthropic, supabase, resend, jinja2,
+httpx) pas bij gebruik geladen worden.
+
+    python benchmarks/bench_import_time.py --output imports.json
+    python benchmarks/bench_import_time.py --baseline imports.json --max-ms 300
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+# Mogen niet geladen zijn na 'import main'
+LAZY_MODULES = ('anthropic', 'supabase', 'resend', 'jinja2', 'httpx')
+
+# (naam, argumenten voor python) per meting
+COMMANDS = {
+    'import_main': ['-c', 'import main'],
+    'usage': [os.path.join(SRC, 'main.py')],
+    'help': [os.path.join(SRC, 'main.py'), '--help']
+}
+
+
+def _run(args: list[str], importtime: bool = False) -> tuple[float, str]:
+    """Draai python met args in src/; return (wall seconden, stderr)."""
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), *args]
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=SRC, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        raise SystemExit(f"Command faalde: {' '.join(command)}")
+    return wall, completed.stderr
+
+
+def parse_importtime(stderr: str, root: str = 'main') -> tuple[int, dict[str, int]]:
+    """
+    Lees -X importtime output.
+    
+    Returns:
+        (cumulatieve µs van root, cumulatieve µs per module die root direct importeert)
+    """
+    children: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Inspringing (2 spaties per niveau) geeft de diepte; kinderen komen vóór hun ouder
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == root:
+                return int(cumulative_us), children
+            children = {}
+        elif depth == 1:
+            children[name] = children.get(name, 0) + int(cumulative_us)
+    return 0, {}
+
+
+def loaded_lazy_modules() -> list[str]:
+    """Welke LAZY_MODULES na 'import main' al in sys.modules staan."""
+    check = f"import sys, main; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    completed = subprocess.run([sys.executable, '-c', check], cwd=SRC, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        raise SystemExit("import main faalde")
+    return [m for m in completed.stdout.strip().split(',') if m]
+
+
+def measure(repeat: int) -> dict:
+    results = {}
+    for name, args in COMMANDS.items():
+        walls = [_run(args)[0] for _ in range(repeat)]
+        results[name] = {
+            'median_ms': round(statistics.median(walls) * 1000, 1),
+            'min_ms': round(min(walls) * 1000, 1),
+            'max_ms': round(max(walls) * 1000, 1)
+        }
+        print(f"⏱️  {name:<12} {results[name]['median_ms']:>8.1f} ms (min {results[name]['min_ms']:.1f})")
+    
+    # Baseline: een lege interpreter, om de eigen importtijd te isoleren
+    empty = statistics.median(_run(['-c', 'pass'])[0] for _ in range(repeat))
+    
+    _, stderr = _run(COMMANDS['import_main'], importtime=True)
+    total, modules = parse_importtime(stderr)
+    top = sorted(modules.items(), key=lambda item: -item[1])[:10]
+    
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'interpreter_ms': round(empty * 1000, 1),
+        'main_import_ms': round(total / 1000, 1),
+        'commands': results,
+        'top_imports_ms': {name: round(us / 1000, 1) for name, us in top},
+        'lazy_modules_loaded': loaded_lazy_modules()
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Vergelijk mediane tijden met een baseline; return een regel per regressie."""
+    regressions = []
+    print(f"\n{'meting':<14} {'baseline':>10} {'nu':>10}")
+    for name, result in current['commands'].items():
+        base = baseline.get('commands', {}).get(name)
+        if not base:
+            continue
+        old, new = base['median_ms'], result['median_ms']
+        print(f"{name:<14} {old:>10.1f} {new:>10.1f}")
+        if old and (new - old) / old > tolerance:
+            regressions.append(f"{name}: {old:g} → {new:g} ms ({(new - old) / old:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold start / import time of src/main.py')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per command (median is reported)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against an earlier --output file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression vs baseline')
+    parser.add_argument('--max-ms', type=float, help='Fail if importing main takes longer than this')
+    args = parser.parse_args()
+    
+    results = measure(args.repeat)
+    print(f"\n📦 import main: {results['main_import_ms']:.1f} ms (interpreter: {results['interpreter_ms']:.1f} ms)")
+    for name, ms in results['top_imports_ms'].items():
+        print(f"   {ms:>8.1f} ms  {name}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📄 Resultaten: {args.output}")
+    
+    failures = []
+    if results['lazy_modules_loaded']:
+        failures.append(f"geladen bij import main: {', '.join(results['lazy_modules_loaded'])}")
+    if args.max_ms is not None and results['main_import_ms'] > args.max_ms:
+        failures.append(f"import main {results['main_import_ms']:g} ms > {args.max_ms:g} ms")
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures.extend(compare(results, json.load(f), args.tolerance))
+    
+    if failures:
+        print("\n❌ Cold start regressies:")
+        for line in failures:
+            print(f"   {line}")
+        sys.exit(1)
+    print("\n✅ Cold start binnen de grenzen")
+
+
+if __name__ == '__main__':
+    main()
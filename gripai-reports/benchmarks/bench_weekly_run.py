@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+GripAI - Benchmark van de weekrun
+Draait run_all_reports uit src/main.py tegen lokale stand-ins (zie fakes.py)
+voor een reeks aantallen klanten, elk in een eigen proces, en rapporteert
+wall time, throughput, piek geheugen en tijd per stage als JSON.
+    
+    python benchmarks/bench_weekly_run.py --customers 10,100,1000 --output bench.json
+    python benchmarks/bench_weekly_run.py --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_single(args) -> dict:
+    """Eén run met args.single klanten in dit proces; return de resultaten."""
+    workdir = tempfile.mkdtemp(prefix='gripai-bench-')
+    os.environ.setdefault('ANALYSIS_CACHE', '0')
+    os.environ.setdefault('TEMPLATE_CACHE_DIR', os.path.join(workdir, 'templates'))
+    os.environ.setdefault('INVOICE_STORE_DIR', os.path.join(workdir, 'invoices'))
+    os.environ.setdefault('HTTP_CACHE_PATH', os.path.join(workdir, 'http.sqlite'))
+    os.environ.setdefault('WEBHOOK_STORE_PATH', os.path.join(workdir, 'webhooks.sqlite'))
+    
+    import main
+    from analysis.batch import BatchReportAnalyzer, LocalBatchClient
+    from analysis.weekly_report import WeeklyReportAnalyzer
+    from connectors.http import create_http_client, set_http_client
+    from connectors.http_cache import http_cache_stats
+    from connectors.scheduler import get_scheduler
+    from services.email import EmailService
+    from services.metrics import get_metrics
+    from fakes import FakeAnthropic, FakeDatabase, FakeMoneybird, FakeResend
+    
+    moneybird = FakeMoneybird(
+        args.invoices, args.moneybird_latency, args.error_rate,
+        slow_rate=args.slow_rate, slow_latency=args.slow_moneybird
+    )
+    db = FakeDatabase(args.single, args.supabase_latency, args.error_rate)
+    anthropic = FakeAnthropic(
+        args.anthropic_latency, args.error_rate, slow_rate=args.slow_rate, slow_latency=args.slow_anthropic
+    )
+    resend = FakeResend(args.resend_latency, args.error_rate)
+    set_http_client(create_http_client(transport=moneybird))
+    
+    analyzer = WeeklyReportAnalyzer(client=anthropic)
+    batch = args.mode == 'batch'
+    batch_analyzer = BatchReportAnalyzer(analyzer, client=LocalBatchClient(), poll_interval=0) if batch else None
+    
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(main.run_all_reports(
+            batch=batch,
+            metrics_dir=os.path.join(workdir, 'metrics'),
+            db=db,
+            analyzer=analyzer,
+            email_service=EmailService(transport=resend),
+            batch_analyzer=batch_analyzer
+        ))
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    
+    summary = get_metrics().summary()
+    histograms = {
+        (h['name'], tuple(sorted(h['labels'].items()))): h for h in summary['histograms']
+    }
+    stages = {
+        dict(labels)['stage']: {key: h[key] for key in ('count', 'sum', 'p50', 'p95', 'max')}
+        for (name, labels), h in histograms.items() if name == 'stage_seconds'
+    }
+    services = {
+        f"{dict(labels)['service']}.{dict(labels)['op']}": {key: h[key] for key in ('count', 'sum', 'p50', 'p95', 'max')}
+        for (name, labels), h in histograms.items() if name == 'request_seconds'
+    }
+    # ru_maxrss is KB op Linux en bytes op macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+    
+    return {
+        'customers': args.single,
+        'mode': args.mode,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'customers_per_second': round(args.single / wall, 2) if wall else 0.0,
+        'peak_rss_mb': round(peak_mb, 1),
+        'reports_sent': resend.sent,
+        'requests': {
+            'moneybird': moneybird.requests,
+            'supabase': db.queries,
+            'anthropic': anthropic.calls,
+            'resend': resend.requests
+        },
+        'scheduler': dict(get_scheduler().stats),
+        'http_cache': http_cache_stats(),
+        'claude': dict(analyzer.usage),
+        'latency': get_metrics().customer_latency(),
+        'stages': stages,
+        'services': services
+    }
+
+
+def run_sizes(args) -> dict:
+    """Draai elke grootte in een vers proces, zodat geheugen en singletons niet meetellen."""
+    results = []
+    for size in args.customers:
+        command = [sys.executable, os.path.abspath(__file__), '--single', str(size), *_passthrough(args)]
+        print(f"⏱️  {size} klanten...", flush=True)
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            raise SystemExit(f"Benchmark voor {size} klanten faalde")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"   {result['wall_seconds']:.2f}s  {result['customers_per_second']:.1f} klanten/s  "
+              f"{result['peak_rss_mb']:.0f} MB  {result['reports_sent']}/{size} verzonden  "
+              f"p99 per klant {result['latency'].get('p99', 0):.2f}s")
+    
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'single')},
+        'results': results
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Vergelijk met een baseline; return een regel per regressie."""
+    previous = {r['customers']: r for r in baseline.get('results', [])}
+    regressions = []
+    print(f"\n{'klanten':>8} {'wall':>16} {'klanten/s':>18} {'piek MB':>16}")
+    for result in current['results']:
+        base = previous.get(result['customers'])
+        if not base:
+            continue
+        cells = []
+        for key, higher_is_worse in (('wall_seconds', True), ('customers_per_second', False), ('peak_rss_mb', True)):
+            old, new = base[key], result[key]
+            change = (new - old) / old if old else 0.0
+            cells.append(f"{old:>7g} → {new:<7g}")
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            if worse:
+                regressions.append(f"{result['customers']} klanten: {key} {old:g} → {new:g} ({change:+.0%})")
+        print(f"{result['customers']:>8} " + ' '.join(f"{cell:>16}" for cell in cells))
+    return regressions
+
+
+def _passthrough(args) -> list[str]:
+    return [
+        '--mode', args.mode,
+        '--invoices', str(args.invoices),
+        '--moneybird-latency', str(args.moneybird_latency),
+        '--supabase-latency', str(args.supabase_latency),
+        '--anthropic-latency', str(args.anthropic_latency),
+        '--resend-latency', str(args.resend_latency),
+        '--error-rate', str(args.error_rate),
+        '--slow-rate', str(args.slow_rate),
+        '--slow-moneybird', str(args.slow_moneybird),
+        '--slow-anthropic', str(args.slow_anthropic)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the weekly run against local fakes')
+    parser.add_argument('--customers', default='10,100,1000,10000',
+                        type=lambda value: [int(n) for n in value.split(',')], help='Comma separated customer counts')
+    parser.add_argument('--mode', choices=['pipeline', 'batch'], default='pipeline', help='Run mode')
+    parser.add_argument('--invoices', type=int, default=50, help='Invoices per administration in the report week')
+    parser.add_argument('--moneybird-latency', type=float, default=0.02, help='Seconds per Moneybird request')
+    parser.add_argument('--supabase-latency', type=float, default=0.01, help='Seconds per Supabase query')
+    parser.add_argument('--anthropic-latency', type=float, default=0.05, help='Seconds per Claude call')
+    parser.add_argument('--resend-latency', type=float, default=0.01, help='Seconds per Resend request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Failure probability per call, for every fake')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='Probability that a Moneybird or Claude call is slow (tail latency)')
+    parser.add_argument('--slow-moneybird', type=float, default=5.0, help='Seconds for a slow Moneybird request')
+    parser.add_argument('--slow-anthropic', type=float, default=30.0, help='Seconds for a slow Claude call')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against an earlier --output file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression vs baseline')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.single is not None:
+        print(json.dumps(run_single(args)))
+        return
+    
+    results = run_sizes(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📄 Resultaten: {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressies t.o.v. baseline:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("\n✅ Geen regressies t.o.v. baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+GripAI - Lokale stand-ins voor benchmarks
+Moneybird (als httpx transport), Supabase, Anthropic en Resend, elk met
+instelbare latency, foutkans en datavolume. Data wordt per request
+deterministisch gegenereerd en niet bewaard, zodat het geheugengebruik van
+de fakes de meting niet vertekent.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+import httpx
+
+
+COMPANIES = ['Bakkerij Jansen', 'Familie de Vries', 'Bouwbedrijf Smit', 'Hotel Drenthe', 'Garage Bakker',
+             'Installatiebedrijf Mulder', 'Kapsalon Visser', 'Tuincentrum de Boer', 'Schilder Meijer', 'Camping Bos']
+
+
+class FakeMoneybird(httpx.AsyncBaseTransport):
+    """
+    Moneybird API v2 als httpx transport: sales_invoices (period en
+    state:open), financial_mutations en de synchronization endpoints, met
+    paginering via de Link header en ETags (304 bij If-None-Match).
+    """
+    
+    def __init__(
+        self,
+        invoices: int = 50,
+        latency: float = 0.02,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 5.0
+    ):
+        """
+        Args:
+            invoices: Facturen per administratie in de rapportweek
+                      (openstaand en betalingen: de helft daarvan)
+            latency: Seconden per request
+            error_rate: Kans op een 503 per request
+            slow_rate: Kans dat een request slow_latency seconden duurt (trage staart)
+        """
+        self.invoices = invoices
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.not_modified = 0
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_latency)
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return httpx.Response(503, headers={'Retry-After': '0'})
+        
+        # /api/v2/<admin_id>/<resource>[/synchronization]
+        parts = request.url.path.split('/')[3:]
+        admin_id, resource = parts[0], '/'.join(parts[1:])
+        params = {key: values[0] for key, values in parse_qs(request.url.query.decode()).items()}
+        filter = params.get('filter', '')
+        
+        first, days = self._period(filter)
+        kind = 'open' if filter == 'state:open' else 'period'
+        
+        if resource == 'sales_invoices/synchronization':
+            if request.method == 'POST':
+                ids = json.loads(request.content)['ids']
+                return httpx.Response(200, json=[self._invoice(admin_id, inv_id) for inv_id in ids])
+            return self._json(request, [
+                {'id': self._id(kind, first, i), 'version': 1} for i in range(self._count(kind, days))
+            ])
+        
+        if resource == 'sales_invoices':
+            make = lambda i: self._invoice(admin_id, self._id(kind, first, i))
+        elif resource == 'financial_mutations':
+            kind = 'payments'
+            make = lambda i: self._payment(self._id(kind, first, i))
+        else:
+            return httpx.Response(404, json={'error': f'unknown resource {resource}'})
+        
+        page = int(params.get('page', '1'))
+        per_page = int(params.get('per_page', '100'))
+        start = (page - 1) * per_page
+        count = self._count(kind, days)
+        stop = min(start + per_page, count)
+        headers = {}
+        if stop < count:
+            next_url = request.url.copy_merge_params({'page': page + 1})
+            headers['Link'] = f'<{next_url}>; rel="next"'
+        return self._json(request, [make(i) for i in range(start, stop)], headers)
+    
+    def _json(self, request: httpx.Request, data: list, headers: dict | None = None) -> httpx.Response:
+        """200 met ETag over de body, of 304 als de client die ETag al heeft."""
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            self.not_modified += 1
+            return httpx.Response(304, headers={'ETag': etag})
+        return httpx.Response(200, content=body, headers={**(headers or {}), 'ETag': etag, 'Content-Type': 'application/json'})
+    
+    def _period(self, filter: str) -> tuple[datetime, int]:
+        """Eerste dag en aantal dagen van een 'period:YYYYMMDD..YYYYMMDD' filter (default: laatste 8 weken)."""
+        if filter.startswith('period:'):
+            first, _, last = filter[len('period:'):].partition('..')
+            first, last = datetime.strptime(first, '%Y%m%d'), datetime.strptime(last, '%Y%m%d')
+            return first, (last - first).days + 1
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=56), 56
+    
+    def _per_day(self, kind: str) -> int:
+        return max(1, (self.invoices if kind == 'period' else self.invoices // 2) // 7)
+    
+    def _count(self, kind: str, days: int) -> int:
+        """Facturen en betalingen per dag maal de periode; openstaand vast."""
+        if kind == 'open':
+            return self.invoices // 2
+        return self._per_day(kind) * days
+    
+    def _id(self, kind: str, first: datetime, i: int) -> str:
+        """
+        Id met de datum erin, zodat elke periode dezelfde facturen oplevert:
+        <kind>-<YYYYMMDD>-<n>. Openstaande facturen liggen verspreid over de periode.
+        """
+        if kind == 'open':
+            return f'open-{(first + timedelta(days=i % 56)):%Y%m%d}-{i}'
+        per_day = self._per_day(kind)
+        return f'{kind}-{(first + timedelta(days=i // per_day)):%Y%m%d}-{i % per_day}'
+    
+    def _invoice(self, admin_id: str, inv_id: str) -> dict:
+        rng = random.Random(f'{admin_id}/{inv_id}')
+        issued = datetime.strptime(inv_id.split('-')[1], '%Y%m%d')
+        total = round(rng.uniform(50, 5000), 2)
+        is_open = inv_id.startswith('open')
+        paid = None if is_open or rng.random() < 0.3 else issued + timedelta(days=rng.randint(1, 45))
+        return {
+            'id': inv_id,
+            'version': 1,
+            'invoice_id': f'2026-{inv_id}',
+            'invoice_date': issued.strftime('%Y-%m-%d'),
+            'due_date': (issued + timedelta(days=rng.randint(-30, 30))).strftime('%Y-%m-%d'),
+            'paid_at': paid.strftime('%Y-%m-%dT12:00:00.000Z') if paid else None,
+            'total_price_incl_tax': f'{total:.2f}',
+            'total_unpaid': f'{total:.2f}' if is_open else '0.0',
+            'contact': {'company_name': rng.choice(COMPANIES)}
+        }
+    
+    def _payment(self, payment_id: str) -> dict:
+        day = datetime.strptime(payment_id.split('-')[1], '%Y%m%d').strftime('%Y-%m-%d')
+        return {'id': payment_id, 'date': day, 'payment_date': day, 'amount': '100.0'}
+
+
+class FakeDatabase:
+    """
+    Stand-in voor Database: actieve klanten, vorige snapshots, trends en de
+    run ledger; inserts worden alleen geteld.
+    """
+    
+    def __init__(self, customers: int, latency: float = 0.01, error_rate: float = 0.0, batch_size: int = 200, seed: int = 0):
+        """
+        Args:
+            customers: Aantal synthetische actieve klanten
+            latency: Seconden per query
+            error_rate: Kans dat een insert faalt
+        """
+        self.customers = customers
+        self.latency = latency
+        self.error_rate = error_rate
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.queries = 0
+        self.rows = 0
+    
+    async def _query(self, write: bool = False):
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if write and self.error_rate and self.random.random() < self.error_rate:
+            raise ConnectionError('fake supabase: insert failed')
+    
+    async def get_active_customers(self) -> list[dict]:
+        await self._query()
+        return [
+            {
+                'id': f'cust-{i}',
+                'name': f'Klant {i}',
+                'email': f'klant{i}@example.com',
+                'company_name': f'{COMPANIES[i % len(COMPANIES)]} {i}',
+                'accounting_system': 'moneybird',
+                'accounting_credentials': {'admin_id': f'adm{i}', 'token': f'token-{i}'},
+                'active': True
+            }
+            for i in range(self.customers)
+        ]
+    
+    async def get_previous_snapshots(self, customer_ids: list[str]) -> dict[str, dict]:
+        for _ in range(0, len(customer_ids), self.batch_size):
+            await self._query()
+        return {
+            customer_id: {'revenue': 10000.0 + i, 'invoices_sent': 10, 'outstanding_total': 5000.0}
+            for i, customer_id in enumerate(customer_ids)
+            if i % 4
+        }
+    
+    async def get_trends(self, customer_ids: list[str]) -> dict[str, dict]:
+        for _ in range(0, len(customer_ids), self.batch_size):
+            await self._query()
+        return {}
+    
+    async def get_run_ledger(self, week_start: str, customer_ids: list[str]) -> list[dict]:
+        for _ in range(0, len(customer_ids), self.batch_size):
+            await self._query()
+        return []
+    
+    async def upsert_run_ledger(self, rows: list[dict]):
+        for i in range(0, len(rows), self.batch_size):
+            await self._query(write=True)
+    
+    async def save_snapshots(self, snapshots: list[dict], on_chunk=None) -> list[str]:
+        return await self._insert(snapshots, on_chunk)
+    
+    async def save_reports(self, reports: list[dict]) -> list[str]:
+        return await self._insert(reports)
+    
+    async def _insert(self, rows: list[dict], on_chunk=None) -> list[str]:
+        ids = []
+        for i in range(0, len(rows), self.batch_size):
+            await self._query(write=True)
+            chunk_ids = [str(uuid.uuid4()) for _ in rows[i:i + self.batch_size]]
+            self.rows += len(chunk_ids)
+            if on_chunk:
+                on_chunk(i, chunk_ids)
+            ids.extend(chunk_ids)
+        return ids
+    
+    def close(self):
+        pass
+
+
+class FakeAnthropic:
+    """Stand-in voor AsyncAnthropic: messages.create en messages.stream met vaste latency en token telling."""
+    
+    def __init__(
+        self,
+        latency: float = 0.05,
+        error_rate: float = 0.0,
+        output_tokens: int = 400,
+        seed: int = 0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 30.0
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.output_tokens = output_tokens
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.messages = self
+    
+    async def create(self, model: str, max_tokens: int, messages: list[dict], system=None, **kwargs):
+        self.calls += 1
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_latency)
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise RuntimeError('fake anthropic: overloaded')
+        
+        prompt = messages[0]['content']
+        text = '**Samenvatting**\nEen stabiele week.\n\n**Aandachtspunten**\n- Openstaande facturen opvolgen\n'
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text=text)],
+            usage=SimpleNamespace(
+                input_tokens=len(prompt) // 4,
+                output_tokens=self.output_tokens,
+                cache_creation_input_tokens=0,
+                cache_read_input_tokens=500
+            )
+        )
+    
+    @contextlib.asynccontextmanager
+    async def stream(self, **kwargs):
+        """Als create, maar als stream; get_final_message wacht op het hele bericht."""
+        yield SimpleNamespace(get_final_message=lambda: self.create(**kwargs))
+
+
+class FakeResend:
+    """Stand-in voor ResendTransport; synchroon zoals de echte (draait in een thread)."""
+    
+    def __init__(self, latency: float = 0.01, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.sent = 0
+    
+    def send(self, message: dict, idempotency_key: str | None = None):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise ConnectionError('fake resend: send failed')
+        self.sent += 1
+        return {'id': str(uuid.uuid4())}
+    
+    def send_batch(self, messages: list[dict], idempotency_key: str | None = None) -> list[str | None]:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        errors = [
+            'fake resend: rejected' if self.error_rate and self.random.random() < self.error_rate else None
+            for _ in messages
+        ]
+        self.sent += errors.count(None)
+        return errors
@@ -0,0 +1,10 @@
+-- Vorige snapshots in één query ophalen (Database.get_previous_snapshots)
+-- Idempotent: kan opnieuw uitgevoerd worden op een bestaande database.
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_customer_week ON weekly_snapshots(customer_id, week_end DESC);
+
+-- Meest recente snapshot per klant
+CREATE OR REPLACE VIEW latest_snapshots AS
+SELECT DISTINCT ON (customer_id) id, customer_id, week_start, week_end, raw_data
+FROM weekly_snapshots
+ORDER BY customer_id, week_end DESC, created_at DESC;
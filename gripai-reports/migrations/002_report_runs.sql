@@ -0,0 +1,20 @@
+-- Voortgang per klant per weekrun (RunLedger, voor --resume)
+-- Idempotent: kan opnieuw uitgevoerd worden op een bestaande database.
+
+CREATE TABLE IF NOT EXISTS report_runs (
+  customer_id UUID REFERENCES customers(id),
+  week_start DATE NOT NULL,
+  stages TEXT[] DEFAULT '{}',
+  weekly_data JSONB,
+  analysis TEXT,
+  batch_key TEXT,
+  snapshot_id UUID REFERENCES weekly_snapshots(id),
+  updated_at TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (customer_id, week_start)
+);
+
+-- Batch sleutel per klant (batch mode), voor tabellen van vóór deze kolom
+ALTER TABLE report_runs ADD COLUMN IF NOT EXISTS batch_key TEXT;
+
+-- Opgeslagen snapshot per klant, zodat --resume hem hergebruikt
+ALTER TABLE report_runs ADD COLUMN IF NOT EXISTS snapshot_id UUID REFERENCES weekly_snapshots(id);
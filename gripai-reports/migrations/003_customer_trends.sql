@@ -0,0 +1,10 @@
+-- Trend state en 4/13/52-weeks aggregaten per klant (bijgewerkt bij elke snapshot)
+-- Idempotent: kan opnieuw uitgevoerd worden op een bestaande database.
+
+CREATE TABLE IF NOT EXISTS customer_trends (
+  customer_id UUID PRIMARY KEY REFERENCES customers(id),
+  last_week DATE,
+  state JSONB,
+  aggregates JSONB,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
@@ -0,0 +1,4 @@
+-- Herkomst van de analyse per rapport: 'claude', 'cache', 'rules', 'fallback' of 'stale'
+-- Idempotent: kan opnieuw uitgevoerd worden op een bestaande database.
+
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS analysis_source TEXT;
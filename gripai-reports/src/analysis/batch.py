@@ -0,0 +1,203 @@
+"""
+GripAI - Batch analyse via de Anthropic Message Batches API
+Voor de wekelijkse run: alle prompts in één batch insturen, pollen tot de
+batch klaar is en de resultaten terugkoppelen aan de klanten.
+"""
+
+import asyncio
+import itertools
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable
+
+
+from analysis.weekly_report import WeeklyReportAnalyzer
+from services.metrics import get_metrics
+
+
+class BatchReportAnalyzer:
+    """Analyseert weekdata van veel klanten tegelijk via Message Batches."""
+    
+    # Message Batches API staat max 100.000 requests per batch toe, maar ook
+    # max 256 MB per batch. Met prompts tot een paar tientallen KB per klant
+    # blijft een chunk van 10.000 ruim onder die grootte
+    MAX_BATCH_SIZE = 10_000
+    
+    def __init__(
+        self,
+        analyzer: WeeklyReportAnalyzer | None = None,
+        client=None,
+        poll_interval: float | None = None,
+        max_wait: float | None = None
+    ):
+        """
+        Args:
+            analyzer: Analyzer voor prompt, system prompt en model
+            client: Anthropic async client of LocalBatchClient (default AsyncAnthropic)
+            poll_interval: Seconden tussen status checks (default env BATCH_POLL_INTERVAL of 30)
+            max_wait: Max seconden wachten op een batch (default env BATCH_MAX_WAIT of 3600)
+        """
+        self.analyzer = analyzer or WeeklyReportAnalyzer()
+        if client is None:
+            from anthropic import AsyncAnthropic
+            client = AsyncAnthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = client
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv('BATCH_POLL_INTERVAL', '30'))
+        self.max_wait = max_wait or float(os.getenv('BATCH_MAX_WAIT', '3600'))
+        # Herkomst per custom_id: 'rules', 'cache' of 'claude'
+        self.sources: dict[str, str] = {}
+    
+    async def analyze_many(self, items: list[dict]) -> dict[str, str]:
+        """
+        Genereer analyses voor meerdere klanten in batches.
+        
+        Args:
+            items: Dicts met custom_id (bijv. customer id), company_name,
+                   current_week, previous_week, week_start, week_end en
+                   optioneel trends en customer_id (voor de fallback analyse)
+        
+        Returns:
+            Dict van custom_id naar analyse tekst. Requests die in de batch
+            faalden ontbreken; de caller kan die los opnieuw proberen.
+            Rustige weken worden via de regels afgehandeld (zie self.sources).
+        """
+        analyses = {}
+        pending = []
+        for item in items:
+            quiet = self.analyzer.analyze_quiet_week(
+                item['company_name'], item['current_week'], item['previous_week'],
+                item['week_start'], item['week_end']
+            )
+            if quiet is not None:
+                self.analyzer.record_rules_hit()
+                analyses[item['custom_id']] = quiet
+                self.sources[item['custom_id']] = 'rules'
+                continue
+            
+            prompt = self.analyzer._build_prompt(
+                company_name=item['company_name'],
+                current=item['current_week'],
+                previous=item['previous_week'],
+                week_start=item['week_start'],
+                week_end=item['week_end'],
+                trends=item.get('trends')
+            )
+            key = self.analyzer.cache_key(prompt)
+            cached = self.analyzer.get_cached(key)
+            if cached is not None:
+                self.analyzer.record_cache_hit()
+                analyses[item['custom_id']] = cached
+                self.sources[item['custom_id']] = 'cache'
+            else:
+                pending.append((item['custom_id'], prompt, key, item.get('customer_id')))
+        
+        for start in range(0, len(pending), self.MAX_BATCH_SIZE):
+            chunk = pending[start:start + self.MAX_BATCH_SIZE]
+            analyses.update(await self._run_batch(chunk))
+        return analyses
+    
+    async def _run_batch(self, pending: list[tuple[str, str, str, str | None]]) -> dict[str, str]:
+        system = self.analyzer._get_system_blocks()
+        keys = {custom_id: key for custom_id, _, key, _ in pending}
+        customer_ids = {custom_id: customer_id for custom_id, _, _, customer_id in pending}
+        requests = [
+            {
+                'custom_id': custom_id,
+                'params': {
+                    'model': self.analyzer.model,
+                    'max_tokens': 1500,
+                    'system': system,
+                    'messages': [
+                        {'role': 'user', 'content': prompt}
+                    ]
+                }
+            }
+            for custom_id, prompt, _, _ in pending
+        ]
+        
+        async with get_metrics().timed('request', service='claude', op='batch'):
+            batch = await self.client.messages.batches.create(requests=requests)
+            print(f"  📦 Submitted analysis batch {batch.id} ({len(requests)} requests)")
+            
+            deadline = time.monotonic() + self.max_wait
+            while batch.processing_status != 'ended':
+                if time.monotonic() > deadline:
+                    await self.client.messages.batches.cancel(batch.id)
+                    raise TimeoutError(f"Batch {batch.id} not finished after {self.max_wait:g}s")
+                await asyncio.sleep(self.poll_interval)
+                batch = await self.client.messages.batches.retrieve(batch.id)
+        
+        analyses = {}
+        failed = 0
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == 'succeeded':
+                analysis = entry.result.message.content[0].text
+                analyses[entry.custom_id] = analysis
+                self.sources[entry.custom_id] = 'claude'
+                self.analyzer._record_usage(getattr(entry.result.message, 'usage', None), 0.0, op='batch')
+                if self.analyzer.cache:
+                    self.analyzer.cache.set(keys[entry.custom_id], analysis)
+                    if customer_ids[entry.custom_id]:
+                        self.analyzer.cache.set_latest(customer_ids[entry.custom_id], analysis)
+            else:
+                failed += 1
+        
+        if failed:
+            print(f"  ⚠️  {failed} request(s) in batch {batch.id} failed")
+        return analyses
+
+
+class LocalBatchClient:
+    """
+    Lokale stand-in voor client.messages.batches, voor tests en offline runs.
+    
+    Verwerkt requests direct met een responder functie (params -> tekst).
+    Een responder die een exception gooit levert een 'errored' resultaat op.
+    """
+    
+    def __init__(self, responder: Callable[[dict], str] | None = None, polls_until_done: int = 1):
+        self.responder = responder or (lambda params: f"Analyse: {params['messages'][0]['content'][:40]}")
+        self.polls_until_done = polls_until_done
+        self.batches: dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self.messages = SimpleNamespace(batches=self)
+    
+    async def create(self, requests: list[dict]):
+        batch_id = f"msgbatch_local_{next(self._ids)}"
+        self.batches[batch_id] = {'requests': requests, 'polls': 0, 'status': 'in_progress'}
+        return self._batch(batch_id)
+    
+    async def retrieve(self, batch_id: str):
+        batch = self.batches[batch_id]
+        batch['polls'] += 1
+        if batch['polls'] >= self.polls_until_done and batch['status'] == 'in_progress':
+            batch['status'] = 'ended'
+        return self._batch(batch_id)
+    
+    async def cancel(self, batch_id: str):
+        self.batches[batch_id]['status'] = 'canceling'
+        return self._batch(batch_id)
+    
+    async def results(self, batch_id: str):
+        return self._results(self.batches[batch_id]['requests'])
+    
+    async def _results(self, requests: list[dict]):
+        for request in requests:
+            try:
+                text = self.responder(request['params'])
+                result = SimpleNamespace(
+                    type='succeeded',
+                    message=SimpleNamespace(content=[SimpleNamespace(type='text', text=text)])
+                )
+            except Exception as e:
+                result = SimpleNamespace(type='errored', error=str(e))
+            yield SimpleNamespace(custom_id=request['custom_id'], result=result)
+    
+    def _batch(self, batch_id: str):
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status=self.batches[batch_id]['status'],
+            created_at=datetime.now()
+        )
@@ -0,0 +1,113 @@
+"""
+GripAI - Content-addressed cache voor AI analyses
+Dezelfde model + system prompt + prompt geeft dezelfde sleutel, zodat een
+herhaalde run (na een crash of mislukte email) geen tweede Claude call doet.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+
+class AnalysisCache:
+    """SQLite cache van analyses met TTL en LRU eviction op aantal entries."""
+    
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        latest_ttl: float | None = None
+    ):
+        """
+        Args:
+            path: SQLite bestand (default env ANALYSIS_CACHE_PATH of .cache/analysis.sqlite)
+            ttl: Geldigheid in seconden (default env ANALYSIS_CACHE_TTL of 7 dagen)
+            max_entries: Max aantal entries (default env ANALYSIS_CACHE_MAX_ENTRIES of 10000)
+            latest_ttl: Max leeftijd van de laatste analyse per klant als fallback
+                        (default env ANALYSIS_LATEST_TTL of 35 dagen)
+        """
+        self.path = Path(path or os.getenv('ANALYSIS_CACHE_PATH', '.cache/analysis.sqlite'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl or float(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+        self.max_entries = max_entries or int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '10000'))
+        self.latest_ttl = latest_ttl or float(os.getenv('ANALYSIS_LATEST_TTL', str(35 * 24 * 3600)))
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " key TEXT PRIMARY KEY,"
+            " analysis TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_used ON analyses(used_at)")
+        # Laatste analyse per klant (customer id), los van de prompt: fallback als Claude te traag is
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS customer_latest ("
+            " customer_id TEXT PRIMARY KEY,"
+            " analysis TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+    
+    @staticmethod
+    def make_key(model: str, system: str, prompt: str) -> str:
+        """Sleutel = sha256 over model, system prompt en user prompt."""
+        digest = hashlib.sha256()
+        for part in (model, system, prompt):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> str | None:
+        """Return de analyse als die bestaat en niet verlopen is."""
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT analysis, created_at FROM analyses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        analysis, created_at = row
+        with self.conn:
+            if now - created_at > self.ttl:
+                self.conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+                return None
+            self.conn.execute("UPDATE analyses SET used_at = ? WHERE key = ?", (now, key))
+        return analysis
+    
+    def set(self, key: str, analysis: str):
+        """Sla een analyse op en verwijder de minst recent gebruikte entries boven max_entries."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, analysis, created_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, analysis, now, now)
+            )
+            self.conn.execute("DELETE FROM analyses WHERE created_at < ?", (now - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM analyses WHERE key IN ("
+                " SELECT key FROM analyses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+    
+    def get_latest(self, customer_id: str) -> str | None:
+        """Return de laatst opgeslagen analyse van een klant, als niet te oud."""
+        row = self.conn.execute(
+            "SELECT analysis, created_at FROM customer_latest WHERE customer_id = ?", (customer_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.latest_ttl:
+            return None
+        return row[0]
+    
+    def set_latest(self, customer_id: str, analysis: str):
+        """Bewaar analyse als de laatste van een klant."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO customer_latest (customer_id, analysis, created_at) VALUES (?, ?, ?)",
+                (customer_id, analysis, time.time())
+            )
+    
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,102 @@
+"""
+GripAI - Regelgebaseerde analyse voor rustige weken
+Vergelijkt de week met de vorige snapshot. Als er niets noemenswaardigs
+veranderd is (omzet, kosten en openstaand binnen de drempels, weinig nieuwe
+facturen, niets verlopen) wordt de samenvatting uit vaste Nederlandse zinnen
+opgebouwd en is er geen Claude call nodig.
+"""
+
+import os
+from datetime import datetime
+
+from services.rendering import format_euro
+
+
+class QuietWeekRules:
+    """Herkent rustige weken en schrijft daar zelf de analyse voor."""
+    
+    def __init__(
+        self,
+        max_change: float | None = None,
+        min_amount: float | None = None,
+        max_invoices: int | None = None,
+        max_overdue: float | None = None
+    ):
+        """
+        Args:
+            max_change: Max relatieve verandering t.o.v. vorige week (default env QUIET_MAX_CHANGE of 0.10)
+            min_amount: Verschillen tot dit bedrag tellen altijd als gelijk (default env QUIET_MIN_AMOUNT of 250)
+            max_invoices: Max verzonden facturen in een rustige week (default env QUIET_MAX_INVOICES of 2)
+            max_overdue: Max verlopen bedrag (default env QUIET_MAX_OVERDUE of 0)
+        """
+        self.max_change = max_change if max_change is not None else float(os.getenv('QUIET_MAX_CHANGE', '0.10'))
+        self.min_amount = min_amount if min_amount is not None else float(os.getenv('QUIET_MIN_AMOUNT', '250'))
+        self.max_invoices = max_invoices if max_invoices is not None else int(os.getenv('QUIET_MAX_INVOICES', '2'))
+        self.max_overdue = max_overdue if max_overdue is not None else float(os.getenv('QUIET_MAX_OVERDUE', '0'))
+    
+    def changes(self, current: dict, previous: dict | None) -> list[str]:
+        """
+        Wat deze week de drempels overschrijdt.
+        
+        Returns:
+            Lege lijst als de week rustig is; anders een korte reden per afwijking.
+        """
+        if not previous:
+            return ['geen vorige week']
+        
+        reasons = []
+        for field, label in (('revenue', 'omzet'), ('costs', 'kosten'), ('outstanding_total', 'openstaand')):
+            if not self._similar(current.get(field, 0), previous.get(field, 0)):
+                reasons.append(label)
+        if current.get('invoices_sent', 0) > self.max_invoices:
+            reasons.append('facturen')
+        if current.get('outstanding_overdue', 0) > self.max_overdue:
+            reasons.append('verlopen')
+        return reasons
+    
+    def analyze(
+        self,
+        company_name: str,
+        current: dict,
+        previous: dict | None,
+        week_start: datetime,
+        week_end: datetime
+    ) -> str | None:
+        """Analyse tekst voor een rustige week; None als de week Claude nodig heeft."""
+        if self.changes(current, previous):
+            return None
+        
+        revenue, previous_revenue = current.get('revenue', 0), previous.get('revenue', 0)
+        sent, paid = current.get('invoices_sent', 0), current.get('invoices_paid', 0)
+        outstanding = current.get('outstanding_total', 0)
+        
+        paragraphs = [
+            f"Een rustige week voor {company_name}. De omzet kwam uit op {format_euro(revenue)}, "
+            f"{self._compare(revenue, previous_revenue)} vorige week ({format_euro(previous_revenue)}). "
+            f"Er {'is' if sent == 1 else 'zijn'} {sent} {'factuur' if sent == 1 else 'facturen'} verzonden "
+            f"en {paid} betaald.",
+            
+            f"De kosten bedroegen {format_euro(current.get('costs', 0))} en de winst "
+            f"{format_euro(current.get('profit', 0))}. Er staat {format_euro(outstanding)} open, "
+            f"{'waarvan niets verlopen' if not current.get('outstanding_overdue') else 'met een klein verlopen deel'}."
+        ]
+        
+        if outstanding:
+            advice = "Houd de openstaande facturen in de gaten, zodat ze op tijd betaald worden."
+        else:
+            advice = "Er staat niets open; een goed moment om na te gaan of er nog werk gefactureerd kan worden."
+        if sent == 0:
+            advice += " Er zijn deze week geen facturen verstuurd: controleer of dat klopt met het geleverde werk."
+        paragraphs.append(f"Aanbeveling: {advice}")
+        
+        return '\n\n'.join(paragraphs)
+    
+    def _similar(self, current: float, previous: float) -> bool:
+        return abs(current - previous) <= max(self.min_amount, self.max_change * abs(previous))
+    
+    @staticmethod
+    def _compare(current: float, previous: float) -> str:
+        if abs(current - previous) < 0.005:
+            return "gelijk aan"
+        return "iets hoger dan" if current > previous else "iets lager dan"
+
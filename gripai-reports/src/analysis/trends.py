@@ -0,0 +1,119 @@
+"""
+GripAI - Trends over de snapshot historie
+Per klant een doorlopende tijdreeks van de numerieke snapshot kolommen, met
+rolling 4-, 13- en 52-weeks gemiddelde, trend (helling per week) en
+volatiliteit. Elke nieuwe week past de sommen per venster in O(1) aan, zodat
+de analyse meer context krijgt zonder elke run de historie te lezen.
+"""
+
+import math
+
+
+WINDOWS = (4, 13, 52)
+
+# Snapshot kolommen; bedragen in centen zodat de lopende sommen exact blijven
+METRICS = {
+    'revenue': 100,
+    'costs': 100,
+    'invoices_sent': 1,
+    'invoices_paid': 1,
+    'outstanding_amount': 100
+}
+
+
+class TrendState:
+    """
+    Laatste 52 waarden per kolom plus per venster de sommen (n, Σy, Σy², Σxy),
+    met x = 0..n-1 de positie in het venster (oudste eerst).
+    """
+    
+    def __init__(self, week: str | None = None, values: dict | None = None, sums: dict | None = None):
+        self.week = week
+        self.values: dict[str, list[int]] = values or {metric: [] for metric in METRICS}
+        self.sums: dict[str, dict[str, list[int]]] = sums or {
+            metric: {str(window): [0, 0, 0, 0] for window in WINDOWS} for metric in METRICS
+        }
+    
+    @classmethod
+    def from_dict(cls, data: dict | None) -> 'TrendState':
+        if not data:
+            return cls()
+        return cls(data.get('week'), data.get('values'), data.get('sums'))
+    
+    def to_dict(self) -> dict:
+        return {'week': self.week, 'values': self.values, 'sums': self.sums}
+    
+    def update(self, week: str, row: dict) -> bool:
+        """
+        Voeg de snapshot van een week toe (row met de METRICS kolommen).
+        
+        Dezelfde week nogmaals vervangt de laatste waarde (rerun). Een week
+        van vóór de laatste wordt niet verwerkt.
+        
+        Returns:
+            False als de week ouder is dan de laatst verwerkte week.
+        """
+        if self.week is not None and week < self.week:
+            return False
+        replace = week == self.week
+        
+        for metric, scale in METRICS.items():
+            y = round(float(row.get(metric) or 0) * scale)
+            values = self.values[metric]
+            for window in WINDOWS:
+                sums = self.sums[metric][str(window)]
+                if replace:
+                    _replace_last(sums, values[-1], y)
+                else:
+                    _append(sums, values, window, y)
+            if replace:
+                values[-1] = y
+            else:
+                values.append(y)
+                if len(values) > WINDOWS[-1]:
+                    del values[0]
+        
+        self.week = week
+        return True
+    
+    def aggregates(self) -> dict:
+        """Per kolom en venster: weken, gemiddelde, trend per week en volatiliteit (standaarddeviatie)."""
+        result = {}
+        for metric, scale in METRICS.items():
+            result[metric] = {}
+            for window in WINDOWS:
+                n, s, ss, sxy = self.sums[metric][str(window)]
+                if not n:
+                    continue
+                result[metric][str(window)] = {
+                    'weeks': n,
+                    'mean': s / n / scale,
+                    'trend': _slope(n, s, sxy) / scale,
+                    'volatility': math.sqrt(max(0, n * ss - s * s)) / n / scale
+                }
+        return result
+
+
+def _append(sums: list[int], values: list[int], window: int, y: int):
+    """Schuif het venster één week op met nieuwe waarde y."""
+    n, s, ss, sxy = sums
+    if n < window:
+        sums[:] = [n + 1, s + y, ss + y * y, sxy + n * y]
+        return
+    # Oudste valt eruit (x=0), de rest schuift een positie op, y komt op x=window-1
+    oldest = values[-window]
+    sums[:] = [n, s - oldest + y, ss - oldest * oldest + y * y, sxy - (s - oldest) + (window - 1) * y]
+
+
+def _replace_last(sums: list[int], old: int, y: int):
+    n, s, ss, sxy = sums
+    sums[:] = [n, s - old + y, ss - old * old + y * y, sxy + (n - 1) * (y - old)]
+
+
+def _slope(n: int, s: int, sxy: int) -> float:
+    """Kleinste kwadraten helling met x = 0..n-1."""
+    if n < 2:
+        return 0.0
+    sx = n * (n - 1) // 2
+    sxx = (n - 1) * n * (2 * n - 1) // 6
+    return (n * sxy - sx * s) / (n * sxx - sx * sx)
@@ -2,17 +2,83 @@
 GripAI - Weekly Report Analysis using Claude Sonnet
 """
 
+import asyncio
 import os
+import time
 from datetime import datetime
-from anthropic import Anthropic
+
+from analysis.cache import AnalysisCache
+from analysis.rules import QuietWeekRules
+from analysis.trends import WINDOWS
+from services.limits import StageDeadlines
+from services.metrics import get_metrics
+
+
+USAGE_FIELDS = (
+    'input_tokens',
+    'output_tokens',
+    'cache_creation_input_tokens',
+    'cache_read_input_tokens'
+)
+
+# (snapshot kolom, label, bedrag) voor de trend sectie van de prompt
+TREND_LABELS = (
+    ('revenue', 'Omzet', True),
+    ('costs', 'Kosten', True),
+    ('invoices_sent', 'Facturen verzonden', False),
+    ('invoices_paid', 'Facturen betaald', False),
+    ('outstanding_amount', 'Openstaand', True)
+)
 
 
 class WeeklyReportAnalyzer:
     """Analyseert weekdata met Claude Sonnet."""
     
-    def __init__(self):
-        self.client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        cache: AnalysisCache | None = None,
+        refresh: bool = False,
+        client=None,
+        rules: QuietWeekRules | None = None,
+        deadlines: StageDeadlines | None = None,
+        fallback_model: str | None = None
+    ):
+        """
+        Args:
+            concurrency: Max gelijktijdige Claude calls als de aanroeper geen slot
+                         meegeeft (default env LLM_CONCURRENCY of 4)
+            cache: Analyse cache (default AnalysisCache, tenzij ANALYSIS_CACHE=0)
+            refresh: Negeer bestaande cache entries en genereer opnieuw
+            client: Anthropic async client of een lokale stand-in (default AsyncAnthropic)
+            rules: Fast path voor rustige weken (default QuietWeekRules, tenzij RULES_FAST_PATH=0)
+            deadlines: Deadlines voor de analyse en het fallback model (default StageDeadlines uit env)
+            fallback_model: Sneller model na een gemiste deadline
+                            (default env LLM_FALLBACK_MODEL of claude-3-5-haiku-20241022; leeg = uit)
+        """
+        if client is None:
+            # Lazy: de anthropic SDK is de traagste import van de service
+            from anthropic import AsyncAnthropic
+            client = AsyncAnthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = client
         self.model = "claude-sonnet-4-20250514"
+        if fallback_model is None:
+            fallback_model = os.getenv('LLM_FALLBACK_MODEL', 'claude-3-5-haiku-20241022')
+        self.fallback_model = fallback_model or None
+        self.deadlines = deadlines or StageDeadlines()
+        self.limiter = asyncio.Semaphore(concurrency or int(os.getenv('LLM_CONCURRENCY', '4')))
+        if cache is None and os.getenv('ANALYSIS_CACHE', '1').lower() not in ('0', 'false', 'no'):
+            cache = AnalysisCache()
+        self.cache = cache
+        self.refresh = refresh
+        if rules is None and os.getenv('RULES_FAST_PATH', '1').lower() not in ('0', 'false', 'no'):
+            rules = QuietWeekRules()
+        self.rules = rules
+        # Cumulatief token gebruik over alle calls van deze analyzer
+        self.usage = {
+            'calls': 0, 'cache_hits': 0, 'rules': 0, 'fallbacks': 0, 'stale': 0, 'seconds': 0.0,
+            **{field: 0 for field in USAGE_FIELDS}
+        }
     
     async def analyze(
         self,
@@ -20,14 +86,64 @@ class WeeklyReportAnalyzer:
         current_week: dict,
         previous_week: dict | None,
         week_start: datetime,
-        week_end: datetime
+        week_end: datetime,
+        trends: dict | None = None,
+        slot: asyncio.Semaphore | None = None,
+        customer_id: str | None = None
     ) -> str:
         """
         Genereer AI analyse van weekdata.
         
+        Args:
+            trends: Optionele trend aggregaten van de klant (Database.get_trends)
+            slot: Semaphore voor de Claude call (bv. StageLimits.llm); vervangt
+                  de eigen limiet van de analyzer, alleen vastgehouden
+                  tijdens de Claude call
+            customer_id: Klant id; de analyse wordt per klant bewaard als
+                         fallback voor een volgende gemiste deadline
+        
         Returns:
             Geformatteerde analyse tekst in het Nederlands.
         """
+        analysis, _ = await self.analyze_with_usage(
+            company_name=company_name,
+            current_week=current_week,
+            previous_week=previous_week,
+            week_start=week_start,
+            week_end=week_end,
+            trends=trends,
+            slot=slot,
+            customer_id=customer_id
+        )
+        return analysis
+    
+    async def analyze_with_usage(
+        self,
+        company_name: str,
+        current_week: dict,
+        previous_week: dict | None,
+        week_start: datetime,
+        week_end: datetime,
+        trends: dict | None = None,
+        slot: asyncio.Semaphore | None = None,
+        customer_id: str | None = None
+    ) -> tuple[str, dict]:
+        """
+        Als analyze, maar geeft ook het token gebruik van deze call terug.
+        
+        Returns:
+            Tuple van (analyse tekst, usage dict met input/output/cache tokens,
+            seconds en source: 'rules', 'cache', 'claude', 'fallback' of 'stale')
+        
+        Raises:
+            TimeoutError: als ook het fallback model te laat is en er geen
+                eerdere analyse van de klant (customer_id) bewaard is.
+        """
+        
+        # Rustige week: vaste tekst, geen Claude call
+        analysis = self.analyze_quiet_week(company_name, current_week, previous_week, week_start, week_end)
+        if analysis is not None:
+            return analysis, self.record_rules_hit()
         
         # Bouw context voor Claude
         prompt = self._build_prompt(
@@ -35,20 +151,134 @@ class WeeklyReportAnalyzer:
             current=current_week,
             previous=previous_week,
             week_start=week_start,
-            week_end=week_end
+            week_end=week_end,
+            trends=trends
         )
         
-        # Roep Claude aan
-        response = self.client.messages.create(
-            model=self.model,
+        # Zelfde prompt al eerder geanalyseerd?
+        key = self.cache_key(prompt)
+        cached = self.get_cached(key)
+        if cached is not None:
+            return cached, self.record_cache_hit()
+        
+        # Roep Claude aan (deadline telt pas vanaf een vrij slot)
+        async with slot or self.limiter:
+            try:
+                started = time.monotonic()
+                async with get_metrics().timed('request', service='claude', op='messages'):
+                    response = await self.deadlines.run('analyze', self._stream(self.model, prompt))
+                elapsed = time.monotonic() - started
+            except TimeoutError as e:
+                print(f"  ⏱️  {company_name}: {e}, falling back")
+                return await self._fallback(company_name, prompt, customer_id)
+        
+        usage = {**self._record_usage(response.usage, elapsed), 'source': 'claude'}
+        analysis = response.content[0].text
+        if self.cache:
+            self.cache.set(key, analysis)
+            if customer_id:
+                self.cache.set_latest(customer_id, analysis)
+        return analysis, usage
+    
+    async def _stream(self, model: str, prompt: str):
+        """
+        Claude call als stream; return het complete bericht.
+        
+        Bij een deadline wordt de stream geannuleerd en de verbinding direct
+        gesloten, in plaats van te wachten op een response die niet meer nodig is.
+        """
+        async with self.client.messages.stream(
+            model=model,
             max_tokens=1500,
             messages=[
                 {"role": "user", "content": prompt}
             ],
-            system=self._get_system_prompt()
-        )
+            system=self._get_system_blocks()
+        ) as stream:
+            return await stream.get_final_message()
+    
+    async def _fallback(self, company_name: str, prompt: str, customer_id: str | None) -> tuple[str, dict]:
+        """Na een gemiste deadline: het fallback model, anders de laatste analyse van de klant."""
+        metrics = get_metrics()
+        if self.fallback_model:
+            try:
+                started = time.monotonic()
+                async with metrics.timed('request', service='claude', op='fallback'):
+                    response = await self.deadlines.run('fallback', self._stream(self.fallback_model, prompt))
+                self.usage['fallbacks'] += 1
+                metrics.inc('analyses', source='fallback')
+                usage = self._record_usage(response.usage, time.monotonic() - started, op='fallback')
+                # Niet onder de cache sleutel van het primaire model bewaren
+                return response.content[0].text, {**usage, 'source': 'fallback'}
+            except Exception as e:
+                print(f"  ⚠️  Fallback model failed for {company_name}: {e}")
+        
+        previous = self.cache.get_latest(customer_id) if self.cache and customer_id else None
+        if previous is None:
+            raise TimeoutError(f"No analysis for {company_name} within the deadline")
+        self.usage['stale'] += 1
+        metrics.inc('analyses', source='stale')
+        return previous, {'cached': True, 'source': 'stale', 'seconds': 0.0, **{field: 0 for field in USAGE_FIELDS}}
+    
+    def cache_key(self, prompt: str) -> str:
+        """Cache sleutel voor een user prompt met dit model en deze system prompt."""
+        return AnalysisCache.make_key(self.model, self._get_system_prompt(), prompt)
+    
+    def get_cached(self, key: str) -> str | None:
+        """Return een gecachte analyse, tenzij cache uit staat of refresh gevraagd is."""
+        if self.cache is None or self.refresh:
+            return None
+        return self.cache.get(key)
+    
+    def record_cache_hit(self) -> dict:
+        """Tel een cache hit; return usage zonder tokens."""
+        self.usage['cache_hits'] += 1
+        get_metrics().inc('llm_cache_hits')
+        return {'cached': True, 'source': 'cache', 'seconds': 0.0, **{field: 0 for field in USAGE_FIELDS}}
+    
+    def analyze_quiet_week(
+        self,
+        company_name: str,
+        current_week: dict,
+        previous_week: dict | None,
+        week_start: datetime,
+        week_end: datetime
+    ) -> str | None:
+        """Analyse via de regels als de week rustig is; None als Claude nodig is."""
+        if self.rules is None or self.refresh:
+            return None
+        return self.rules.analyze(company_name, current_week, previous_week, week_start, week_end)
+    
+    def record_rules_hit(self) -> dict:
+        """Tel een analyse via de regels; return usage zonder tokens."""
+        self.usage['rules'] += 1
+        get_metrics().inc('analyses', source='rules')
+        return {'cached': False, 'source': 'rules', 'seconds': 0.0, **{field: 0 for field in USAGE_FIELDS}}
+    
+    def _record_usage(self, response_usage, elapsed: float, op: str = 'messages') -> dict:
+        """Tel token gebruik van één response op bij het totaal (op: 'messages' of 'batch')."""
+        usage = {field: getattr(response_usage, field, 0) or 0 for field in USAGE_FIELDS}
+        usage['seconds'] = elapsed
+        
+        self.usage['calls'] += 1
+        for field, value in usage.items():
+            self.usage[field] += value
         
-        return response.content[0].text
+        metrics = get_metrics()
+        metrics.inc('requests', service='claude', op=op)
+        for field in USAGE_FIELDS:
+            metrics.inc('llm_tokens', usage[field], type=field.removesuffix('_tokens'))
+        return usage
+    
+    def _get_system_blocks(self) -> list[dict]:
+        """System prompt als content block met cache marker; is gelijk voor elke klant."""
+        return [
+            {
+                "type": "text",
+                "text": self._get_system_prompt(),
+                "cache_control": {"type": "ephemeral"}
+            }
+        ]
     
     def _get_system_prompt(self) -> str:
         return """Je bent een financieel analist voor MKB-bedrijven in Nederland. 
@@ -65,14 +295,15 @@ Structureer met korte paragrafen, geen bullet points in de hoofdtekst.
 Eindig altijd met 1-2 concrete aanbevelingen.
 
 Houd de analyse beknopt: maximaal 250 woorden."""
-
+    
     def _build_prompt(
         self,
         company_name: str,
         current: dict,
         previous: dict | None,
         week_start: datetime,
-        week_end: datetime
+        week_end: datetime,
+        trends: dict | None = None
     ) -> str:
         
         week_str = f"{week_start.strftime('%d %b')} - {week_end.strftime('%d %b %Y')}"
@@ -89,7 +320,7 @@ DEZE WEEK:
 - Openstaand totaal: EUR {current.get('outstanding_total', 0):,.2f}
 - Waarvan verlopen: EUR {current.get('outstanding_overdue', 0):,.2f}
 """
-
+        
         if current.get('top_customers'):
             prompt += "\nTop klanten deze week:\n"
             for c in current['top_customers'][:3]:
@@ -110,4 +341,39 @@ VORIGE WEEK:
 
 Bereken en benoem de week-over-week veranderingen."""
         
+        if trends and (section := self._build_trends(trends)):
+            prompt += ('' if prompt.endswith('\n') else '\n') + section
+        
         return prompt
+    
+    def _build_trends(self, trends: dict) -> str:
+        """Trend sectie: per kolom gemiddelde, trend per week en spreiding over 4/13/52 weken."""
+        lines = []
+        for metric, label, money in TREND_LABELS:
+            fmt = (lambda v: f"EUR {v:,.0f}") if money else (lambda v: f"{v:,.1f}")
+            windows = trends.get(metric) or {}
+            longest = windows.get(str(WINDOWS[-1]))
+            # Altijd nul (bv. geen kosten gekoppeld): niets te melden
+            if not longest or not (longest['mean'] or longest['volatility']):
+                continue
+            cells = []
+            weeks = 1
+            for window in WINDOWS:
+                agg = windows.get(str(window))
+                # Korte historie: grotere vensters zijn gelijk aan het vorige
+                if not agg or agg['weeks'] <= weeks:
+                    continue
+                weeks = agg['weeks']
+                cells.append(
+                    f"{agg['weeks']}w gem. {fmt(agg['mean'])}, trend {'+' if agg['trend'] >= 0 else '-'}"
+                    f"{fmt(abs(agg['trend']))}/week, spreiding {fmt(agg['volatility'])}"
+                )
+            if cells:
+                lines.append(f"- {label}: " + ' | '.join(cells))
+        
+        if not lines:
+            return ''
+        return (
+            "\nTRENDS (laatste 4, 13 en 52 weken):\n" + '\n'.join(lines) +
+            "\n\nPlaats deze week in het licht van de trend; noem alleen opvallende afwijkingen."
+        )
@@ -0,0 +1,73 @@
+"""
+GripAI - Gedeelde HTTP client voor connectors
+Eén pooled AsyncClient per run, zodat keep-alive verbindingen en TLS sessies
+hergebruikt worden over alle klanten.
+"""
+
+import os
+import httpx
+
+
+_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    """
+    Maak een pooled AsyncClient op basis van env configuratie.
+    
+    Args:
+        transport: Optionele transport, bv. een lokale fake voor benchmarks
+    
+    Env:
+        HTTP_POOL_SIZE: Max open verbindingen (default 100)
+        HTTP_KEEPALIVE: Max idle keep-alive verbindingen (default 20)
+        HTTP_KEEPALIVE_EXPIRY: Seconden dat een idle verbinding open blijft (default 30)
+        HTTP_TIMEOUT: Read/write/pool timeout in seconden (default 30)
+        HTTP_CONNECT_TIMEOUT: Connect timeout in seconden (default 10)
+        HTTP_HTTP2: '1' om HTTP/2 te gebruiken (vereist httpx[http2])
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('HTTP_POOL_SIZE', '100')),
+        max_keepalive_connections=int(os.getenv('HTTP_KEEPALIVE', '20')),
+        keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv('HTTP_TIMEOUT', '30')),
+        connect=float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+    )
+    http2 = os.getenv('HTTP_HTTP2', '').lower() in ('1', 'true', 'yes')
+    if http2 and not _http2_available():
+        print("  ⚠️  HTTP_HTTP2 set but h2 not installed, falling back to HTTP/1.1")
+        http2 = False
+    
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, transport=transport)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return de gedeelde client; maakt hem aan bij eerste gebruik."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+def set_http_client(client: httpx.AsyncClient):
+    """Vervang de gedeelde client (bv. door een client met een lokale transport)."""
+    global _client
+    _client = client
+
+
+async def close_http_client():
+    """Sluit de gedeelde client aan het eind van een run."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,179 @@
+"""
+GripAI - Conditional request cache voor connector GETs
+Response bodies worden op schijf bewaard met hun ETag/Last-Modified, per
+namespace (bijv. 'moneybird/<admin_id>') en URL. Een volgende GET stuurt
+If-None-Match/If-Modified-Since mee; bij een 304 komt de body uit de cache.
+Los van een specifieke connector, zodat Exact of SnelStart hem ook kunnen
+gebruiken.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import httpx
+
+from services.metrics import get_metrics
+
+
+# Headers die met de body bewaard worden (Link voor paginering)
+STORED_HEADERS = ('content-type', 'link', 'etag', 'last-modified')
+
+
+class HttpCache:
+    """SQLite cache van GET responses met validators en LRU eviction op totale grootte."""
+    
+    def __init__(self, path: str | None = None, max_bytes: int | None = None):
+        """
+        Args:
+            path: SQLite bestand (default env HTTP_CACHE_PATH of .cache/http.sqlite)
+            max_bytes: Max totale grootte van de bodies (default env HTTP_CACHE_MAX_MB of 256 MB)
+        """
+        self.path = Path(path or os.getenv('HTTP_CACHE_PATH', '.cache/http.sqlite'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or int(float(os.getenv('HTTP_CACHE_MAX_MB', '256')) * 1024 * 1024)
+        # Meerdere processen (--processes) delen het bestand
+        self.conn = sqlite3.connect(self.path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " namespace TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " headers TEXT NOT NULL,"
+            " body BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " used_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, url))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_used ON responses(used_at)")
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # hits: 304 uit cache; misses: geen entry; changed: entry maar nieuwe body
+        self.stats = {'hits': 0, 'misses': 0, 'changed': 0, 'stored': 0, 'evicted': 0, 'bytes_saved': 0}
+        if self.size > self.max_bytes:
+            # Bv. na het verlagen van HTTP_CACHE_MAX_MB
+            with self.conn:
+                self._evict()
+    
+    async def get(
+        self,
+        namespace: str,
+        url: httpx.URL,
+        send: Callable[[dict], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Conditional GET.
+        
+        Args:
+            namespace: Scheiding per connector en administratie, bijv. 'moneybird/<admin_id>'
+            url: Volledige URL inclusief query parameters
+            send: Coroutine (extra headers) -> response die de request echt uitvoert
+        
+        Returns:
+            De response; bij een 304 een 200 met de gecachte body en headers.
+        """
+        key = str(url)
+        entry = self._lookup(namespace, key)
+        headers = {}
+        if entry:
+            etag, last_modified = entry[0], entry[1]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        
+        response = await send(headers)
+        metrics = get_metrics()
+        
+        if response.status_code == 304 and entry:
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += len(entry[3])
+            metrics.inc('http_cache', namespace=namespace.split('/')[0], result='hit')
+            self._touch(namespace, key)
+            return httpx.Response(
+                200, headers=json.loads(entry[2]), content=entry[3], request=response.request
+            )
+        
+        result = 'changed' if entry else 'miss'
+        self.stats['changed' if entry else 'misses'] += 1
+        metrics.inc('http_cache', namespace=namespace.split('/')[0], result=result)
+        if response.status_code == 200 and ('etag' in response.headers or 'last-modified' in response.headers):
+            self._store(namespace, key, response)
+        return response
+    
+    def _lookup(self, namespace: str, url: str) -> tuple | None:
+        return self.conn.execute(
+            "SELECT etag, last_modified, headers, body FROM responses WHERE namespace = ? AND url = ?",
+            (namespace, url)
+        ).fetchone()
+    
+    def _touch(self, namespace: str, url: str):
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE responses SET used_at = ? WHERE namespace = ? AND url = ?",
+                    (time.time(), namespace, url)
+                )
+        except sqlite3.OperationalError:
+            pass  # Bestand bezet door een ander proces; volgorde van LRU is niet kritisch
+    
+    def _store(self, namespace: str, url: str, response: httpx.Response):
+        body = response.content
+        headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+        try:
+            with self.conn:
+                previous = self.conn.execute(
+                    "SELECT size FROM responses WHERE namespace = ? AND url = ?", (namespace, url)
+                ).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses"
+                    " (namespace, url, etag, last_modified, headers, body, size, used_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (namespace, url, response.headers.get('etag'), response.headers.get('last-modified'),
+                     json.dumps(headers), body, len(body), time.time())
+                )
+                self.size += len(body) - (previous[0] if previous else 0)
+                self.stats['stored'] += 1
+                if self.size > self.max_bytes:
+                    self._evict()
+        except sqlite3.OperationalError as e:
+            print(f"  ⚠️  HTTP cache write failed: {e}")
+    
+    def _evict(self):
+        """Verwijder de minst recent gebruikte entries tot 90% van max_bytes."""
+        # Andere processen schrijven ook: begin bij de echte grootte
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        evict = []
+        for namespace, url, size in self.conn.execute(
+            "SELECT namespace, url, size FROM responses ORDER BY used_at"
+        ):
+            if self.size <= target:
+                break
+            evict.append((namespace, url))
+            self.size -= size
+        self.conn.executemany("DELETE FROM responses WHERE namespace = ? AND url = ?", evict)
+        self.stats['evicted'] += len(evict)
+    
+    def close(self):
+        self.conn.close()
+
+
+_cache: HttpCache | None = None
+
+
+def get_http_cache() -> HttpCache | None:
+    """Return de gedeelde cache; None als HTTP_CACHE=0."""
+    global _cache
+    if _cache is None and os.getenv('HTTP_CACHE', '1').lower() not in ('0', 'false', 'no'):
+        _cache = HttpCache()
+    return _cache
+
+
+def http_cache_stats() -> dict:
+    """Tellers van de gedeelde cache, of leeg als hij (nog) niet gebruikt is."""
+    return dict(_cache.stats) if _cache else {}
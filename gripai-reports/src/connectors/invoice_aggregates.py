@@ -0,0 +1,119 @@
+"""
+GripAI - Aggregatie van factuurdata
+Per pagina worden de benodigde velden eerst in kolommen (array) gezet, met
+bedragen als integer centen. Totalen, ouderdom en top-K worden daarna over
+die kolommen berekend in plaats van met float optellingen per factuur.
+
+Centen: round(float(bedrag) * 100) is exact voor bedragen met twee decimalen.
+"""
+
+import heapq
+from array import array
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+
+# (max dagen verlopen, label) voor de ouderdomsbuckets van verlopen facturen
+OVERDUE_BUCKETS = ((30, '1-30'), (60, '31-60'), (90, '61-90'), (None, '90+'))
+
+
+@lru_cache(maxsize=4096)
+def _ordinal(day: str) -> int:
+    """'YYYY-MM-DD' naar dagnummer; veel facturen delen dezelfde vervaldatum."""
+    return date.fromisoformat(day).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def week_key(day: str) -> str:
+    """Maandag van de ISO week van 'YYYY-MM-DD' (of een ISO timestamp), als 'YYYY-MM-DD'."""
+    value = date.fromisoformat(day[:10])
+    return (value - timedelta(days=value.weekday())).isoformat()
+
+
+class InvoiceTotals:
+    """Omzet, aantal facturen en omzet per klant over pagina's sales_invoices."""
+    
+    def __init__(self):
+        self.revenue = 0
+        self.count = 0
+        self.by_customer: dict[str, int] = {}
+    
+    def add(self, page: list[dict]):
+        cents = array('q', [round(float(inv.get('total_price_incl_tax', 0)) * 100) for inv in page])
+        self.revenue += sum(cents)
+        self.count += len(cents)
+        
+        by_customer = self.by_customer
+        for inv, amount in zip(page, cents):
+            contact = inv.get('contact', {})
+            name = contact.get('company_name') or contact.get('firstname', 'Onbekend')
+            by_customer[name] = by_customer.get(name, 0) + amount
+    
+    def top_customers(self, limit: int) -> list[dict]:
+        """Grootste klanten op omzet; bij gelijke omzet de eerst geziene."""
+        return [
+            {'name': name, 'revenue': amount / 100}
+            for name, amount in heapq.nlargest(limit, self.by_customer.items(), key=lambda item: item[1])
+        ]
+
+
+class OutstandingTotals:
+    """Openstaand en verlopen totaal plus de grootste verlopen facturen."""
+    
+    def __init__(self, now: datetime, limit: int):
+        """
+        Args:
+            now: Peilmoment voor de ouderdom
+            limit: Aantal grootste verlopen facturen om te bewaren
+        """
+        self.today = now.toordinal()
+        self.limit = limit
+        self.outstanding = 0
+        self.overdue = 0
+        self.buckets = [0] * len(OVERDUE_BUCKETS)
+        self.seen = 0
+        # (centen, volgnummer, dagen verlopen, factuur) van kandidaten voor de top
+        self._candidates: list[tuple] = []
+    
+    def add(self, page: list[dict]):
+        cents = array('q', [round(float(inv.get('total_unpaid', 0)) * 100) for inv in page])
+        # Dagen verlopen; zonder vervaldatum 0 (telt niet als verlopen)
+        days = array('l', [
+            self.today - _ordinal(due) if (due := inv.get('due_date')) else 0
+            for inv in page
+        ])
+        self.outstanding += sum(cents)
+        
+        overdue = [i for i, age in enumerate(days) if age > 0]
+        self.overdue += sum(cents[i] for i in overdue)
+        for i in overdue:
+            for bucket, (limit, _) in enumerate(OVERDUE_BUCKETS):
+                if limit is None or days[i] <= limit:
+                    self.buckets[bucket] += cents[i]
+                    break
+        
+        # Alleen de grootste van deze pagina kunnen in de totale top komen
+        for i in heapq.nlargest(self.limit, overdue, key=cents.__getitem__):
+            self._candidates.append((cents[i], self.seen + i, days[i], page[i]))
+        if len(self._candidates) > 4 * self.limit:
+            self._candidates = self._top()
+        self.seen += len(page)
+    
+    def overdue_buckets(self) -> dict[str, float]:
+        """Verlopen bedrag per ouderdom in dagen ('1-30', '31-60', '61-90', '90+')."""
+        return {label: cents / 100 for (_, label), cents in zip(OVERDUE_BUCKETS, self.buckets)}
+    
+    def top_overdue(self) -> list[dict]:
+        """Grootste verlopen facturen op bedrag; bij gelijk bedrag de eerst geziene."""
+        return [
+            {
+                'customer': inv.get('contact', {}).get('company_name', 'Onbekend'),
+                'amount': amount / 100,
+                'days_overdue': age,
+                'invoice_id': inv.get('invoice_id')
+            }
+            for amount, _, age, inv in self._top()
+        ]
+    
+    def _top(self) -> list[tuple]:
+        return heapq.nlargest(self.limit, self._candidates, key=lambda c: (c[0], -c[1]))
@@ -0,0 +1,74 @@
+"""
+GripAI - Lokale factuur-cache voor incrementele sync
+Bewaart per administratie de laatst bekende versie van elke factuur, zodat
+alleen gewijzigde facturen opnieuw opgehaald hoeven te worden.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+class InvoiceStore:
+    """SQLite store met facturen (id, versie, volledige JSON) voor één administratie."""
+    
+    # SQLite staat max 999 host parameters per query toe
+    _CHUNK = 500
+    
+    def __init__(self, system: str, admin_id: str, directory: str | None = None):
+        """
+        Args:
+            system: Naam van het boekhoudsysteem (bijv. 'moneybird')
+            admin_id: Administratie ID
+            directory: Map voor de store (default env INVOICE_STORE_DIR of .cache/invoices)
+        """
+        directory = Path(directory or os.getenv('INVOICE_STORE_DIR', '.cache/invoices'))
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{system}_{admin_id}.sqlite"
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS invoices ("
+            " id TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+    
+    def versions(self, ids: Iterable[str]) -> dict[str, int]:
+        """Return de bekende versie per id (alleen ids die in de store staan)."""
+        result = {}
+        for chunk in self._chunks(list(ids)):
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT id, version FROM invoices WHERE id IN ({placeholders})", chunk
+            )
+            result.update(rows)
+        return result
+    
+    def upsert(self, invoices: list[dict]):
+        """Sla (nieuwe versies van) facturen op."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO invoices (id, version, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET version = excluded.version, data = excluded.data",
+                [(str(inv['id']), int(inv.get('version', 0)), json.dumps(inv)) for inv in invoices]
+            )
+    
+    def iter_pages(self, ids: list[str], page_size: int = 100) -> Iterator[list[dict]]:
+        """Yield de opgeslagen facturen voor ids in pagina's van page_size."""
+        for start in range(0, len(ids), page_size):
+            chunk = ids[start:start + page_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = dict(self.conn.execute(
+                f"SELECT id, data FROM invoices WHERE id IN ({placeholders})", chunk
+            ))
+            # Zelfde volgorde als de API, zodat tie-breaks gelijk blijven
+            yield [json.loads(rows[inv_id]) for inv_id in chunk if inv_id in rows]
+    
+    def close(self):
+        self.conn.close()
+    
+    def _chunks(self, ids: list[str]) -> Iterator[list[str]]:
+        for start in range(0, len(ids), self._CHUNK):
+            yield ids[start:start + self._CHUNK]
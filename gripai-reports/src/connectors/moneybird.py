@@ -3,142 +3,391 @@ GripAI - Moneybird Connector
 Haalt financiële data op uit Moneybird boekhouding.
 """
 
+import asyncio
+import bisect
 import httpx
-from datetime import datetime
-from typing import Optional
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from connectors.http import get_http_client
+from connectors.http_cache import HttpCache, get_http_cache
+from connectors.invoice_aggregates import InvoiceTotals, OutstandingTotals, week_key
+from connectors.invoice_store import InvoiceStore
+from connectors.scheduler import RequestScheduler, get_scheduler
+from connectors.webhook_store import WebhookStore, get_webhook_store
+from services.metrics import get_metrics
 
 
 class MoneybirdConnector:
     """Connector voor Moneybird boekhoudsysteem."""
     
     BASE_URL = "https://moneybird.com/api/v2"
+    PER_PAGE = 100
+    OVERDUE_LIMIT = 5
+    TOP_CUSTOMERS = 5
+    SYNC_BATCH = 100  # Max ids per synchronization POST
+    WEBHOOK_EVENTS = ['sales_invoice', 'payment']
     
-    def __init__(self, admin_id: str, token: str):
+    def __init__(
+        self,
+        admin_id: str,
+        token: str,
+        client: Optional[httpx.AsyncClient] = None,
+        incremental: Optional[bool] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        http_cache: Optional[HttpCache] = None,
+        webhook_store: Optional[WebhookStore] = None
+    ):
         """
         Initialize Moneybird connector.
         
         Args:
             admin_id: Moneybird administratie ID
             token: API access token
+            client: Optionele HTTP client; default de gedeelde pooled client
+            incremental: Sync facturen via lokale store (default env MONEYBIRD_INCREMENTAL)
+            scheduler: Optionele request scheduler; default de gedeelde scheduler
+            http_cache: Cache voor conditional GETs; default de gedeelde cache (uit met HTTP_CACHE=0)
+            webhook_store: Weektotalen uit webhooks; default de gedeelde store (uit met WEBHOOKS=0)
         """
         self.admin_id = admin_id
         self.token = token
+        self._client = client
+        if incremental is None:
+            incremental = os.getenv('MONEYBIRD_INCREMENTAL', '').lower() in ('1', 'true', 'yes')
+        self.incremental = incremental
+        self.scheduler = scheduler or get_scheduler()
+        self.http_cache = http_cache or get_http_cache()
+        self.webhook_store = webhook_store or get_webhook_store()
         self.headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
     
+    @classmethod
+    def from_credentials(cls, credentials: dict) -> 'MoneybirdConnector':
+        """Connector uit customers.accounting_credentials (admin_id en token)."""
+        return cls(admin_id=credentials.get('admin_id'), token=credentials.get('token'))
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client voor deze connector (default: gedeelde pool)."""
+        return self._client or get_http_client()
+    
+    async def _request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Request via de scheduler (rate limit per token, retries bij 429/5xx).
+        
+        GETs gaan via de HTTP cache: ongewijzigde pagina's komen terug als 304
+        en worden uit de cache aangevuld.
+        """
+        if method != 'GET' or self.http_cache is None:
+            return await self._send(client, method, url, **kwargs)
+        
+        full_url = httpx.URL(url)
+        params = kwargs.pop('params', None)
+        if params:
+            full_url = full_url.copy_merge_params(params)
+        return await self.http_cache.get(
+            f"moneybird/{self.admin_id}", full_url,
+            lambda headers: self._send(client, method, full_url, extra_headers=headers, **kwargs)
+        )
+    
+    async def _send(self, client: httpx.AsyncClient, method: str, url, extra_headers: dict | None = None, **kwargs) -> httpx.Response:
+        metrics = get_metrics()
+        headers = {**self.headers, **extra_headers} if extra_headers else self.headers
+        async with metrics.timed('request', service='moneybird', op=method):
+            response = await self.scheduler.request(
+                client, method, url, credential=self.token, headers=headers, **kwargs
+            )
+        metrics.inc('requests', service='moneybird', status=response.status_code)
+        metrics.inc('bytes', len(response.request.content), service='moneybird', direction='out')
+        metrics.inc('bytes', len(response.content), service='moneybird', direction='in')
+        return response
+    
     async def get_weekly_data(self, week_start: datetime, week_end: datetime) -> dict:
         """
         Haal alle relevante data op voor een week.
         
+        Elke endpoint wordt pagina voor pagina verwerkt in lopende totalen,
+        zodat geheugengebruik niet groeit met het aantal facturen. Als de
+        administratie de hele week via webhooks bijgehouden is, komen de
+        totalen uit de WebhookStore en is er geen API call nodig.
+        
         Returns:
             Dict met omzet, kosten, facturen, etc.
         """
-        async with httpx.AsyncClient() as client:
-            # Parallel ophalen van verschillende endpoints
-            invoices = await self._get_invoices(client, week_start, week_end)
-            payments = await self._get_payments(client, week_start, week_end)
+        now = datetime.now()
+        if self.webhook_store is not None:
+            data = self.webhook_store.weekly_data(
+                'moneybird', self.admin_id, week_start, now, self.TOP_CUSTOMERS, self.OVERDUE_LIMIT
+            )
+            if data is not None:
+                get_metrics().inc('weekly_data', system='moneybird', source='webhooks')
+                return data
+        get_metrics().inc('weekly_data', system='moneybird', source='poll')
+        
+        client = self.client
+        store = None
+        
+        if self.incremental:
+            # Alleen gewijzigde facturen ophalen, metrics uit de lokale store
+            store = InvoiceStore('moneybird', self.admin_id)
+            period_ids, open_ids = await self._sync_sales_invoices(client, store, week_start, week_end)
+            invoice_pages = self._store_pages(store, period_ids)
+            outstanding_pages = self._store_pages(store, open_ids)
+        else:
+            invoice_pages = self._get_invoices(client, week_start, week_end)
+            outstanding_pages = self._get_outstanding_invoices(client)
+        
+        try:
+            # Parallel ophalen en verwerken van verschillende endpoints
+            invoices, invoices_paid, outstanding = await asyncio.gather(
+                self._fold_invoices(invoice_pages),
+                self._fold_payments(self._get_payments(client, week_start, week_end)),
+                self._fold_outstanding(outstanding_pages, now)
+            )
             # expenses = await self._get_expenses(client, week_start, week_end)
+        finally:
+            if store:
+                store.close()
+        
+        return self._weekly_result(invoices, invoices_paid, outstanding)
+    
+    async def get_history(self, start: datetime, end: datetime) -> dict[str, dict]:
+        """
+        Haal weekdata op voor alle weken van start t/m end, met één fetch per endpoint.
+        
+        Facturen worden op factuurdatum en betalingen op boekingsdatum per
+        ISO week ingedeeld, net als de period filter van get_weekly_data.
+        Openstaand per week zijn de facturen die op de zondag van die week nog
+        niet betaald waren, met ouderdom ten opzichte van die zondag. Facturen
+        van vóór start die binnen de periode betaald zijn tellen daarin niet mee.
+        
+        Returns:
+            Dict van maandag ('YYYY-MM-DD') naar weekdata zoals get_weekly_data.
+        """
+        client = self.client
+        mondays = []
+        monday = start - timedelta(days=start.weekday())
+        while monday <= end:
+            mondays.append(monday.strftime('%Y-%m-%d'))
+            monday += timedelta(days=7)
+        
+        invoices, invoices_paid, open_invoices = await asyncio.gather(
+            self._collect(self._get_invoices(client, start, end)),
+            self._fold_payment_weeks(self._get_payments(client, start, end)),
+            self._collect(self._get_outstanding_invoices(client))
+        )
+        
+        # Omzet per week
+        totals = {week: InvoiceTotals() for week in mondays}
+        by_week: dict[str, list] = {}
+        for inv in invoices:
+            if inv.get('invoice_date'):
+                by_week.setdefault(week_key(inv['invoice_date']), []).append(inv)
+        for week, rows in by_week.items():
+            if week in totals:
+                totals[week].add(rows)
+        
+        # Openstaand per week: uitgegeven vóór en niet betaald op de zondag van die week
+        sundays = {week: datetime.fromisoformat(week) + timedelta(days=6) for week in mondays}
+        sunday_days = [sunday.strftime('%Y-%m-%d') for sunday in sundays.values()]
+        open_by_week: list[list] = [[] for _ in mondays]
+        unique = {str(inv.get('id')): inv for inv in [*invoices, *open_invoices]}
+        for inv in unique.values():
+            if not inv.get('invoice_date'):
+                continue
+            issued = inv['invoice_date'][:10]
+            paid = (inv.get('paid_at') or '')[:10] or None
+            if paid:
+                # Toen nog het volledige bedrag open
+                inv = {**inv, 'total_unpaid': inv.get('total_price_incl_tax', 0)}
+            # Weken waarvan de zondag in [issued, paid) valt
+            first = bisect.bisect_left(sunday_days, issued)
+            last = bisect.bisect_left(sunday_days, paid) if paid else len(sunday_days)
+            for week in range(first, last):
+                open_by_week[week].append(inv)
+        
+        history = {}
+        for index, week in enumerate(mondays):
+            outstanding = OutstandingTotals(sundays[week], self.OVERDUE_LIMIT)
+            outstanding.add(open_by_week[index])
+            history[week] = self._weekly_result(totals[week], invoices_paid.get(week, 0), outstanding)
+        return history
+    
+    def _weekly_result(self, invoices: InvoiceTotals, invoices_paid: int, outstanding: OutstandingTotals) -> dict:
+        revenue = invoices.revenue / 100
+        return {
+            'revenue': revenue,
+            'costs': 0,  # TODO: expenses endpoint
+            'profit': revenue,  # Voorlopig zonder kosten
+            'invoices_sent': invoices.count,
+            'invoices_paid': invoices_paid,
+            'outstanding_total': outstanding.outstanding / 100,
+            'outstanding_overdue': outstanding.overdue / 100,
+            'overdue_buckets': outstanding.overdue_buckets(),
+            'top_customers': invoices.top_customers(self.TOP_CUSTOMERS),
+            'overdue_invoices': outstanding.top_overdue()
+        }
+    
+    async def _fold_invoices(self, pages: AsyncIterator[list]) -> InvoiceTotals:
+        """Omzet, aantal facturen en omzet per klant voor periode (in centen)."""
+        totals = InvoiceTotals()
+        async for page in pages:
+            totals.add(page)
+        return totals
+    
+    async def _fold_payments(self, pages: AsyncIterator[list]) -> int:
+        """Aantal betalingen in periode."""
+        invoices_paid = 0
+        async for page in pages:
+            invoices_paid += sum(1 for p in page if p.get('payment_date'))
+        return invoices_paid
+    
+    async def _fold_payment_weeks(self, pages: AsyncIterator[list]) -> dict[str, int]:
+        """Aantal betalingen per week (maandag als sleutel)."""
+        per_week = {}
+        async for page in pages:
+            for p in page:
+                if p.get('payment_date') and p.get('date'):
+                    week = week_key(p['date'])
+                    per_week[week] = per_week.get(week, 0) + 1
+        return per_week
+    
+    async def _collect(self, pages: AsyncIterator[list]) -> list[dict]:
+        rows = []
+        async for page in pages:
+            rows.extend(page)
+        return rows
+    
+    async def _fold_outstanding(self, pages: AsyncIterator[list], now: datetime) -> OutstandingTotals:
+        """Openstaand totaal, verlopen totaal en de grootste verlopen facturen (in centen)."""
+        totals = OutstandingTotals(now, self.OVERDUE_LIMIT)
+        async for page in pages:
+            totals.add(page)
+        return totals
+    
+    async def _paginate(self, client: httpx.AsyncClient, url: str, params: dict) -> AsyncIterator[list]:
+        """
+        Volg Moneybird paginering en yield elke pagina.
+        
+        Moneybird geeft de volgende pagina in de Link header (rel="next").
+        Zonder Link header wordt doorgeteld zolang pagina's vol zijn.
+        """
+        params = {**params, 'per_page': self.PER_PAGE, 'page': 1}
+        next_url = url
+        
+        while next_url:
+            response = await self._request(client, 'GET', next_url, params=params)
+            response.raise_for_status()
+            page = response.json()
+            if page:
+                yield page
             
-            # Bereken metrics
-            revenue = sum(float(inv.get('total_price_incl_tax', 0)) for inv in invoices)
-            invoices_paid = len([p for p in payments if p.get('payment_date')])
-            
-            # Haal openstaande facturen op
-            outstanding = await self._get_outstanding_invoices(client)
-            outstanding_total = sum(float(inv.get('total_unpaid', 0)) for inv in outstanding)
-            
-            # Bepaal verlopen facturen (> 30 dagen)
-            overdue = []
-            overdue_total = 0
-            for inv in outstanding:
-                due_date = inv.get('due_date')
-                if due_date:
-                    due = datetime.strptime(due_date, '%Y-%m-%d')
-                    days_overdue = (datetime.now() - due).days
-                    if days_overdue > 0:
-                        amount = float(inv.get('total_unpaid', 0))
-                        overdue_total += amount
-                        overdue.append({
-                            'customer': inv.get('contact', {}).get('company_name', 'Onbekend'),
-                            'amount': amount,
-                            'days_overdue': days_overdue,
-                            'invoice_id': inv.get('invoice_id')
-                        })
-            
-            # Sorteer overdue op bedrag
-            overdue.sort(key=lambda x: x['amount'], reverse=True)
-            
-            # Top klanten deze week
-            customer_revenue = {}
-            for inv in invoices:
-                contact = inv.get('contact', {})
-                name = contact.get('company_name') or contact.get('firstname', 'Onbekend')
-                amount = float(inv.get('total_price_incl_tax', 0))
-                customer_revenue[name] = customer_revenue.get(name, 0) + amount
-            
-            top_customers = [
-                {'name': name, 'revenue': rev}
-                for name, rev in sorted(customer_revenue.items(), key=lambda x: x[1], reverse=True)[:5]
-            ]
-            
-            return {
-                'revenue': revenue,
-                'costs': 0,  # TODO: expenses endpoint
-                'profit': revenue,  # Voorlopig zonder kosten
-                'invoices_sent': len(invoices),
-                'invoices_paid': invoices_paid,
-                'outstanding_total': outstanding_total,
-                'outstanding_overdue': overdue_total,
-                'top_customers': top_customers,
-                'overdue_invoices': overdue[:5]
-            }
-    
-    async def _get_invoices(self, client: httpx.AsyncClient, start: datetime, end: datetime) -> list:
-        """Haal facturen op voor periode."""
+            link = response.links.get('next', {}).get('url')
+            if link:
+                next_url, params = link, None
+            elif params is not None and len(page) >= self.PER_PAGE:
+                params = {**params, 'page': params['page'] + 1}
+            else:
+                next_url = None
+    
+    def _get_invoices(self, client: httpx.AsyncClient, start: datetime, end: datetime) -> AsyncIterator[list]:
+        """Haal facturen op voor periode, per pagina."""
         url = f"{self.BASE_URL}/{self.admin_id}/sales_invoices"
         params = {
-            'filter': f"period:{start.strftime('%Y%m%d')}..{end.strftime('%Y%m%d')}",
-            'per_page': 100
+            'filter': f"period:{start.strftime('%Y%m%d')}..{end.strftime('%Y%m%d')}"
         }
-        
-        response = await client.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self._paginate(client, url, params)
     
-    async def _get_payments(self, client: httpx.AsyncClient, start: datetime, end: datetime) -> list:
-        """Haal betalingen op voor periode."""
+    def _get_payments(self, client: httpx.AsyncClient, start: datetime, end: datetime) -> AsyncIterator[list]:
+        """Haal betalingen op voor periode, per pagina."""
         url = f"{self.BASE_URL}/{self.admin_id}/financial_mutations"
         params = {
-            'filter': f"period:{start.strftime('%Y%m%d')}..{end.strftime('%Y%m%d')}",
-            'per_page': 100
+            'filter': f"period:{start.strftime('%Y%m%d')}..{end.strftime('%Y%m%d')}"
         }
-        
-        response = await client.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self._paginate(client, url, params)
     
-    async def _get_outstanding_invoices(self, client: httpx.AsyncClient) -> list:
-        """Haal alle openstaande facturen op."""
+    def _get_outstanding_invoices(self, client: httpx.AsyncClient) -> AsyncIterator[list]:
+        """Haal alle openstaande facturen op, per pagina."""
         url = f"{self.BASE_URL}/{self.admin_id}/sales_invoices"
         params = {
-            'filter': 'state:open',
-            'per_page': 100
+            'filter': 'state:open'
         }
+        return self._paginate(client, url, params)
+    
+    async def _sync_sales_invoices(self, client: httpx.AsyncClient, store: InvoiceStore, start: datetime, end: datetime) -> tuple[list[str], list[str]]:
+        """
+        Synchroniseer facturen van de week en openstaande facturen met de store.
+        
+        De synchronization endpoint geeft alleen (id, version) terug; alleen
+        ids met een onbekende of nieuwere versie worden volledig opgehaald.
         
-        response = await client.get(url, headers=self.headers, params=params)
+        Returns:
+            Tuple van (factuur ids in periode, openstaande factuur ids)
+        """
+        url = f"{self.BASE_URL}/{self.admin_id}/sales_invoices/synchronization"
+        period_filter = f"period:{start.strftime('%Y%m%d')}..{end.strftime('%Y%m%d')}"
+        
+        period_versions, open_versions = await asyncio.gather(
+            self._get_versions(client, url, period_filter),
+            self._get_versions(client, url, 'state:open')
+        )
+        
+        remote = {**period_versions, **open_versions}
+        known = store.versions(remote)
+        stale = [inv_id for inv_id, version in remote.items() if known.get(inv_id) != version]
+        
+        for i in range(0, len(stale), self.SYNC_BATCH):
+            response = await self._request(client, 'POST', url, json={'ids': stale[i:i + self.SYNC_BATCH]})
+            response.raise_for_status()
+            store.upsert(response.json())
+        
+        return list(period_versions), list(open_versions)
+    
+    async def _get_versions(self, client: httpx.AsyncClient, url: str, filter: str) -> dict[str, int]:
+        """Haal (id, version) lijst op van de synchronization endpoint."""
+        response = await self._request(client, 'GET', url, params={'filter': filter})
         response.raise_for_status()
-        return response.json()
+        return {str(item['id']): item['version'] for item in response.json()}
+    
+    async def _store_pages(self, store: InvoiceStore, ids: list[str]) -> AsyncIterator[list]:
+        """Yield facturen uit de lokale store in pagina's, zoals _paginate."""
+        for page in store.iter_pages(ids, self.PER_PAGE):
+            if page:
+                yield page
+    
+    async def seed_webhooks(self, store: WebhookStore, url: str | None = None) -> int:
+        """
+        Bereid de administratie voor op webhooks: registreer (met url) de
+        webhook bij Moneybird en zet de huidige open facturen in de store.
+        
+        Returns:
+            Aantal open facturen.
+        """
+        client = self.client
+        if url:
+            response = await self._request(
+                client, 'POST', f"{self.BASE_URL}/{self.admin_id}/webhooks",
+                json={'url': url, 'enabled_events': self.WEBHOOK_EVENTS}
+            )
+            response.raise_for_status()
+            webhook = response.json()
+            store.register('moneybird', self.admin_id, str(webhook.get('id')), webhook.get('token'))
+        
+        open_invoices = await self._collect(self._get_outstanding_invoices(client))
+        store.seed('moneybird', self.admin_id, open_invoices)
+        return len(open_invoices)
     
     async def test_connection(self) -> bool:
         """Test of de API credentials werken."""
-        async with httpx.AsyncClient() as client:
-            url = f"{self.BASE_URL}/{self.admin_id}/contacts"
-            params = {'per_page': 1}
-            
-            try:
-                response = await client.get(url, headers=self.headers, params=params)
-                return response.status_code == 200
-            except Exception:
-                return False
+        url = f"{self.BASE_URL}/{self.admin_id}/contacts"
+        params = {'per_page': 1}
+        
+        try:
+            response = await self._request(self.client, 'GET', url, params=params)
+            return response.status_code == 200
+        except Exception:
+            return False
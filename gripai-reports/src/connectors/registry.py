@@ -0,0 +1,45 @@
+"""
+GripAI - Registry van boekhoudkoppelingen
+Per accounting_system het pad naar de connector class. De module wordt pas
+geïmporteerd bij de eerste klant met dat systeem, zodat een cold start (of
+een run zonder klanten op dat systeem) de imports niet betaalt.
+"""
+
+import importlib
+
+
+# accounting_system -> 'module:Class'; de class heeft from_credentials(credentials)
+CONNECTORS = {
+    'moneybird': 'connectors.moneybird:MoneybirdConnector',
+    # 'exact': 'connectors.exact:ExactConnector',
+    # 'snelstart': 'connectors.snelstart:SnelstartConnector',
+}
+
+_loaded: dict[str, type] = {}
+
+
+def register_connector(system: str, path: str):
+    """Registreer (of vervang) de connector voor een boekhoudsysteem."""
+    system = system.lower()
+    CONNECTORS[system] = path
+    _loaded.pop(system, None)
+
+
+def get_connector_class(system: str) -> type | None:
+    """Connector class voor een boekhoudsysteem, of None als het niet ondersteund wordt."""
+    system = system.lower()
+    if system not in _loaded:
+        path = CONNECTORS.get(system)
+        if path is None:
+            return None
+        module, _, name = path.partition(':')
+        _loaded[system] = getattr(importlib.import_module(module), name)
+    return _loaded[system]
+
+
+def create_connector(customer: dict):
+    """Connector voor het boekhoudsysteem van een klant; None als er geen is."""
+    connector_class = get_connector_class(customer.get('accounting_system') or '')
+    if connector_class is None:
+        return None
+    return connector_class.from_credentials(customer.get('accounting_credentials') or {})
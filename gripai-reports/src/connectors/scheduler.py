@@ -0,0 +1,216 @@
+"""
+GripAI - Request scheduler voor connectors
+Alle connector calls lopen hierdoor: token bucket per credential, Retry-After
+bij 429, jittered backoff bij tijdelijke fouten, een deadline per request en
+optioneel hedging: een tweede, identieke GET als de eerste te lang duurt.
+"""
+
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Idempotent: een dubbele request heeft geen bijwerkingen
+HEDGE_METHODS = {'GET', 'HEAD'}
+
+
+class TokenBucket:
+    """Token bucket voor één credential; kan gepauzeerd worden na een 429."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wacht tot er een token vrij is."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds: float):
+        """Geen nieuwe requests voor deze credential de komende seconden."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class RequestScheduler:
+    """Gedeelde scheduler voor connector HTTP calls."""
+    
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: float | None = None,
+        max_retries: int | None = None,
+        deadline: float | None = None,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        hedge_after: float | None = None
+    ):
+        """
+        Args:
+            rate: Requests per seconde per credential (default env API_RATE of 0.5,
+                  Moneybird staat 150 requests per 5 minuten toe)
+            burst: Bucket grootte (default env API_BURST of 150)
+            max_retries: Max pogingen na de eerste (default env API_MAX_RETRIES of 5)
+            deadline: Max seconden per request inclusief retries (default env API_DEADLINE of 120)
+            base_delay: Start backoff in seconden
+            max_delay: Max backoff in seconden
+            hedge_after: Start na zoveel seconden een tweede GET en gebruik het
+                         eerste antwoord (default env API_HEDGE_AFTER of 0 = uit)
+        """
+        self.rate = rate or float(os.getenv('API_RATE', '0.5'))
+        self.burst = burst or float(os.getenv('API_BURST', '150'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('API_MAX_RETRIES', '5'))
+        self.deadline = deadline or float(os.getenv('API_DEADLINE', '120'))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.getenv('API_HEDGE_AFTER', '0'))
+        self._buckets: dict[str, TokenBucket] = {}
+        # hedged: tweede request gestart; hedge_wins: de tweede was eerst klaar
+        self.stats = {'requests': 0, 'throttled': 0, 'retries': 0, 'failures': 0, 'hedged': 0, 'hedge_wins': 0}
+    
+    def bucket(self, credential: str) -> TokenBucket:
+        if credential not in self._buckets:
+            self._buckets[credential] = TokenBucket(self.rate, self.burst)
+        return self._buckets[credential]
+    
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, credential: str, **kwargs) -> httpx.Response:
+        """
+        Voer een request uit met rate limiting en retries.
+        
+        Returns:
+            De laatste response; de caller doet zelf raise_for_status().
+        
+        Raises:
+            TimeoutError: als de deadline verstrijkt voordat er een antwoord is.
+            httpx.TransportError: als ook de laatste poging een netwerkfout geeft.
+        """
+        bucket = self.bucket(credential)
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        send = self._hedged if self.hedge_after and method in HEDGE_METHODS else self._send
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stats['failures'] += 1
+                raise TimeoutError(f"Deadline of {self.deadline:g}s exceeded for {method} {url}")
+            
+            try:
+                response = await asyncio.wait_for(
+                    send(bucket, client, method, url, **kwargs), remaining
+                )
+            except asyncio.TimeoutError:
+                self.stats['failures'] += 1
+                raise TimeoutError(f"Deadline of {self.deadline:g}s exceeded for {method} {url}")
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self.stats['failures'] += 1
+                    raise
+                response = None
+            
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if response is not None and attempt >= self.max_retries:
+                self.stats['failures'] += 1
+                return response
+            
+            delay = self._backoff(attempt)
+            if response is not None and response.status_code == 429:
+                self.stats['throttled'] += 1
+                retry_after = self._retry_after(response)
+                if retry_after is not None:
+                    delay = retry_after
+                bucket.pause(delay)
+            
+            if time.monotonic() + delay > deadline:
+                self.stats['failures'] += 1
+                if response is not None:
+                    return response
+                raise TimeoutError(f"Deadline of {self.deadline:g}s exceeded for {method} {url}")
+            
+            attempt += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+    
+    async def _send(self, bucket: TokenBucket, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        await bucket.acquire()
+        self.stats['requests'] += 1
+        return await client.request(method, url, **kwargs)
+    
+    async def _hedged(self, bucket: TokenBucket, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Als _send, maar start na hedge_after seconden een tweede request.
+        
+        Het eerste geslaagde antwoord wint, de andere request wordt geannuleerd.
+        Faalt er één met een netwerkfout, dan wordt op de andere gewacht.
+        """
+        first = asyncio.ensure_future(self._send(bucket, client, method, url, **kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                self.stats['hedged'] += 1
+                tasks.append(asyncio.ensure_future(self._send(bucket, client, method, url, **kwargs)))
+            
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.stats['hedge_wins'] += 1
+                        return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def _backoff(self, attempt: int) -> float:
+        """Exponentiële backoff met full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    def _retry_after(self, response: httpx.Response) -> float | None:
+        """Parse Retry-After header (seconden of HTTP datum)."""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+_scheduler: RequestScheduler | None = None
+
+
+def get_scheduler() -> RequestScheduler:
+    """Return de gedeelde scheduler; maakt hem aan bij eerste gebruik."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler()
+    return _scheduler
@@ -0,0 +1,350 @@
+"""
+GripAI - Lopende weekaggregaten uit webhook events
+Elke factuur- of betalingsevent werkt de laatst bekende staat van de factuur
+bij en past de weektotalen (omzet, aantal facturen, betalingen, omzet per
+klant) aan met het verschil t.o.v. de vorige staat. Zo zijn events
+idempotent en mag dezelfde event opnieuw afgespeeld worden. Openstaand en
+verlopen worden bij het lezen uit de open facturen berekend, omdat de
+ouderdom van het peilmoment afhangt.
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+from connectors.invoice_aggregates import OutstandingTotals, week_key
+
+
+# Staten waarin een factuur niet (meer) openstaat
+CLOSED_STATES = ('draft', 'scheduled', 'paid', 'uncollectible')
+
+
+class WebhookStore:
+    """SQLite store met factuurstaat en weektotalen per administratie, gevuld door webhooks."""
+    
+    def __init__(self, path: str | None = None):
+        """
+        Args:
+            path: SQLite bestand (default env WEBHOOK_STORE_PATH of .cache/webhooks.sqlite)
+        """
+        self.path = Path(path or os.getenv('WEBHOOK_STORE_PATH', '.cache/webhooks.sqlite'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # De receiver schrijft, de weekrun (ook met --processes) leest
+        self.conn = sqlite3.connect(self.path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS webhooks ("
+            " system TEXT NOT NULL,"
+            " admin_id TEXT NOT NULL,"
+            " webhook_id TEXT,"
+            " token TEXT,"
+            " since REAL,"
+            " last_event_at REAL,"
+            " PRIMARY KEY (system, admin_id));"
+            "CREATE TABLE IF NOT EXISTS invoices ("
+            " system TEXT NOT NULL,"
+            " admin_id TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " state TEXT,"
+            " week TEXT,"
+            " customer TEXT NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " unpaid INTEGER NOT NULL,"
+            " due_date TEXT,"
+            " contact TEXT,"
+            " invoice_id TEXT,"
+            " PRIMARY KEY (system, admin_id, id));"
+            "CREATE INDEX IF NOT EXISTS idx_invoices_open ON invoices(system, admin_id, unpaid);"
+            "CREATE TABLE IF NOT EXISTS payments ("
+            " system TEXT NOT NULL,"
+            " admin_id TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " invoice_id TEXT,"
+            " week TEXT NOT NULL,"
+            " PRIMARY KEY (system, admin_id, id));"
+            "CREATE TABLE IF NOT EXISTS weeks ("
+            " system TEXT NOT NULL,"
+            " admin_id TEXT NOT NULL,"
+            " week TEXT NOT NULL,"
+            " revenue INTEGER NOT NULL DEFAULT 0,"
+            " invoices_sent INTEGER NOT NULL DEFAULT 0,"
+            " invoices_paid INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (system, admin_id, week));"
+            "CREATE TABLE IF NOT EXISTS week_customers ("
+            " system TEXT NOT NULL,"
+            " admin_id TEXT NOT NULL,"
+            " week TEXT NOT NULL,"
+            " customer TEXT NOT NULL,"
+            " revenue INTEGER NOT NULL,"
+            " PRIMARY KEY (system, admin_id, week, customer));"
+        )
+    
+    def register(self, system: str, admin_id: str, webhook_id: str | None, token: str | None):
+        """Leg de webhook (id en token voor verificatie) van een administratie vast."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO webhooks (system, admin_id, webhook_id, token) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(system, admin_id) DO UPDATE SET webhook_id = excluded.webhook_id, token = excluded.token",
+                (system, admin_id, webhook_id, token)
+            )
+    
+    def token(self, system: str, admin_id: str) -> str | None:
+        row = self.conn.execute(
+            "SELECT token FROM webhooks WHERE system = ? AND admin_id = ?", (system, admin_id)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def seed(self, system: str, admin_id: str, open_invoices: list[dict]):
+        """
+        Startpunt voor een administratie: de huidige open facturen.
+        
+        Facturen in de store die niet meer open zijn (gemist terwijl de
+        receiver niet draaide) tellen daarna niet meer als openstaand. De
+        eerste seed zet 'since': weken die daarna beginnen komen uit de store.
+        """
+        open_ids = {str(inv['id']) for inv in open_invoices}
+        with self.conn:
+            for inv in open_invoices:
+                self._apply_invoice(system, admin_id, inv)
+            stale = [
+                (system, admin_id, inv_id)
+                for (inv_id,) in self.conn.execute(
+                    "SELECT id FROM invoices WHERE system = ? AND admin_id = ? AND unpaid > 0",
+                    (system, admin_id)
+                )
+                if inv_id not in open_ids
+            ]
+            self.conn.executemany(
+                "UPDATE invoices SET unpaid = 0 WHERE system = ? AND admin_id = ? AND id = ?", stale
+            )
+            self.conn.execute(
+                "INSERT INTO webhooks (system, admin_id, since) VALUES (?, ?, ?) "
+                "ON CONFLICT(system, admin_id) DO UPDATE SET since = COALESCE(since, excluded.since)",
+                (system, admin_id, time.time())
+            )
+    
+    def apply_invoice(self, system: str, admin_id: str, invoice: dict) -> bool:
+        """
+        Verwerk de nieuwe staat van een factuur (inclusief zijn betalingen).
+        
+        Returns:
+            False als de store al een nieuwere versie had (event buiten volgorde).
+        """
+        with self.conn:
+            applied = self._apply_invoice(system, admin_id, invoice)
+            self._touch(system, admin_id)
+        return applied
+    
+    def remove_invoice(self, system: str, admin_id: str, invoice_id: str):
+        """Verwijderde factuur: haal zijn bijdrage en betalingen uit de weektotalen."""
+        with self.conn:
+            self._remove_invoice(system, admin_id, str(invoice_id))
+            self._touch(system, admin_id)
+    
+    def apply_payment(self, system: str, admin_id: str, payment: dict):
+        """Verwerk een losse betaling (id, invoice_id, payment_date)."""
+        with self.conn:
+            week = week_key(payment['payment_date']) if payment.get('payment_date') else None
+            self._set_payment(system, admin_id, str(payment['id']), payment.get('invoice_id'), week)
+            self._touch(system, admin_id)
+    
+    def remove_payment(self, system: str, admin_id: str, payment_id: str):
+        with self.conn:
+            self._set_payment(system, admin_id, str(payment_id), None, None)
+            self._touch(system, admin_id)
+    
+    def weekly_data(
+        self,
+        system: str,
+        admin_id: str,
+        week_start: datetime,
+        now: datetime,
+        top_customers: int,
+        overdue_limit: int
+    ) -> dict | None:
+        """
+        Weekdata zoals get_weekly_data van de connector, uit de store.
+        
+        Returns:
+            None als de administratie pas na het begin van de week geseed is
+            (of nooit): dan is de week niet compleet en moet er gepold worden.
+        """
+        row = self.conn.execute(
+            "SELECT since FROM webhooks WHERE system = ? AND admin_id = ?", (system, admin_id)
+        ).fetchone()
+        monday = datetime(week_start.year, week_start.month, week_start.day)
+        if not row or row[0] is None or row[0] > monday.timestamp():
+            return None
+        
+        week = monday.strftime('%Y-%m-%d')
+        totals = self.conn.execute(
+            "SELECT revenue, invoices_sent, invoices_paid FROM weeks WHERE system = ? AND admin_id = ? AND week = ?",
+            (system, admin_id, week)
+        ).fetchone() or (0, 0, 0)
+        top = self.conn.execute(
+            "SELECT customer, revenue FROM week_customers WHERE system = ? AND admin_id = ? AND week = ?"
+            " ORDER BY revenue DESC, customer LIMIT ?",
+            (system, admin_id, week, top_customers)
+        ).fetchall()
+        
+        outstanding = OutstandingTotals(now, overdue_limit)
+        placeholders = ','.join('?' * len(CLOSED_STATES))
+        outstanding.add([
+            {'total_unpaid': unpaid / 100, 'due_date': due_date, 'contact': {'company_name': contact}, 'invoice_id': invoice_id}
+            for unpaid, due_date, contact, invoice_id in self.conn.execute(
+                "SELECT unpaid, due_date, contact, invoice_id FROM invoices"
+                f" WHERE system = ? AND admin_id = ? AND unpaid > 0 AND COALESCE(state, '') NOT IN ({placeholders})"
+                " ORDER BY id",
+                (system, admin_id, *CLOSED_STATES)
+            )
+        ])
+        
+        revenue = totals[0] / 100
+        return {
+            'revenue': revenue,
+            'costs': 0,  # TODO: expenses endpoint
+            'profit': revenue,  # Voorlopig zonder kosten
+            'invoices_sent': totals[1],
+            'invoices_paid': totals[2],
+            'outstanding_total': outstanding.outstanding / 100,
+            'outstanding_overdue': outstanding.overdue / 100,
+            'overdue_buckets': outstanding.overdue_buckets(),
+            'top_customers': [{'name': name, 'revenue': cents / 100} for name, cents in top],
+            'overdue_invoices': outstanding.top_overdue()
+        }
+    
+    def close(self):
+        self.conn.close()
+    
+    def _apply_invoice(self, system: str, admin_id: str, invoice: dict) -> bool:
+        inv_id = str(invoice['id'])
+        version = int(invoice.get('version') or 0)
+        previous = self.conn.execute(
+            "SELECT version, week, customer, total FROM invoices WHERE system = ? AND admin_id = ? AND id = ?",
+            (system, admin_id, inv_id)
+        ).fetchone()
+        if previous and previous[0] > version:
+            return False
+        
+        contact = invoice.get('contact') or {}
+        customer = contact.get('company_name') or contact.get('firstname', 'Onbekend')
+        week = week_key(invoice['invoice_date']) if invoice.get('invoice_date') else None
+        total = round(float(invoice.get('total_price_incl_tax') or 0) * 100)
+        
+        # Oude bijdrage eraf, nieuwe erbij
+        if previous:
+            self._add_week(system, admin_id, previous[1], previous[2], -previous[3], -1)
+        self._add_week(system, admin_id, week, customer, total, 1)
+        
+        self.conn.execute(
+            "INSERT OR REPLACE INTO invoices"
+            " (system, admin_id, id, version, state, week, customer, total, unpaid, due_date, contact, invoice_id)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (system, admin_id, inv_id, version, invoice.get('state'), week, customer, total,
+             round(float(invoice.get('total_unpaid') or 0) * 100), invoice.get('due_date'),
+             contact.get('company_name', 'Onbekend'), invoice.get('invoice_id'))
+        )
+        
+        if 'payments' in invoice:
+            payments = {
+                str(p['id']): week_key(p['payment_date'])
+                for p in invoice['payments'] or [] if p.get('payment_date')
+            }
+            known = [
+                payment_id for (payment_id,) in self.conn.execute(
+                    "SELECT id FROM payments WHERE system = ? AND admin_id = ? AND invoice_id = ?",
+                    (system, admin_id, inv_id)
+                )
+            ]
+            for payment_id in known:
+                if payment_id not in payments:
+                    self._set_payment(system, admin_id, payment_id, None, None)
+            for payment_id, payment_week in payments.items():
+                self._set_payment(system, admin_id, payment_id, inv_id, payment_week)
+        return True
+    
+    def _remove_invoice(self, system: str, admin_id: str, inv_id: str):
+        previous = self.conn.execute(
+            "SELECT week, customer, total FROM invoices WHERE system = ? AND admin_id = ? AND id = ?",
+            (system, admin_id, inv_id)
+        ).fetchone()
+        if previous:
+            self._add_week(system, admin_id, previous[0], previous[1], -previous[2], -1)
+            self.conn.execute(
+                "DELETE FROM invoices WHERE system = ? AND admin_id = ? AND id = ?", (system, admin_id, inv_id)
+            )
+        for (payment_id,) in self.conn.execute(
+            "SELECT id FROM payments WHERE system = ? AND admin_id = ? AND invoice_id = ?",
+            (system, admin_id, inv_id)
+        ).fetchall():
+            self._set_payment(system, admin_id, payment_id, None, None)
+    
+    def _set_payment(self, system: str, admin_id: str, payment_id: str, invoice_id: str | None, week: str | None):
+        """Zet (of verwijder, met week None) een betaling en werk invoices_paid per week bij."""
+        previous = self.conn.execute(
+            "SELECT week FROM payments WHERE system = ? AND admin_id = ? AND id = ?",
+            (system, admin_id, payment_id)
+        ).fetchone()
+        if previous and previous[0] == week:
+            return
+        if previous:
+            self._add_paid(system, admin_id, previous[0], -1)
+            self.conn.execute(
+                "DELETE FROM payments WHERE system = ? AND admin_id = ? AND id = ?", (system, admin_id, payment_id)
+            )
+        if week:
+            self._add_paid(system, admin_id, week, 1)
+            self.conn.execute(
+                "INSERT INTO payments (system, admin_id, id, invoice_id, week) VALUES (?, ?, ?, ?, ?)",
+                (system, admin_id, payment_id, str(invoice_id) if invoice_id else None, week)
+            )
+    
+    def _add_week(self, system: str, admin_id: str, week: str | None, customer: str, cents: int, count: int):
+        if week is None:
+            return
+        self.conn.execute(
+            "INSERT INTO weeks (system, admin_id, week, revenue, invoices_sent) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(system, admin_id, week) DO UPDATE SET"
+            " revenue = revenue + excluded.revenue, invoices_sent = invoices_sent + excluded.invoices_sent",
+            (system, admin_id, week, cents, count)
+        )
+        self.conn.execute(
+            "INSERT INTO week_customers (system, admin_id, week, customer, revenue) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(system, admin_id, week, customer) DO UPDATE SET revenue = revenue + excluded.revenue",
+            (system, admin_id, week, customer, cents)
+        )
+        self.conn.execute(
+            "DELETE FROM week_customers WHERE system = ? AND admin_id = ? AND week = ? AND customer = ? AND revenue = 0",
+            (system, admin_id, week, customer)
+        )
+    
+    def _add_paid(self, system: str, admin_id: str, week: str, count: int):
+        self.conn.execute(
+            "INSERT INTO weeks (system, admin_id, week, invoices_paid) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(system, admin_id, week) DO UPDATE SET invoices_paid = invoices_paid + excluded.invoices_paid",
+            (system, admin_id, week, count)
+        )
+    
+    def _touch(self, system: str, admin_id: str):
+        self.conn.execute(
+            "UPDATE webhooks SET last_event_at = ? WHERE system = ? AND admin_id = ?",
+            (time.time(), system, admin_id)
+        )
+
+
+_store: WebhookStore | None = None
+
+
+def get_webhook_store() -> WebhookStore | None:
+    """
+    Return de gedeelde store voor de weekrun; None als WEBHOOKS=0 of als er
+    (nog) geen store is, zodat klanten zonder webhooks gewoon pollen.
+    """
+    global _store
+    if _store is None and os.getenv('WEBHOOKS', '1').lower() not in ('0', 'false', 'no'):
+        if Path(os.getenv('WEBHOOK_STORE_PATH', '.cache/webhooks.sqlite')).exists():
+            _store = WebhookStore()
+    return _store
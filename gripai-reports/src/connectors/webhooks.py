@@ -0,0 +1,193 @@
+"""
+GripAI - Webhook receiver voor boekhoudevents
+Kleine async HTTP server (alleen stdlib) die Moneybird factuur- en
+betalingsevents aanneemt en in de WebhookStore verwerkt. Events kunnen ook
+lokaal uit een JSONL bestand afgespeeld worden, bijv. om te testen of om
+een storing na te spelen.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import time
+
+from connectors.webhook_store import WebhookStore
+from services.metrics import get_metrics
+
+
+# Max grootte van een event; Moneybird stuurt één entity per request
+MAX_BODY = 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class MoneybirdWebhookHandler:
+    """Verwerkt Moneybird webhook payloads (SalesInvoice en Payment) in de store."""
+    
+    SYSTEM = 'moneybird'
+    
+    def __init__(self, store: WebhookStore):
+        self.store = store
+        self.stats = {'applied': 0, 'stale': 0, 'ignored': 0, 'rejected': 0}
+    
+    def handle(self, payload: dict, verify: bool = True) -> tuple[int, str]:
+        """
+        Verwerk één payload.
+        
+        Args:
+            verify: Controleer webhook_token tegen de geregistreerde webhook
+                    (uit bij lokaal afspelen)
+        
+        Returns:
+            Tuple van (HTTP status, resultaat: 'applied', 'stale', 'ignored' of een fout)
+        """
+        status, result = self._handle(payload, verify)
+        self.stats['rejected' if status != 200 else result] += 1
+        get_metrics().inc('webhook_events', system=self.SYSTEM, result=result if status == 200 else 'rejected')
+        return status, result
+    
+    def _handle(self, payload: dict, verify: bool) -> tuple[int, str]:
+        admin_id = str(payload.get('administration_id') or '')
+        if not admin_id:
+            return 400, 'missing administration_id'
+        if verify:
+            token = self.store.token(self.SYSTEM, admin_id)
+            if token is None or not hmac.compare_digest(token, str(payload.get('webhook_token') or '')):
+                return 401, 'invalid webhook_token'
+        
+        action = payload.get('action') or ''
+        entity_type = payload.get('entity_type')
+        entity = payload.get('entity') or {}
+        entity_id = payload.get('entity_id') or entity.get('id')
+        
+        if entity_type == 'SalesInvoice':
+            if action.endswith('_destroyed'):
+                self.store.remove_invoice(self.SYSTEM, admin_id, entity_id)
+                return 200, 'applied'
+            if not entity:
+                return 200, 'ignored'
+            applied = self.store.apply_invoice(self.SYSTEM, admin_id, {'id': entity_id, **entity})
+            return 200, 'applied' if applied else 'stale'
+        
+        if entity_type == 'Payment':
+            if action.endswith('_destroyed'):
+                self.store.remove_payment(self.SYSTEM, admin_id, entity_id)
+                return 200, 'applied'
+            if entity.get('invoice_type', 'SalesInvoice') != 'SalesInvoice':
+                return 200, 'ignored'  # Betaling van een inkoopfactuur
+            self.store.apply_payment(self.SYSTEM, admin_id, {'id': entity_id, **entity})
+            return 200, 'applied'
+        
+        # test_webhook en andere entities
+        return 200, 'ignored'
+
+
+class WebhookServer:
+    """Minimale HTTP/1.1 server: POST /webhooks/<systeem> en GET /health."""
+    
+    def __init__(self, handlers: dict[str, MoneybirdWebhookHandler], host: str | None = None, port: int | None = None):
+        """
+        Args:
+            handlers: Handler per systeem, bijv. {'moneybird': MoneybirdWebhookHandler(store)}
+            host: Adres (default env WEBHOOK_HOST of 0.0.0.0)
+            port: Poort (default env WEBHOOK_PORT, PORT of 8080; 0 = vrije poort)
+        """
+        self.handlers = handlers
+        self.host = host or os.getenv('WEBHOOK_HOST', '0.0.0.0')
+        self.port = port if port is not None else int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or '8080')
+        self.started = time.time()
+        self.server: asyncio.AbstractServer | None = None
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"🪝 Webhook receiver listening on {self.host}:{self.port}")
+    
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+    
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+    
+    def dispatch(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        """Routeer één request; return (status, JSON body)."""
+        path = path.split('?', 1)[0].rstrip('/')
+        if path == '/health':
+            return 200, {
+                'status': 'ok',
+                'uptime_seconds': round(time.time() - self.started),
+                'events': {system: handler.stats for system, handler in self.handlers.items()}
+            }
+        
+        system = path.removeprefix('/webhooks/')
+        handler = self.handlers.get(system) if path.startswith('/webhooks/') else None
+        if handler is None:
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'method not allowed'}
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'invalid JSON'}
+        if not isinstance(payload, dict):
+            return 400, {'error': 'expected a JSON object'}
+        status, result = handler.handle(payload)
+        return status, {'result': result}
+    
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, response = await asyncio.wait_for(self._read(reader), 30)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            status, response = 400, {'error': 'bad request'}
+        except Exception as e:
+            print(f"  ❌ Webhook failed: {e}")
+            status, response = 500, {'error': 'internal error'}
+        
+        body = json.dumps(response).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Internal Server Error')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    
+    async def _read(self, reader: asyncio.StreamReader) -> tuple[int, dict]:
+        method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY:
+            return 413, {'error': 'payload too large'}
+        body = await reader.readexactly(length) if length else b''
+        return self.dispatch(method, path, body)
+
+
+def replay_events(path: str, handler: MoneybirdWebhookHandler) -> dict:
+    """
+    Speel events uit een JSONL bestand (één webhook payload per regel) af
+    zonder token controle.
+    
+    Returns:
+        Aantal events per resultaat.
+    """
+    counts: dict[str, int] = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            _, result = handler.handle(json.loads(line), verify=False)
+            counts[result] = counts.get(result, 0) + 1
+    return counts
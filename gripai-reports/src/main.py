@@ -7,138 +7,783 @@ Draait elke vrijdag om 17:00 via Railway cron
 import argparse
 import asyncio
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from services.database import Database
+from services.database import Database, ReportWriter
+from services.ledger import RunLedger
 from services.email import EmailService
+from services.limits import StageLimits
+from services.metrics import get_metrics
+from services.sharding import merge_summaries, parse_shard, select_shard, split_shard
 from analysis.weekly_report import WeeklyReportAnalyzer
-from connectors.moneybird import MoneybirdConnector
+from analysis.batch import BatchReportAnalyzer
+from connectors.registry import create_connector
+from pipeline import ReportPipeline
 
+# Pogingen voor de laatste flush van snapshots en rapporten
+FLUSH_ATTEMPTS = 3
 
-async def generate_report_for_customer(customer: dict, db: Database, analyzer: WeeklyReportAnalyzer, email_service: EmailService):
-    """Genereer en verstuur weekrapport voor één klant."""
-    
-    print(f"📊 Generating report for {customer['company_name']}...")
-    
-    # 1. Bepaal week periode
+
+def get_week_period() -> tuple[datetime, datetime]:
+    """Return (maandag, zondag) van de afgelopen week."""
     today = datetime.now()
     week_end = today - timedelta(days=today.weekday() + 1)  # Afgelopen zondag
     week_start = week_end - timedelta(days=6)  # Maandag ervoor
-    
-    # 2. Haal data op uit boekhoudsysteem
+    return week_start, week_end
+
+
+async def fetch_weekly_data(customer: dict, week_start: datetime, week_end: datetime, limits: StageLimits) -> dict | None:
+    """Haal weekdata op uit het boekhoudsysteem van de klant; None bij een fout."""
     connector = get_connector(customer)
     if not connector:
         print(f"  ⚠️  No connector for {customer['accounting_system']}")
-        return False
+        return None
     
     try:
-        weekly_data = await connector.get_weekly_data(week_start, week_end)
+        async with limits.accounting:
+            return await limits.deadlines.run('fetch', connector.get_weekly_data(week_start, week_end))
     except Exception as e:
         print(f"  ❌ Failed to fetch data: {e}")
+        return None
+
+
+async def deliver_report(
+    customer: dict,
+    db: Database,
+    email_service: EmailService,
+    limits: StageLimits,
+    weekly_data: dict,
+    analysis: str,
+    week_start: datetime,
+    week_end: datetime,
+    snapshot_id: str | None = None,
+    writer: ReportWriter | None = None,
+    source: str | None = None
+) -> bool:
+    """Verstuur het rapport en log het in de database (source: herkomst van de analyse)."""
+    
+    # Genereer en verstuur email
+    async with limits.email:
+        try:
+            success = await limits.deadlines.run('send', email_service.send_report(
+                to_email=customer['email'],
+                company_name=customer['company_name'],
+                analysis=analysis,
+                data=weekly_data,
+                week_start=week_start,
+                week_end=week_end
+            ))
+        except TimeoutError as e:
+            print(f"  ⏱️  {e}")
+            success = False
+    
+    # Log rapport in database
+    if writer is not None:
+        await writer.add(
+            customer_id=customer['id'],
+            week_start=week_start,
+            week_end=week_end,
+            data=weekly_data,
+            analysis=analysis,
+            sent=success,
+            source=source
+        )
+    else:
+        await db.save_report(
+            customer_id=customer['id'],
+            snapshot_id=snapshot_id,
+            analysis=analysis,
+            sent=success,
+            source=source
+        )
+    
+    if success:
+        print(f"  ✅ Report sent to {customer['email']}")
+    else:
+        print(f"  ❌ Failed to send report")
+    
+    return success
+
+
+async def generate_report_for_customer(
+    customer: dict,
+    db: Database,
+    analyzer: WeeklyReportAnalyzer,
+    email_service: EmailService,
+    limits: StageLimits | None = None,
+    previous_snapshots: dict | None = None,
+    writer: ReportWriter | None = None,
+    trends: dict | None = None
+):
+    """
+    Genereer en verstuur weekrapport voor één klant.
+    
+    Met previous_snapshots (vooraf opgehaald via get_previous_snapshots) en
+    een ReportWriter worden de database round-trips per klant gebundeld.
+    trends (via get_trends) geeft de analyse de 4/13/52-weeks context.
+    """
+    
+    limits = limits or StageLimits()
+    
+    print(f"📊 Generating report for {customer['company_name']}...")
+    
+    # 1. Bepaal week periode
+    week_start, week_end = get_week_period()
+    
+    # 2. Haal data op uit boekhoudsysteem
+    weekly_data = await fetch_weekly_data(customer, week_start, week_end, limits)
+    if weekly_data is None:
         return False
     
     # 3. Haal vorige week op voor vergelijking
-    previous_week = await db.get_previous_snapshot(customer['id'])
+    if previous_snapshots is not None:
+        previous_week = previous_snapshots.get(customer['id'])
+    else:
+        previous_week = await db.get_previous_snapshot(customer['id'])
     
-    # 4. Sla snapshot op
-    snapshot_id = await db.save_snapshot(
-        customer_id=customer['id'],
-        week_start=week_start,
-        week_end=week_end,
-        data=weekly_data
-    )
+    # 4. Sla snapshot op (bij een writer samen met het rapport in stap 6)
+    snapshot_id = None
+    if writer is None:
+        snapshot_id = await db.save_snapshot(
+            customer_id=customer['id'],
+            week_start=week_start,
+            week_end=week_end,
+            data=weekly_data
+        )
     
     # 5. Genereer AI analyse met Claude
-    analysis = await analyzer.analyze(
+    # (rustige weken via de regels, zonder LLM slot)
+    analysis, usage = await analyzer.analyze_with_usage(
         company_name=customer['company_name'],
         current_week=weekly_data,
         previous_week=previous_week,
         week_start=week_start,
-        week_end=week_end
+        week_end=week_end,
+        trends=(trends or {}).get(customer['id']),
+        slot=limits.llm,
+        customer_id=customer['id']
     )
     
-    # 6. Genereer en verstuur email
-    success = await email_service.send_report(
-        to_email=customer['email'],
-        company_name=customer['company_name'],
-        analysis=analysis,
-        data=weekly_data,
-        week_start=week_start,
-        week_end=week_end
+    # 6. Verstuur email en log rapport
+    return await deliver_report(
+        customer, db, email_service, limits, weekly_data, analysis,
+        week_start, week_end, snapshot_id=snapshot_id, writer=writer, source=usage['source']
     )
+
+
+async def generate_reports_batched(
+    customers: list[dict],
+    db: Database,
+    analyzer: WeeklyReportAnalyzer,
+    email_service: EmailService,
+    limits: StageLimits,
+    slots: asyncio.Semaphore,
+    previous_snapshots: dict,
+    writer: ReportWriter,
+    batch_analyzer: BatchReportAnalyzer | None = None,
+    ledger: RunLedger | None = None,
+    trends: dict | None = None
+) -> list[bool]:
+    """
+    Batch-variant van de weekrun: eerst alle data ophalen, dan alle analyses
+    in één Message Batch, daarna versturen via het Resend batch endpoint.
+    Klanten waarvan de batch-analyse faalde krijgen alsnog een losse analyse.
+    Met een ledger worden afgeronde stages vastgelegd en bij resume overgeslagen.
+    """
+    week_start, week_end = get_week_period()
+    metrics = get_metrics()
+    trends = trends or {}
+    
+    def done(customer: dict, stage: str) -> bool:
+        return ledger is not None and ledger.done(customer['id'], stage)
+    
+    async def mark(customer: dict, stage: str, **fields):
+        if ledger is not None:
+            await ledger.mark(customer['id'], stage, **fields)
+    
+    # 1. Data ophalen voor alle klanten
+    async def fetch(customer: dict) -> dict | None:
+        if done(customer, 'fetched'):
+            return ledger.get(customer['id'], 'weekly_data')
+        async with slots, metrics.stage('fetch', customer['id']):
+            print(f"📊 Fetching data for {customer['company_name']}...")
+            data = await fetch_weekly_data(customer, week_start, week_end, limits)
+        if data is not None:
+            await mark(customer, 'fetched', weekly_data=data)
+        return data
+    
+    fetched = await asyncio.gather(*(fetch(customer) for customer in customers))
+    ready = [(customer, data) for customer, data in zip(customers, fetched) if data is not None]
+    
+    # 2. Alle analyses in één batch (behalve die al klaar waren)
+    analyses = {
+        customer['id']: ledger.get(customer['id'], 'analysis')
+        for customer, _ in ready
+        if done(customer, 'analyzed')
+    }
+    to_analyze = [(customer, data) for customer, data in ready if customer['id'] not in analyses]
+    sources = {}
+    try:
+        batch_analyzer = batch_analyzer or BatchReportAnalyzer(analyzer)
+        analyses.update(await batch_analyzer.analyze_many([
+            {
+                'custom_id': customer['id'],
+                'customer_id': customer['id'],
+                'company_name': customer['company_name'],
+                'current_week': data,
+                'previous_week': previous_snapshots.get(customer['id']),
+                'week_start': week_start,
+                'week_end': week_end,
+                'trends': trends.get(customer['id'])
+            }
+            for customer, data in to_analyze
+        ]) if to_analyze else {})
+        sources.update(batch_analyzer.sources)
+    except Exception as e:
+        print(f"  ❌ Batch analysis failed, falling back to single calls: {e}")
+    
+    # 3. Ontbrekende analyses los genereren
+    async def complete(customer: dict, data: dict) -> str | None:
+        analysis = analyses.get(customer['id'])
+        if analysis is None:
+            try:
+                async with metrics.stage('analyze', customer['id']):
+                    analysis, usage = await analyzer.analyze_with_usage(
+                        company_name=customer['company_name'],
+                        current_week=data,
+                        previous_week=previous_snapshots.get(customer['id']),
+                        week_start=week_start,
+                        week_end=week_end,
+                        trends=trends.get(customer['id']),
+                        slot=limits.llm,
+                        customer_id=customer['id']
+                    )
+                sources[customer['id']] = usage['source']
+            except Exception as e:
+                print(f"  ❌ Analysis for {customer['company_name']} failed: {e}")
+                return None
+        if not done(customer, 'analyzed'):
+            await mark(customer, 'analyzed', analysis=analysis)
+        return analysis
+    
+    completed = await asyncio.gather(*(complete(customer, data) for customer, data in ready))
+    analyzed = [
+        (customer, data, analysis)
+        for (customer, data), analysis in zip(ready, completed)
+        if analysis is not None
+    ]
     
-    # 7. Log rapport in database
-    await db.save_report(
-        customer_id=customer['id'],
-        snapshot_id=snapshot_id,
-        analysis=analysis,
-        sent=success
+    # 4. Versturen (al verstuurde klanten overslaan). De batch sleutel per
+    # klant staat in de ledger vóór het versturen: na een herstart gaat
+    # dezelfde groep opnieuw met dezelfde sleutel, ook als 'sent' niet meer
+    # vastgelegd werd, en herkent Resend hem als herhaling. Klanten die een
+    # eerdere run zonder batch sleutel had opgepakt (bv. in pipeline mode)
+    # gaan los met hun eigen idempotency key.
+    to_send = [item for item in analyzed if not done(item[0], 'sent')]
+    batch_keys = {
+        customer['id']: ledger.get(customer['id'], 'batch_key')
+        for customer, _, _ in analyzed
+        if ledger is not None and ledger.get(customer['id'], 'batch_key')
+    }
+    single = [
+        item for item in to_send
+        if ledger is not None and ledger.attempted(item[0]['id']) and item[0]['id'] not in batch_keys
+    ]
+    if ledger is not None:
+        new = sorted(
+            (customer['id'] for customer, _, _ in to_send
+             if not ledger.attempted(customer['id']) and customer['id'] not in batch_keys),
+            key=str
+        )
+        for i in range(0, len(new), email_service.BATCH_SIZE):
+            chunk = new[i:i + email_service.BATCH_SIZE]
+            batch_key = email_service.batch_key([ledger.idempotency_key(customer_id) for customer_id in chunk])
+            for customer_id in chunk:
+                batch_keys[customer_id] = batch_key
+                await ledger.mark(customer_id, 'queued', batch_key=batch_key)
+        await ledger.flush()
+    
+    # Hele groep opnieuw versturen zodra één klant erin nog niet als verzonden staat
+    replay = {batch_keys[customer['id']] for customer, _, _ in to_send if customer['id'] in batch_keys}
+    batched = to_send if ledger is None else sorted(
+        (item for item in analyzed if batch_keys.get(item[0]['id']) in replay),
+        key=lambda item: str(item[0]['id'])
     )
     
-    if success:
-        print(f"  ✅ Report sent to {customer['email']}")
-    else:
-        print(f"  ❌ Failed to send report")
+    async def send_single(customer: dict, data: dict, analysis: str) -> bool:
+        message = email_service._build_message(
+            customer['email'], customer['company_name'], analysis, data, week_start, week_end
+        )
+        async with limits.email:
+            return await email_service.send_message(message, idempotency_key=ledger.idempotency_key(customer['id']))
     
-    return success
+    sent_batched, sent_single = await asyncio.gather(
+        email_service.send_reports_batch([
+            {
+                'to_email': customer['email'],
+                'company_name': customer['company_name'],
+                'analysis': analysis,
+                'data': data,
+                'week_start': week_start,
+                'week_end': week_end,
+                'idempotency_key': ledger.idempotency_key(customer['id']) if ledger else None,
+                'batch_key': batch_keys.get(customer['id'])
+            }
+            for customer, data, analysis in batched
+        ]),
+        asyncio.gather(*(send_single(*item) for item in single))
+    )
+    sent = {customer['id']: True for customer, _, _ in analyzed if done(customer, 'sent')}
+    for (customer, _, _), success in zip(batched + single, sent_batched + list(sent_single)):
+        sent[customer['id']] = sent.get(customer['id']) or success
+    if ledger is not None:
+        await ledger.mark_many([customer['id'] for customer, _, _ in to_send if sent[customer['id']]], 'sent')
+        await ledger.flush()
+    
+    # 5. Loggen
+    results = []
+    for customer, data, analysis in analyzed:
+        success = sent[customer['id']]
+        if not done(customer, 'persisted'):
+            try:
+                await writer.add(
+                    customer_id=customer['id'],
+                    week_start=week_start,
+                    week_end=week_end,
+                    data=data,
+                    analysis=analysis,
+                    sent=success,
+                    source=sources.get(customer['id'])
+                )
+            except Exception as e:
+                print(f"  ❌ Failed to save report for {customer['company_name']}: {e}")
+        
+        if success:
+            print(f"  ✅ Report sent to {customer['email']}")
+        else:
+            print(f"  ❌ Failed to send report to {customer['email']}")
+        results.append(success)
+    
+    return results
 
 
 def get_connector(customer: dict):
-    """Return juiste connector voor klant's boekhoudsysteem."""
-    system = customer.get('accounting_system', '').lower()
-    credentials = customer.get('accounting_credentials', {})
-    
-    if system == 'moneybird':
-        return MoneybirdConnector(
-            admin_id=credentials.get('admin_id'),
-            token=credentials.get('token')
-        )
-    # Voeg hier meer connectors toe:
-    # elif system == 'exact':
-    #     return ExactConnector(...)
-    # elif system == 'snelstart':
-    #     return SnelstartConnector(...)
-    
-    return None
+    """Return juiste connector voor klant's boekhoudsysteem (zie connectors/registry.py)."""
+    return create_connector(customer)
 
 
-async def run_all_reports():
-    """Genereer rapporten voor alle actieve klanten."""
+async def run_all_reports(
+    concurrency: int | None = None,
+    limits: StageLimits | None = None,
+    batch: bool | None = None,
+    refresh_analysis: bool = False,
+    resume: bool = False,
+    metrics_dir: str | None = None,
+    trace: bool = False,
+    db: Database | None = None,
+    analyzer: WeeklyReportAnalyzer | None = None,
+    email_service: EmailService | None = None,
+    batch_analyzer: BatchReportAnalyzer | None = None,
+    shard: tuple[int, int] | None = None
+) -> dict:
+    """
+    Genereer rapporten voor alle actieve klanten.
+    
+    Standaard loopt de run als pipeline (fetch, analyse, render, verzenden,
+    opslaan) met eigen workers per stage. Met batch=True (of
+    ANALYSIS_MODE=batch) gaan alle analyses via de Message Batches API in
+    plaats van één Claude call per klant. Met refresh_analysis=True wordt de
+    analyse cache genegeerd.
+    
+    Voortgang per klant en week staat in de run ledger (report_runs). Met
+    resume=True slaat een herstart na een crash afgeronde stages over.
+    
+    Aan het eind worden de run metrics (latency per stage en dienst,
+    requests, bytes, tokens, fouten) weggeschreven naar metrics_dir (default
+    env METRICS_DIR); met trace=True ook de losse spans.
+    
+    db, analyzer, email_service en batch_analyzer kunnen vervangen worden
+    door lokale stand-ins (zie benchmarks/); default de echte diensten.
     
+    Met shard=(i, N) verwerkt de run alleen de klanten van shard i van N
+    (zie services/sharding.py).
+    
+    Returns:
+        Run samenvatting (klanten, verzonden, scheduler, Claude en pipeline
+        statistieken), samen te voegen met merge_summaries.
+    """
+    
+    shard_label = f" (shard {shard[0]}/{shard[1]})" if shard else ""
     print("=" * 50)
-    print("🚀 GripAI Weekrapportage")
+    print(f"🚀 GripAI Weekrapportage{shard_label}")
     print(f"   {datetime.now().strftime('%Y-%m-%d %H:%M')}")
     print("=" * 50)
     
+    from connectors.http import close_http_client
+    from connectors.http_cache import http_cache_stats
+    from connectors.scheduler import get_scheduler
+    
     # Initialize services
-    db = Database()
-    analyzer = WeeklyReportAnalyzer()
-    email_service = EmailService()
+    metrics = get_metrics()
+    metrics.trace = trace or metrics.trace
+    db = db or Database()
+    limits = limits or StageLimits()
+    analyzer = analyzer or WeeklyReportAnalyzer(refresh=refresh_analysis, deadlines=limits.deadlines)
+    email_service = email_service or EmailService()
     
     # Haal alle actieve klanten op
     customers = await db.get_active_customers()
+    if shard:
+        customers = select_shard(customers, *shard)
     
     if not customers:
         print("Geen actieve klanten gevonden.")
-        return
+        db.close()
+        return {'customers': 0, 'sent': 0, 'scheduler': {}, 'http_cache': {}, 'claude': {}, 'latency': {}, 'pipeline': None, 'unsaved': 0}
     
     print(f"📋 {len(customers)} klant(en) gevonden\n")
     
-    # Genereer rapport voor elke klant
-    success_count = 0
-    for customer in customers:
-        success = await generate_report_for_customer(
-            customer, db, analyzer, email_service
-        )
-        if success:
-            success_count += 1
+    # Genereer rapporten parallel, begrensd per stage en per externe dienst
+    concurrency = concurrency or int(os.getenv('REPORT_CONCURRENCY', '10'))
+    slots = asyncio.Semaphore(concurrency)
+    pipeline = None
+    
+    # Vorige snapshots in één keer ophalen, snapshots en rapporten in bulk wegschrijven
+    customer_ids = [c['id'] for c in customers]
+    week_start, week_end = get_week_period()
+    ledger = RunLedger(db, week_start, resume=resume)
+    await ledger.load(customer_ids)
+    previous_snapshots = await db.get_previous_snapshots(customer_ids)
+    trends = await db.get_trends(customer_ids)
+    writer = ReportWriter(db, ledger=ledger)
+    
+    if batch is None:
+        batch = os.getenv('ANALYSIS_MODE', '').lower() == 'batch'
+    
+    try:
+        if batch:
+            results = await generate_reports_batched(
+                customers, db, analyzer, email_service, limits, slots,
+                previous_snapshots, writer, batch_analyzer=batch_analyzer, ledger=ledger, trends=trends
+            )
+        else:
+            pipeline = ReportPipeline(
+                fetch_weekly_data, analyzer, email_service, writer, limits,
+                previous_snapshots, workers={'fetch': concurrency}, ledger=ledger, trends=trends
+            )
+            results = await pipeline.run(customers, week_start, week_end)
+        # Laatste flush een paar keer proberen: de buffer bevat ook de
+        # verzonden rapporten, die mogen niet stilletjes verloren gaan
+        for attempt in range(FLUSH_ATTEMPTS):
+            try:
+                await writer.flush()
+                break
+            except Exception as e:
+                print(f"  ❌ Failed to save snapshots/reports (attempt {attempt + 1}/{FLUSH_ATTEMPTS}): {e}")
+                if attempt + 1 < FLUSH_ATTEMPTS:
+                    await asyncio.sleep(2 ** attempt)
+        await ledger.flush()
+    finally:
+        await close_http_client()
+        db.close()
+    summary = {
+        'customers': len(customers),
+        'sent': sum(1 for success in results if success),
+        'scheduler': dict(get_scheduler().stats),
+        'http_cache': http_cache_stats(),
+        'claude': dict(analyzer.usage),
+        'latency': {**metrics.customer_latency(), 'budget': limits.deadlines.budget()},
+        'pipeline': pipeline.stats() if pipeline else None,
+        'unsaved': writer.unsaved
+    }
+    print_summary(summary)
+    
+    try:
+        paths = metrics.write(metrics_dir, week_start, shard=shard, extra={
+            'week_start': week_start.strftime('%Y-%m-%d'),
+            'shard': list(shard) if shard else None,
+            'mode': 'batch' if batch else 'pipeline',
+            **summary
+        })
+        print(f"   Metrics: {', '.join(paths)}")
+    except OSError as e:
+        print(f"  ⚠️  Failed to write metrics: {e}")
+    print("=" * 50)
+    return summary
+
+
+def print_summary(summary: dict):
+    """Print de run samenvatting (van één run of samengevoegde shards)."""
+    print("\n" + "=" * 50)
+    shards = f" over {summary['shards']} shards" if summary.get('shards') else ""
+    print(f"✅ Klaar: {summary['sent']}/{summary['customers']} rapporten verzonden{shards}")
+    if summary.get('unsaved'):
+        print(f"   ❌ {summary['unsaved']} snapshots/rapporten niet opgeslagen")
+    for s in summary['pipeline'] or []:
+        print(f"   {s['stage']:<8} {s['workers']:>3} workers  {s['processed']:>5} ok  {s['failed']:>4} failed  "
+              f"max queue {s['max_queue_depth']:>3}  {s['per_second']:.1f}/s")
+    usage = summary['claude']
+    if usage:
+        print(f"   Claude: {usage['calls']} calls, {usage['cache_hits']} cached, {usage.get('rules', 0)} via regels, "
+              f"{usage.get('fallbacks', 0)} fallback, {usage.get('stale', 0)} vorige analyse, {usage['input_tokens']} input / {usage['output_tokens']} output tokens, "
+              f"{usage['cache_read_input_tokens']} cache read / {usage['cache_creation_input_tokens']} cache write")
+    stats = summary['scheduler']
+    if stats:
+        print(f"   API: {stats['requests']} requests, {stats['throttled']} throttled, {stats['retries']} retries, {stats['failures']} failed, "
+              f"{stats.get('hedged', 0)} hedged ({stats.get('hedge_wins', 0)} won)")
+    latency = summary.get('latency')
+    if latency and latency.get('p99') is not None:
+        budget = f" (budget {latency['budget']:.0f}s)" if latency.get('budget') else ""
+        print(f"   Per klant: p50 {latency['p50']:.1f}s, p99 {latency['p99']:.1f}s, max {latency['max']:.1f}s{budget}")
+    cache = summary.get('http_cache')
+    if cache:
+        print(f"   HTTP cache: {cache['hits']} hits (304), {cache['misses']} misses, {cache['changed']} changed, "
+              f"{cache['evicted']} evicted, {cache['bytes_saved'] / 1024 / 1024:.1f} MB saved")
+
+
+def _run_shard(shard: tuple[int, int], options: dict) -> dict:
+    """Entry point per proces: eigen event loop, eigen clients, één shard."""
+    limits = StageLimits(**options.pop('limits'))
+    return asyncio.run(run_all_reports(limits=limits, shard=shard, **options))
+
+
+def run_sharded(processes: int, shard: tuple[int, int] | None, options: dict) -> dict:
+    """
+    Verdeel de run over processes lokale processen.
+    
+    Elk proces draait een sub-shard van shard (of van alle klanten) met zijn
+    eigen event loop; de samenvattingen worden samengevoegd tot één.
+    
+    Args:
+        options: Keyword arguments voor run_all_reports; limits als dict
+                 met de StageLimits argumenten (picklebaar)
+    """
+    index, count = shard or (0, 1)
+    shards = split_shard(index, count, processes)
+    print(f"🧩 {processes} processen, shards {', '.join(f'{i}/{n}' for i, n in shards)}")
+    
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_run_shard, sub_shard, dict(options)) for sub_shard in shards]
+        summaries = [future.result() for future in futures]
+    
+    summary = merge_summaries(summaries)
+    print_summary(summary)
+    print("=" * 50)
+    return summary
+
+
+async def run_backfill(
+    weeks: int,
+    analyze: bool = False,
+    customer_id: str | None = None,
+    limits: StageLimits | None = None,
+    shard: tuple[int, int] | None = None
+) -> dict:
+    """
+    Herbereken weekly_snapshots voor de afgelopen weeks weken.
+    
+    Per klant wordt de hele periode één keer opgehaald en per week ingedeeld
+    (connector.get_history), in plaats van één fetch per week. Alle
+    snapshots gaan in bulk de database in. Met analyze=True krijgt elke week
+    ook een analyse, opgeslagen als niet-verzonden rapport met de week
+    ervoor als vergelijking. Er worden geen emails verstuurd.
+    
+    Args:
+        customer_id: Alleen deze klant (bv. bij onboarding); default alle actieve klanten
+    """
+    
+    print("=" * 50)
+    print(f"🕰️  GripAI Backfill: {weeks} weken")
+    print("=" * 50)
+    
+    from connectors.http import close_http_client
+    
+    db = Database()
+    limits = limits or StageLimits()
+    analyzer = WeeklyReportAnalyzer(deadlines=limits.deadlines) if analyze else None
+    
+    if customer_id:
+        customer = await db.get_customer(customer_id)
+        customers = [customer] if customer else []
+    else:
+        customers = await db.get_active_customers()
+    if shard:
+        customers = select_shard(customers, *shard)
+    
+    last_start, last_end = get_week_period()
+    start = last_start - timedelta(weeks=weeks - 1)
+    periods = [(start + timedelta(weeks=i), start + timedelta(weeks=i, days=6)) for i in range(weeks)]
+    writer = ReportWriter(db)
+    snapshots = []
+    
+    async def backfill(customer: dict) -> int:
+        connector = get_connector(customer)
+        if connector is None or not hasattr(connector, 'get_history'):
+            print(f"  ⚠️  No backfill support for {customer.get('accounting_system')}")
+            return 0
+        try:
+            async with limits.accounting:
+                history = await connector.get_history(start, last_end)
+        except Exception as e:
+            print(f"  ❌ Failed to fetch history for {customer['company_name']}: {e}")
+            return 0
+        
+        previous = None
+        for week_start, week_end in periods:
+            data = history.get(week_start.strftime('%Y-%m-%d'))
+            if data is None:
+                continue
+            
+            analysis = None
+            if analyzer:
+                try:
+                    # Zonder customer_id: een oude week wordt niet de laatste analyse van de klant
+                    analysis, usage = await analyzer.analyze_with_usage(
+                        company_name=customer['company_name'],
+                        current_week=data,
+                        previous_week=previous,
+                        week_start=week_start,
+                        week_end=week_end,
+                        slot=limits.llm
+                    )
+                except Exception as e:
+                    print(f"  ❌ Analysis for {customer['company_name']} {week_start:%Y-%m-%d} failed: {e}")
+            
+            if analysis is not None:
+                await writer.add(customer['id'], week_start, week_end, data, analysis, sent=False, source=usage['source'])
+            else:
+                snapshots.append({'customer_id': customer['id'], 'week_start': week_start, 'week_end': week_end, 'data': data})
+            previous = data
+        
+        print(f"  ✅ {customer['company_name']}: {len(history)} weken")
+        return len(history)
+    
+    try:
+        counts = await asyncio.gather(*(backfill(customer) for customer in customers))
+        await writer.flush()
+        if snapshots:
+            await db.save_snapshots(snapshots)
+    finally:
+        await close_http_client()
+        db.close()
     
+    summary = {'customers': len(customers), 'weeks': sum(counts)}
     print("\n" + "=" * 50)
-    print(f"✅ Klaar: {success_count}/{len(customers)} rapporten verzonden")
+    print(f"✅ Klaar: {summary['weeks']} weeksnapshots voor {summary['customers']} klant(en)")
     print("=" * 50)
+    return summary
+
+
+async def run_webhook_receiver(port: int | None = None):
+    """Draai de webhook receiver tot hij gestopt wordt (zie connectors/webhooks.py)."""
+    from connectors.webhook_store import WebhookStore
+    from connectors.webhooks import MoneybirdWebhookHandler, WebhookServer
+    
+    store = WebhookStore()
+    server = WebhookServer({'moneybird': MoneybirdWebhookHandler(store)}, port=port)
+    try:
+        await server.serve_forever()
+    finally:
+        store.close()
+
+
+async def run_webhook_seed(url: str | None = None, customer_id: str | None = None, limits: StageLimits | None = None) -> int:
+    """
+    Registreer webhooks (met url) en zet de open facturen van alle
+    Moneybird klanten in de webhook store.
+    
+    Returns:
+        Aantal geseede klanten.
+    """
+    from connectors.http import close_http_client
+    from connectors.webhook_store import WebhookStore
+    
+    db = Database()
+    store = WebhookStore()
+    limits = limits or StageLimits()
+    url = url or os.getenv('WEBHOOK_URL')
+    if customer_id:
+        customer = await db.get_customer(customer_id)
+        customers = [customer] if customer else []
+    else:
+        customers = await db.get_active_customers()
+    
+    async def seed(customer: dict) -> bool:
+        connector = get_connector(customer)
+        if connector is None or not hasattr(connector, 'seed_webhooks'):
+            print(f"  ⚠️  No webhook support for {customer.get('accounting_system')}")
+            return False
+        try:
+            async with limits.accounting:
+                count = await connector.seed_webhooks(store, url)
+        except Exception as e:
+            print(f"  ❌ Failed to seed webhooks for {customer['company_name']}: {e}")
+            return False
+        print(f"  🪝 {customer['company_name']}: {count} open invoice(s){', webhook registered' if url else ''}")
+        return True
+    
+    try:
+        seeded = sum(await asyncio.gather(*(seed(customer) for customer in customers)))
+    finally:
+        await close_http_client()
+        store.close()
+        db.close()
+    print(f"✅ {seeded}/{len(customers)} klant(en) via webhooks vanaf volgende week")
+    return seeded
+
+
+def run_webhook_replay(path: str):
+    """Speel webhook events uit een JSONL bestand af in de webhook store."""
+    from connectors.webhook_store import WebhookStore
+    from connectors.webhooks import MoneybirdWebhookHandler, replay_events
+    
+    store = WebhookStore()
+    try:
+        counts = replay_events(path, MoneybirdWebhookHandler(store))
+    finally:
+        store.close()
+    print(f"🪝 Replayed {sum(counts.values())} event(s): " + ', '.join(f"{n} {result}" for result, n in sorted(counts.items())))
+
+
+# Demo data
+DEMO_COMPANY = "Keukenleverancier Drenthe B.V."
+
+DEMO_DATA = {
+    'revenue': 24750.00,
+    'costs': 18200.00,
+    'profit': 6550.00,
+    'invoices_sent': 12,
+    'invoices_paid': 8,
+    'outstanding_total': 15420.00,
+    'outstanding_overdue': 4200.00,
+    'top_customers': [
+        {'name': 'Familie de Vries', 'revenue': 8500.00},
+        {'name': 'Bakkerij Jansen', 'revenue': 4200.00},
+        {'name': 'Restaurant het Dorp', 'revenue': 3800.00},
+    ],
+    'overdue_invoices': [
+        {'customer': 'Bouwbedrijf Klaassen', 'amount': 2800.00, 'days_overdue': 21},
+        {'customer': 'Garage Pietersen', 'amount': 1400.00, 'days_overdue': 7},
+    ]
+}
+
+DEMO_PREVIOUS_WEEK = {
+    'revenue': 21300.00,
+    'costs': 16800.00,
+    'profit': 4500.00,
+    'invoices_sent': 9,
+    'invoices_paid': 11,
+    'outstanding_total': 12800.00,
+}
+
+DEMO_ANALYSIS = """De omzet kwam deze week uit op EUR 24.750, een stijging van 16% ten opzichte van vorige week.
+
+Het openstaande bedrag liep op naar EUR 15.420, waarvan EUR 4.200 verlopen is. Bel Bouwbedrijf Klaassen over de factuur van 21 dagen."""
 
 
 async def run_test_report():
@@ -149,44 +794,14 @@ async def run_test_report():
     analyzer = WeeklyReportAnalyzer()
     email_service = EmailService()
     
-    # Demo data
-    demo_data = {
-        'revenue': 24750.00,
-        'costs': 18200.00,
-        'profit': 6550.00,
-        'invoices_sent': 12,
-        'invoices_paid': 8,
-        'outstanding_total': 15420.00,
-        'outstanding_overdue': 4200.00,
-        'top_customers': [
-            {'name': 'Familie de Vries', 'revenue': 8500.00},
-            {'name': 'Bakkerij Jansen', 'revenue': 4200.00},
-            {'name': 'Restaurant het Dorp', 'revenue': 3800.00},
-        ],
-        'overdue_invoices': [
-            {'customer': 'Bouwbedrijf Klaassen', 'amount': 2800.00, 'days_overdue': 21},
-            {'customer': 'Garage Pietersen', 'amount': 1400.00, 'days_overdue': 7},
-        ]
-    }
-    
-    previous_week = {
-        'revenue': 21300.00,
-        'costs': 16800.00,
-        'profit': 4500.00,
-        'invoices_sent': 9,
-        'invoices_paid': 11,
-        'outstanding_total': 12800.00,
-    }
-    
-    today = datetime.now()
-    week_end = today - timedelta(days=today.weekday() + 1)
-    week_start = week_end - timedelta(days=6)
+    demo_data = DEMO_DATA
+    week_start, week_end = get_week_period()
     
     # Genereer analyse
-    analysis = await analyzer.analyze(
-        company_name="Keukenleverancier Drenthe B.V.",
+    analysis, usage = await analyzer.analyze_with_usage(
+        company_name=DEMO_COMPANY,
         current_week=demo_data,
-        previous_week=previous_week,
+        previous_week=DEMO_PREVIOUS_WEEK,
         week_start=week_start,
         week_end=week_end
     )
@@ -195,6 +810,8 @@ async def run_test_report():
     print("-" * 40)
     print(analysis)
     print("-" * 40)
+    print(f"⏱️  {usage['seconds']:.1f}s via {usage['source']}, {usage['input_tokens']} input / {usage['output_tokens']} output tokens, "
+          f"{usage['cache_read_input_tokens']} cache read / {usage['cache_creation_input_tokens']} cache write")
     
     # Optioneel: verstuur test email
     test_email = os.getenv('TEST_EMAIL')
@@ -202,7 +819,7 @@ async def run_test_report():
         print(f"\n📧 Sending test email to {test_email}...")
         success = await email_service.send_report(
             to_email=test_email,
-            company_name="Keukenleverancier Drenthe B.V.",
+            company_name=DEMO_COMPANY,
             analysis=analysis,
             data=demo_data,
             week_start=week_start,
@@ -213,21 +830,106 @@ async def run_test_report():
         print("\n💡 Set TEST_EMAIL env var to receive test report")
 
 
+def run_render_only(out_dir: str, count: int, workers: int | None = None):
+    """Render demo rapporten naar HTML bestanden zonder te mailen (preview en throughput)."""
+    from services.rendering import render_only
+    
+    week_start, week_end = get_week_period()
+    reports = [
+        {
+            'name': f"demo_{i:05d}",
+            'company_name': DEMO_COMPANY,
+            'analysis': DEMO_ANALYSIS,
+            'data': {**DEMO_DATA, 'revenue': DEMO_DATA['revenue'] + i},
+            'week_start': week_start,
+            'week_end': week_end
+        }
+        for i in range(count)
+    ]
+    
+    result = render_only(reports, out_dir, workers=workers)
+    print(f"🖨️  Rendered {result['count']} report(s) to {out_dir} in {result['seconds']:.2f}s "
+          f"({result['per_second']:.0f}/s)")
+
+
 def main():
     parser = argparse.ArgumentParser(description='GripAI Weekrapportage')
     parser.add_argument('--run-reports', action='store_true', help='Run reports for all customers')
     parser.add_argument('--test', action='store_true', help='Run test with demo data')
+    parser.add_argument('--render-only', metavar='DIR', help='Render demo reports as HTML into DIR without sending')
+    parser.add_argument('--render-count', type=int, default=1, help='Number of demo reports for --render-only')
+    parser.add_argument('--render-workers', type=int, help='Render processes for --render-only (env: RENDER_WORKERS)')
+    parser.add_argument('--concurrency', type=int, help='Max customers in parallel (env: REPORT_CONCURRENCY)')
+    parser.add_argument('--accounting-concurrency', type=int, help='Max parallel accounting API fetches (env: ACCOUNTING_CONCURRENCY)')
+    parser.add_argument('--llm-concurrency', type=int, help='Max parallel Claude calls (env: LLM_CONCURRENCY)')
+    parser.add_argument('--email-concurrency', type=int, help='Max parallel email sends (env: EMAIL_CONCURRENCY)')
+    parser.add_argument('--metrics-dir', help='Write run metrics (JSON summary, Prometheus textfile) to this directory')
+    parser.add_argument('--trace', action='store_true', help='Also write trace spans for the run')
+    parser.add_argument('--backfill', action='store_true', help='Recompute weekly snapshots for past weeks (no emails)')
+    parser.add_argument('--weeks', type=int, default=52, help='Number of weeks for --backfill (default 52)')
+    parser.add_argument('--backfill-analysis', action='store_true', help='Also generate an analysis per week during --backfill')
+    parser.add_argument('--customer', help='Only backfill (or --webhook-seed) this customer id')
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N', help='Only process shard I of N (customers partitioned by id hash)')
+    parser.add_argument('--processes', type=int, help='Split the run (or shard) over N local processes (env: REPORT_PROCESSES)')
+    parser.add_argument('--resume', action='store_true', help='Resume an interrupted run; skip stages already completed this week')
+    parser.add_argument('--refresh-analysis', action='store_true', help='Ignore cached analyses and call Claude again')
+    parser.add_argument('--batch-analysis', action='store_true', default=None, help='Analyze all customers via the Message Batches API (env: ANALYSIS_MODE=batch)')
+    parser.add_argument('--webhooks', action='store_true', help='Run the webhook receiver for Moneybird events')
+    parser.add_argument('--webhook-port', type=int, help='Port for --webhooks (env: WEBHOOK_PORT or PORT, default 8080)')
+    parser.add_argument('--webhook-seed', action='store_true', help='Seed open invoices into the webhook store (and register webhooks with --webhook-url)')
+    parser.add_argument('--webhook-url', help='Public receiver URL to register with --webhook-seed (env: WEBHOOK_URL)')
+    parser.add_argument('--webhook-replay', metavar='FILE', help='Apply webhook events from a JSONL file to the webhook store')
     args = parser.parse_args()
     
     if args.run_reports:
-        asyncio.run(run_all_reports())
+        limits = {
+            'accounting': args.accounting_concurrency,
+            'llm': args.llm_concurrency,
+            'email': args.email_concurrency
+        }
+        options = {
+            'concurrency': args.concurrency,
+            'batch': args.batch_analysis,
+            'refresh_analysis': args.refresh_analysis,
+            'resume': args.resume,
+            'metrics_dir': args.metrics_dir,
+            'trace': args.trace
+        }
+        processes = args.processes or int(os.getenv('REPORT_PROCESSES', '1'))
+        if processes > 1:
+            summary = run_sharded(processes, args.shard, {**options, 'limits': limits})
+        else:
+            summary = asyncio.run(run_all_reports(limits=StageLimits(**limits), shard=args.shard, **options))
+        if summary.get('unsaved'):
+            sys.exit(1)
+    elif args.backfill:
+        limits = StageLimits(
+            accounting=args.accounting_concurrency,
+            llm=args.llm_concurrency,
+            email=args.email_concurrency
+        )
+        asyncio.run(run_backfill(args.weeks, analyze=args.backfill_analysis, customer_id=args.customer, limits=limits, shard=args.shard))
+    elif args.webhooks:
+        asyncio.run(run_webhook_receiver(args.webhook_port))
+    elif args.webhook_seed:
+        asyncio.run(run_webhook_seed(args.webhook_url, customer_id=args.customer))
+    elif args.webhook_replay:
+        run_webhook_replay(args.webhook_replay)
     elif args.test:
         asyncio.run(run_test_report())
+    elif args.render_only:
+        run_render_only(args.render_only, args.render_count, args.render_workers)
     else:
         print("GripAI Weekrapportage")
         print("Usage:")
         print("  python main.py --test         Run test with demo data")
         print("  python main.py --run-reports  Generate reports for all customers")
+        print("       [--concurrency N]        Max customers in parallel (default 10)")
+        print("       [--shard I/N] [--processes P]  Run one shard and/or spread over P processes")
+        print("  python main.py --backfill --weeks N [--customer ID] [--backfill-analysis]")
+        print("  python main.py --render-only DIR [--render-count N]  Render demo reports to HTML")
+        print("  python main.py --webhooks [--webhook-port P]  Receive Moneybird events")
+        print("  python main.py --webhook-seed [--webhook-url URL] | --webhook-replay FILE")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,265 @@
+"""
+GripAI - Gestapelde weekrun
+Fetch, analyse, render, verzenden en opslaan als aparte stages met elk hun
+eigen workers, verbonden door begrensde asyncio queues. Zo overlapt het
+ophalen voor klant N+1 met de analyse van klant N en het versturen van N-1.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from analysis.weekly_report import WeeklyReportAnalyzer
+from services.database import ReportWriter
+from services.email import EmailService
+from services.ledger import RunLedger
+from services.limits import StageLimits
+from services.metrics import get_metrics
+
+
+_DONE = object()
+
+
+class Stage:
+    """Eén pipeline stage: workers die jobs uit een queue halen en doorgeven."""
+    
+    def __init__(self, name: str, handler: Callable[[dict], Awaitable[bool]], workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+    
+    async def put(self, job):
+        await self.queue.put(job)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+    
+    async def work(self, next_stage: 'Stage | None', results: dict):
+        while True:
+            job = await self.queue.get()
+            if job is _DONE:
+                return
+            
+            metrics = get_metrics()
+            started = time.monotonic()
+            try:
+                async with metrics.stage(self.name, job['customer']['id']):
+                    ok = await self.handler(job)
+                if not ok:
+                    metrics.inc('stage_errors', stage=self.name)
+            except Exception as e:
+                print(f"  ❌ {self.name} failed for {job['customer'].get('company_name')}: {e}")
+                ok = False
+            self.busy_seconds += time.monotonic() - started
+            
+            if ok:
+                self.processed += 1
+                if next_stage:
+                    await next_stage.put(job)
+                else:
+                    results[job['customer']['id']] = bool(job.get('sent'))
+            else:
+                self.failed += 1
+                results[job['customer']['id']] = False
+
+
+class ReportPipeline:
+    """Weekrun als pipeline van stages met backpressure."""
+    
+    def __init__(
+        self,
+        fetch: Callable[[dict, datetime, datetime, StageLimits], Awaitable[dict | None]],
+        analyzer: WeeklyReportAnalyzer,
+        email_service: EmailService,
+        writer: ReportWriter,
+        limits: StageLimits,
+        previous_snapshots: dict,
+        workers: dict[str, int] | None = None,
+        queue_size: int | None = None,
+        ledger: RunLedger | None = None,
+        trends: dict | None = None
+    ):
+        """
+        Args:
+            fetch: Coroutine (customer, week_start, week_end, limits) -> weekdata of None
+            ledger: Optionele RunLedger; stages worden vastgelegd en bij resume overgeslagen
+            trends: Trend aggregaten per klant (Database.get_trends) voor de analyse
+            workers: Workers per stage (fetch, analyze, render, send, persist);
+                     default env PIPELINE_<STAGE>_WORKERS
+            queue_size: Max jobs in de queue vóór elke stage (default env PIPELINE_QUEUE_SIZE of 20)
+        """
+        self.fetch = fetch
+        self.analyzer = analyzer
+        self.email_service = email_service
+        self.writer = writer
+        self.limits = limits
+        self.previous_snapshots = previous_snapshots
+        self.ledger = ledger
+        self.trends = trends or {}
+        
+        defaults = {'fetch': 10, 'analyze': 4, 'render': 1, 'send': 4, 'persist': 1}
+        workers = workers or {}
+        queue_size = queue_size or int(os.getenv('PIPELINE_QUEUE_SIZE', '20'))
+        
+        handlers = {
+            'fetch': self._fetch,
+            'analyze': self._analyze,
+            'render': self._render,
+            'send': self._send,
+            'persist': self._persist
+        }
+        self.stages = [
+            Stage(
+                name,
+                handler,
+                workers.get(name) or int(os.getenv(f'PIPELINE_{name.upper()}_WORKERS', str(defaults[name]))),
+                queue_size
+            )
+            for name, handler in handlers.items()
+        ]
+        self.seconds = 0.0
+    
+    async def run(self, customers: list[dict], week_start: datetime, week_end: datetime) -> list[bool]:
+        """
+        Verwerk alle klanten door de pipeline.
+        
+        Returns:
+            Per klant (in input volgorde) True als het rapport verstuurd is.
+        """
+        results: dict[str, bool] = {}
+        started = time.monotonic()
+        
+        async def run_stage(index: int):
+            stage = self.stages[index]
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            await asyncio.gather(*(stage.work(next_stage, results) for _ in range(stage.workers)))
+            # Stage leeg: volgende stage mag stoppen zodra zijn queue leeg is
+            if next_stage:
+                for _ in range(next_stage.workers):
+                    await next_stage.queue.put(_DONE)
+        
+        async def produce():
+            first = self.stages[0]
+            for customer in customers:
+                await first.put({'customer': customer, 'week_start': week_start, 'week_end': week_end})
+            for _ in range(first.workers):
+                await first.queue.put(_DONE)
+        
+        await asyncio.gather(produce(), *(run_stage(i) for i in range(len(self.stages))))
+        self.seconds = time.monotonic() - started
+        
+        return [results.get(customer['id'], False) for customer in customers]
+    
+    def stats(self) -> list[dict]:
+        """Per stage: workers, verwerkt, gefaald, max queue diepte, busy tijd en throughput."""
+        return [
+            {
+                'stage': stage.name,
+                'workers': stage.workers,
+                'processed': stage.processed,
+                'failed': stage.failed,
+                'max_queue_depth': stage.max_depth,
+                'queue_depth': stage.queue.qsize(),
+                'busy_seconds': stage.busy_seconds,
+                'per_second': stage.processed / self.seconds if self.seconds else 0.0
+            }
+            for stage in self.stages
+        ]
+    
+    def _done(self, job: dict, stage: str) -> bool:
+        return self.ledger is not None and self.ledger.done(job['customer']['id'], stage)
+    
+    async def _mark(self, job: dict, stage: str, **fields):
+        if self.ledger is not None:
+            await self.ledger.mark(job['customer']['id'], stage, **fields)
+    
+    async def _fetch(self, job: dict) -> bool:
+        customer = job['customer']
+        if self._done(job, 'fetched'):
+            job['data'] = self.ledger.get(customer['id'], 'weekly_data')
+            return True
+        
+        print(f"📊 Generating report for {customer['company_name']}...")
+        job['data'] = await self.fetch(customer, job['week_start'], job['week_end'], self.limits)
+        if job['data'] is None:
+            return False
+        await self._mark(job, 'fetched', weekly_data=job['data'])
+        return True
+    
+    async def _analyze(self, job: dict) -> bool:
+        customer = job['customer']
+        if self._done(job, 'analyzed'):
+            job['analysis'] = self.ledger.get(customer['id'], 'analysis')
+            return True
+        
+        job['analysis'], usage = await self.analyzer.analyze_with_usage(
+            company_name=customer['company_name'],
+            current_week=job['data'],
+            previous_week=self.previous_snapshots.get(customer['id']),
+            week_start=job['week_start'],
+            week_end=job['week_end'],
+            trends=self.trends.get(customer['id']),
+            slot=self.limits.llm,
+            customer_id=customer['id']
+        )
+        job['source'] = usage['source']
+        await self._mark(job, 'analyzed', analysis=job['analysis'])
+        return True
+    
+    async def _render(self, job: dict) -> bool:
+        if self._done(job, 'sent'):
+            return True
+        
+        customer = job['customer']
+        job['message'] = self.email_service._build_message(
+            customer['email'], customer['company_name'], job['analysis'],
+            job['data'], job['week_start'], job['week_end']
+        )
+        return True
+    
+    async def _send(self, job: dict) -> bool:
+        if self._done(job, 'sent'):
+            job['sent'] = True
+            return True
+        
+        key = self.ledger.idempotency_key(job['customer']['id']) if self.ledger else None
+        async with self.limits.email:
+            try:
+                job['sent'] = await self.limits.deadlines.run(
+                    'send', self.email_service.send_message(job['message'], idempotency_key=key)
+                )
+            except TimeoutError as e:
+                # Met de idempotency key levert een latere resume geen dubbele email op
+                print(f"  ⏱️  {e}")
+                job['sent'] = False
+        if job['sent']:
+            await self._mark(job, 'sent')
+        return True
+    
+    async def _persist(self, job: dict) -> bool:
+        customer = job['customer']
+        if not self._done(job, 'persisted'):
+            try:
+                await self.writer.add(
+                    customer_id=customer['id'],
+                    week_start=job['week_start'],
+                    week_end=job['week_end'],
+                    data=job['data'],
+                    analysis=job['analysis'],
+                    sent=job['sent'],
+                    source=job.get('source')
+                )
+            except Exception as e:
+                # Mislukte auto-flush: de rijen blijven gebufferd voor de laatste
+                # flush, en of de email verstuurd is hangt er niet van af
+                print(f"  ❌ Failed to save snapshots/reports: {e}")
+        if job['sent']:
+            print(f"  ✅ Report sent to {customer['email']}")
+        else:
+            print(f"  ❌ Failed to send report")
+        return True
@@ -2,44 +2,88 @@
 GripAI - Database Service (Supabase)
 """
 
+import asyncio
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
-from supabase import create_client, Client
+from typing import Callable, Optional
+
+from analysis.trends import METRICS, WINDOWS, TrendState
+from services.metrics import get_metrics
 
 
 class Database:
-    """Supabase database service voor GripAI."""
+    """
+    Supabase database service voor GripAI.
+    
+    De supabase Client is synchroon; queries draaien daarom in een begrensde
+    thread pool zodat de event loop vrij blijft. De Client (en zijn HTTP
+    verbindingen) wordt hergebruikt voor alle queries.
+    """
     
-    def __init__(self):
+    def __init__(self, pool_size: int | None = None, timeout: float | None = None, batch_size: int | None = None):
+        """
+        Args:
+            pool_size: Max gelijktijdige queries (default env DB_POOL_SIZE of 10)
+            timeout: Timeout per query in seconden (default env DB_TIMEOUT of 30)
+            batch_size: Rijen/ids per bulk query (default env DB_BATCH_SIZE of 200)
+        """
         url = os.getenv('SUPABASE_URL')
         key = os.getenv('SUPABASE_KEY')
         
         if not url or not key:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY required")
         
-        self.client: Client = create_client(url, key)
+        # Pas hier importeren: supabase laden kost honderden ms bij elke cold start
+        from supabase import create_client, Client, ClientOptions
+        
+        pool_size = pool_size or int(os.getenv('DB_POOL_SIZE', '10'))
+        timeout = timeout or float(os.getenv('DB_TIMEOUT', '30'))
+        self.batch_size = batch_size or int(os.getenv('DB_BATCH_SIZE', '200'))
+        
+        self.client: Client = create_client(
+            url, key, options=ClientOptions(postgrest_client_timeout=timeout)
+        )
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='db')
+    
+    async def _execute(self, query, op: str = 'query'):
+        """
+        Voer een supabase query uit in de thread pool.
+        
+        Args:
+            op: Naam voor de metrics, bv. 'customers.select'
+        """
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        async with metrics.timed('request', service='supabase', op=op):
+            response = await loop.run_in_executor(self._executor, query.execute)
+        metrics.inc('requests', service='supabase', op=op)
+        return response
+    
+    def close(self):
+        """Stop de thread pool (wacht op lopende queries)."""
+        self._executor.shutdown(wait=True)
     
     async def get_active_customers(self) -> list[dict]:
         """Haal alle actieve klanten op."""
-        response = self.client.table('customers').select('*').eq('active', True).execute()
+        response = await self._execute(self.client.table('customers').select('*').eq('active', True), 'customers.select')
         return response.data
     
     async def get_customer(self, customer_id: str) -> Optional[dict]:
         """Haal specifieke klant op."""
-        response = self.client.table('customers').select('*').eq('id', customer_id).single().execute()
+        response = await self._execute(self.client.table('customers').select('*').eq('id', customer_id).single(), 'customers.select')
         return response.data
     
     async def get_previous_snapshot(self, customer_id: str) -> Optional[dict]:
         """Haal meest recente snapshot op voor vergelijking."""
-        response = (
+        response = await self._execute(
             self.client.table('weekly_snapshots')
             .select('*')
             .eq('customer_id', customer_id)
             .order('week_end', desc=True)
-            .limit(1)
-            .execute()
+            .limit(1),
+            'weekly_snapshots.select'
         )
         
         if response.data:
@@ -50,6 +94,30 @@ class Database:
         
         return None
     
+    async def get_previous_snapshots(self, customer_ids: list[str]) -> dict[str, dict]:
+        """
+        Haal de meest recente snapshot op voor een lijst klanten.
+        
+        Leest uit de view latest_snapshots (één rij per klant), met alleen
+        customer_id en raw_data, in chunks van batch_size ids per query.
+        
+        Returns:
+            Dict van customer_id naar raw_data; klanten zonder snapshot ontbreken.
+        """
+        previous = {}
+        for i in range(0, len(customer_ids), self.batch_size):
+            response = await self._execute(
+                self.client.table('latest_snapshots')
+                .select('customer_id', 'raw_data')
+                .in_('customer_id', customer_ids[i:i + self.batch_size]),
+                'latest_snapshots.select'
+            )
+            for row in response.data:
+                if row.get('raw_data'):
+                    previous[row['customer_id']] = row['raw_data']
+        
+        return previous
+    
     async def save_snapshot(
         self,
         customer_id: str,
@@ -58,7 +126,206 @@ class Database:
         data: dict
     ) -> str:
         """Sla weekdata snapshot op."""
-        response = self.client.table('weekly_snapshots').insert({
+        row = self._snapshot_row(customer_id, week_start, week_end, data)
+        response = await self._execute(self.client.table('weekly_snapshots').insert(row), 'weekly_snapshots.insert')
+        await self._update_trends([row])
+        
+        return response.data[0]['id']
+    
+    async def save_snapshots(
+        self,
+        snapshots: list[dict],
+        on_chunk: Callable[[int, list[str]], None] | None = None
+    ) -> list[str]:
+        """
+        Sla meerdere snapshots op in bulk inserts.
+        
+        Args:
+            snapshots: Dicts met customer_id, week_start, week_end en data
+            on_chunk: Optionele callback (start index, ids) per ingevoegde chunk,
+                      zodat de aanroeper de ids al heeft als een latere chunk faalt
+        
+        Returns:
+            Snapshot ids in dezelfde volgorde als de input.
+        """
+        rows = [
+            self._snapshot_row(s['customer_id'], s['week_start'], s['week_end'], s['data'])
+            for s in snapshots
+        ]
+        inserted = 0
+        
+        def chunk_done(start: int, ids: list[str]):
+            nonlocal inserted
+            inserted = start + len(ids)
+            if on_chunk:
+                on_chunk(start, ids)
+        
+        try:
+            return await self._insert_many('weekly_snapshots', rows, chunk_done)
+        finally:
+            # Ook bij een mislukte chunk: trends bijwerken voor wat er wél in staat
+            if inserted:
+                await self._update_trends(rows[:inserted])
+    
+    async def save_report(
+        self,
+        customer_id: str,
+        snapshot_id: str,
+        analysis: str,
+        sent: bool,
+        source: str | None = None
+    ) -> str:
+        """Sla gegenereerd rapport op (source: 'rules', 'cache' of 'claude')."""
+        response = await self._execute(self.client.table('reports').insert(
+            self._report_row(customer_id, snapshot_id, analysis, sent, source)
+        ), 'reports.insert')
+        
+        return response.data[0]['id']
+    
+    async def save_reports(self, reports: list[dict]) -> list[str]:
+        """
+        Sla meerdere rapporten op in bulk inserts.
+        
+        Args:
+            reports: Dicts met customer_id, snapshot_id, analysis, sent en optioneel source
+        
+        Returns:
+            Rapport ids in dezelfde volgorde als de input.
+        """
+        rows = [
+            self._report_row(r['customer_id'], r['snapshot_id'], r['analysis'], r['sent'], r.get('source'))
+            for r in reports
+        ]
+        return await self._insert_many('reports', rows)
+    
+    async def get_run_ledger(self, week_start: str, customer_ids: list[str]) -> list[dict]:
+        """Haal run voortgang op voor een week (zie RunLedger)."""
+        rows = []
+        for i in range(0, len(customer_ids), self.batch_size):
+            response = await self._execute(
+                self.client.table('report_runs')
+                .select('customer_id', 'stages', 'weekly_data', 'analysis', 'batch_key', 'snapshot_id')
+                .eq('week_start', week_start)
+                .in_('customer_id', customer_ids[i:i + self.batch_size]),
+                'report_runs.select'
+            )
+            rows.extend(response.data)
+        return rows
+    
+    async def upsert_run_ledger(self, rows: list[dict]):
+        """Schrijf run voortgang weg, één rij per (customer_id, week_start)."""
+        for i in range(0, len(rows), self.batch_size):
+            await self._execute(
+                self.client.table('report_runs')
+                .upsert(rows[i:i + self.batch_size], on_conflict='customer_id,week_start', returning='minimal'),
+                'report_runs.upsert'
+            )
+    
+    async def get_trends(self, customer_ids: list[str]) -> dict[str, dict]:
+        """
+        Haal de trend aggregaten op voor een lijst klanten (zie analysis/trends.py).
+        
+        Returns:
+            Dict van customer_id naar aggregaten; klanten zonder historie ontbreken.
+        """
+        rows = await self._get_trend_rows(customer_ids, 'aggregates')
+        return {row['customer_id']: row['aggregates'] for row in rows if row.get('aggregates')}
+    
+    async def _get_trend_rows(self, customer_ids: list[str], column: str) -> list[dict]:
+        rows = []
+        for i in range(0, len(customer_ids), self.batch_size):
+            response = await self._execute(
+                self.client.table('customer_trends')
+                .select('customer_id', column)
+                .in_('customer_id', customer_ids[i:i + self.batch_size]),
+                'customer_trends.select'
+            )
+            rows.extend(response.data)
+        return rows
+    
+    async def _update_trends(self, rows: list[dict]):
+        """
+        Werk de trend state bij met nieuwe snapshot rijen: O(1) per week.
+        
+        Een week van vóór de laatst verwerkte (backfill) laat de state
+        opnieuw opbouwen uit weekly_snapshots. Best effort: een fout hier
+        mag het opslaan van de snapshot niet laten falen.
+        """
+        try:
+            by_customer: dict[str, list[dict]] = {}
+            for row in sorted(rows, key=lambda r: r['week_start']):
+                by_customer.setdefault(row['customer_id'], []).append(row)
+            
+            states = {
+                row['customer_id']: TrendState.from_dict(row.get('state'))
+                for row in await self._get_trend_rows(list(by_customer), 'state')
+            }
+            for customer_id, weeks in by_customer.items():
+                state = states.setdefault(customer_id, TrendState())
+                if not all([state.update(row['week_start'], row) for row in weeks]):
+                    states[customer_id] = await self._rebuild_trend(customer_id)
+            
+            upserts = [
+                {
+                    'customer_id': customer_id,
+                    'last_week': state.week,
+                    'state': state.to_dict(),
+                    'aggregates': state.aggregates(),
+                    'updated_at': datetime.now().isoformat()
+                }
+                for customer_id, state in states.items()
+            ]
+            for i in range(0, len(upserts), self.batch_size):
+                await self._execute(
+                    self.client.table('customer_trends')
+                    .upsert(upserts[i:i + self.batch_size], on_conflict='customer_id', returning='minimal'),
+                    'customer_trends.upsert'
+                )
+        except Exception as e:
+            print(f"⚠️  Trends bijwerken mislukt: {e}")
+    
+    async def _rebuild_trend(self, customer_id: str) -> TrendState:
+        """Bouw de trend state opnieuw op uit de laatste 52 weken snapshots (per week de nieuwste)."""
+        response = await self._execute(
+            self.client.table('weekly_snapshots')
+            .select('week_start', *METRICS)
+            .eq('customer_id', customer_id)
+            .order('week_start', desc=True)
+            .order('created_at', desc=True)
+            .limit(4 * WINDOWS[-1]),
+            'weekly_snapshots.select'
+        )
+        latest: dict[str, dict] = {}
+        for row in response.data:
+            if row['week_start'] not in latest and len(latest) < WINDOWS[-1]:
+                latest[row['week_start']] = row
+        
+        state = TrendState()
+        for week in sorted(latest):
+            state.update(week, latest[week])
+        return state
+    
+    async def _insert_many(
+        self,
+        table: str,
+        rows: list[dict],
+        on_chunk: Callable[[int, list[str]], None] | None = None
+    ) -> list[str]:
+        """Insert rijen in chunks van batch_size; return alleen de ids (ook per chunk via on_chunk)."""
+        ids = []
+        for i in range(0, len(rows), self.batch_size):
+            response = await self._execute(
+                self.client.table(table).insert(rows[i:i + self.batch_size]).select('id'),
+                f'{table}.insert'
+            )
+            chunk_ids = [row['id'] for row in response.data]
+            if on_chunk:
+                on_chunk(i, chunk_ids)
+            ids.extend(chunk_ids)
+        return ids
+    
+    def _snapshot_row(self, customer_id: str, week_start: datetime, week_end: datetime, data: dict) -> dict:
+        return {
             'customer_id': customer_id,
             'week_start': week_start.strftime('%Y-%m-%d'),
             'week_end': week_end.strftime('%Y-%m-%d'),
@@ -68,26 +335,16 @@ class Database:
             'invoices_paid': data.get('invoices_paid', 0),
             'outstanding_amount': data.get('outstanding_total', 0),
             'raw_data': data
-        }).execute()
-        
-        return response.data[0]['id']
+        }
     
-    async def save_report(
-        self,
-        customer_id: str,
-        snapshot_id: str,
-        analysis: str,
-        sent: bool
-    ) -> str:
-        """Sla gegenereerd rapport op."""
-        response = self.client.table('reports').insert({
+    def _report_row(self, customer_id: str, snapshot_id: str, analysis: str, sent: bool, source: str | None = None) -> dict:
+        return {
             'customer_id': customer_id,
             'snapshot_id': snapshot_id,
             'ai_analysis': analysis,
+            'analysis_source': source,
             'sent_at': datetime.now().isoformat() if sent else None
-        }).execute()
-        
-        return response.data[0]['id']
+        }
     
     async def create_customer(
         self,
@@ -98,12 +355,112 @@ class Database:
         accounting_credentials: dict
     ) -> str:
         """Maak nieuwe klant aan."""
-        response = self.client.table('customers').insert({
+        response = await self._execute(self.client.table('customers').insert({
             'name': name,
             'email': email,
             'company_name': company_name,
             'accounting_system': accounting_system,
             'accounting_credentials': accounting_credentials
-        }).execute()
+        }), 'customers.insert')
         
         return response.data[0]['id']
+
+
+class ReportWriter:
+    """
+    Buffert snapshot + rapport per klant en schrijft ze in bulk weg.
+    
+    Bij flush gaan eerst de snapshots erin (voor de ids), daarna de
+    rapporten die ernaar verwijzen.
+    """
+    
+    def __init__(self, db: Database, flush_size: int | None = None, ledger=None):
+        """
+        Args:
+            db: Database service
+            flush_size: Aantal klanten per flush (default db.batch_size)
+            ledger: Optionele RunLedger; opgeslagen snapshots worden als 'snapshot'
+                    (met snapshot_id) en na een flush als 'persisted' gemarkeerd.
+                    Bij resume hergebruikt de writer een eerder opgeslagen snapshot.
+        """
+        self.db = db
+        self.flush_size = flush_size or db.batch_size
+        self.ledger = ledger
+        self._pending: list[dict] = []
+        self._lock = asyncio.Lock()
+    
+    async def add(
+        self,
+        customer_id: str,
+        week_start: datetime,
+        week_end: datetime,
+        data: dict,
+        analysis: str,
+        sent: bool,
+        source: str | None = None
+    ):
+        """Voeg een klantresultaat toe; flusht automatisch als de buffer vol is."""
+        item = {
+            'customer_id': customer_id,
+            'week_start': week_start,
+            'week_end': week_end,
+            'data': data,
+            'analysis': analysis,
+            'sent': sent,
+            'source': source
+        }
+        if self.ledger is not None and self.ledger.done(customer_id, 'snapshot'):
+            item['snapshot_id'] = self.ledger.get(customer_id, 'snapshot_id')
+        self._pending.append(item)
+        if len(self._pending) >= self.flush_size:
+            await self.flush()
+    
+    @property
+    def unsaved(self) -> int:
+        """Aantal klantresultaten dat nog niet weggeschreven is."""
+        return len(self._pending)
+    
+    async def flush(self):
+        """
+        Schrijf alle gebufferde snapshots en rapporten weg.
+        
+        Bij een fout blijft de buffer staan, met de snapshot ids van de chunks
+        die al wel ingevoegd waren, zodat een volgende flush het opnieuw
+        probeert zonder dubbele snapshots.
+        """
+        async with self._lock:
+            pending = list(self._pending)
+            if not pending:
+                return
+            
+            new = [item for item in pending if 'snapshot_id' not in item]
+            if new:
+                def assign(start: int, ids: list[str]):
+                    for item, snapshot_id in zip(new[start:start + len(ids)], ids):
+                        item['snapshot_id'] = snapshot_id
+                
+                try:
+                    await self.db.save_snapshots(new, on_chunk=assign)
+                finally:
+                    if self.ledger:
+                        # Direct vastleggen, ook na een mislukte chunk: crasht de run
+                        # vóór save_reports, dan hergebruikt --resume deze snapshots
+                        # in plaats van ze opnieuw in te voegen
+                        for item in new:
+                            if 'snapshot_id' in item:
+                                await self.ledger.mark(item['customer_id'], 'snapshot', snapshot_id=item['snapshot_id'])
+                        await self.ledger.flush()
+            await self.db.save_reports([
+                {
+                    'customer_id': item['customer_id'],
+                    'snapshot_id': item['snapshot_id'],
+                    'analysis': item['analysis'],
+                    'sent': item['sent'],
+                    'source': item['source']
+                }
+                for item in pending
+            ])
+            del self._pending[:len(pending)]
+            
+            if self.ledger:
+                await self.ledger.mark_many([item['customer_id'] for item in pending], 'persisted')
@@ -2,30 +2,106 @@
 GripAI - Email Service (Resend)
 """
 
+import asyncio
+import hashlib
 import os
 from datetime import datetime
-from pathlib import Path
-from jinja2 import Template
-import resend
 
+from services.metrics import get_metrics
+from services.rendering import ReportRenderer, format_week_period
 
-class EmailService:
-    """Email verzending via Resend."""
+
+class ResendTransport:
+    """Verzending via de Resend API (synchroon; EmailService draait dit in een thread)."""
     
     def __init__(self):
+        import resend
         resend.api_key = os.getenv('RESEND_API_KEY')
-        self.from_email = os.getenv('FROM_EMAIL', 'rapport@gripai.nl')
-        self.template = self._load_template()
+        self.resend = resend
     
-    def _load_template(self) -> Template:
-        """Laad email template."""
-        template_path = Path(__file__).parent.parent / 'templates' / 'report.html'
-        
-        if template_path.exists():
-            return Template(template_path.read_text())
+    def send(self, message: dict, idempotency_key: str | None = None):
+        options = {'idempotency_key': idempotency_key} if idempotency_key else None
+        return self.resend.Emails.send(message, options)
+    
+    def send_batch(self, messages: list[dict], idempotency_key: str | None = None) -> list[str | None]:
+        """
+        Verstuur max 100 emails in één request.
         
-        # Fallback inline template
-        return Template(self._get_default_template())
+        Returns:
+            Per bericht de foutmelding, of None als het geaccepteerd is.
+        """
+        options = {'batch_validation': 'permissive'}
+        if idempotency_key:
+            options['idempotency_key'] = idempotency_key
+        response = self.resend.Batch.send(messages, options)
+        errors = [None] * len(messages)
+        for error in response.get('errors') or []:
+            errors[error['index']] = error['message']
+        return errors
+
+
+class LocalEmailTransport:
+    """
+    Lokale stand-in voor Resend, voor tests en offline runs.
+    
+    Bewaart verzonden berichten in self.sent; adressen in fail_addresses
+    worden geweigerd. Een herhaalde idempotency key verstuurt niets opnieuw,
+    net als bij Resend.
+    """
+    
+    def __init__(self, fail_addresses: set[str] | None = None):
+        self.fail_addresses = fail_addresses or set()
+        self.sent: list[dict] = []
+        self.requests = 0
+        self.idempotency_keys: dict[str, object] = {}
+    
+    def send(self, message: dict, idempotency_key: str | None = None):
+        self.requests += 1
+        if idempotency_key in self.idempotency_keys:
+            return self.idempotency_keys[idempotency_key]
+        if set(message['to']) & self.fail_addresses:
+            raise ValueError(f"Rejected recipient {message['to']}")
+        self.sent.append(message)
+        response = {'id': f"local_{len(self.sent)}"}
+        if idempotency_key:
+            self.idempotency_keys[idempotency_key] = response
+        return response
+    
+    def send_batch(self, messages: list[dict], idempotency_key: str | None = None) -> list[str | None]:
+        self.requests += 1
+        if idempotency_key in self.idempotency_keys:
+            return self.idempotency_keys[idempotency_key]
+        errors = []
+        for message in messages:
+            if set(message['to']) & self.fail_addresses:
+                errors.append(f"Rejected recipient {message['to']}")
+            else:
+                self.sent.append(message)
+                errors.append(None)
+        if idempotency_key:
+            self.idempotency_keys[idempotency_key] = errors
+        return errors
+
+
+class EmailService:
+    """Email verzending via Resend."""
+    
+    # Resend batch endpoint accepteert max 100 emails per request
+    BATCH_SIZE = 100
+    
+    def __init__(self, transport=None, batch_concurrency: int | None = None, renderer: ReportRenderer | None = None):
+        """
+        Args:
+            transport: ResendTransport (default) of LocalEmailTransport
+            batch_concurrency: Max gelijktijdige batch requests (default env EMAIL_BATCH_CONCURRENCY of 2)
+            renderer: Rapport renderer (default ReportRenderer)
+        """
+        self.transport = transport or ResendTransport()
+        self.from_email = os.getenv('FROM_EMAIL', 'rapport@gripai.nl')
+        self.renderer = renderer or ReportRenderer()
+        self.batch_limiter = asyncio.Semaphore(
+            batch_concurrency or int(os.getenv('EMAIL_BATCH_CONCURRENCY', '2'))
+        )
     
     async def send_report(
         self,
@@ -38,94 +114,117 @@ class EmailService:
     ) -> bool:
         """Verstuur weekrapport email."""
         
-        week_str = f"{week_start.strftime('%d %b')} - {week_end.strftime('%d %b %Y')}"
-        
-        # Render HTML
-        html = self.template.render(
-            company_name=company_name,
-            week_period=week_str,
-            analysis=analysis,
-            revenue=f"€{data.get('revenue', 0):,.2f}",
-            costs=f"€{data.get('costs', 0):,.2f}",
-            profit=f"€{data.get('profit', 0):,.2f}",
-            invoices_sent=data.get('invoices_sent', 0),
-            invoices_paid=data.get('invoices_paid', 0),
-            outstanding=f"€{data.get('outstanding_total', 0):,.2f}",
-            outstanding_overdue=f"€{data.get('outstanding_overdue', 0):,.2f}",
-            year=datetime.now().year
-        )
+        message = self._build_message(to_email, company_name, analysis, data, week_start, week_end)
+        return await self.send_message(message)
+    
+    async def send_message(self, message: dict, idempotency_key: str | None = None) -> bool:
+        """
+        Verstuur een al gerenderd bericht (zie _build_message).
         
+        Met een idempotency_key levert een herhaalde send met dezelfde sleutel
+        geen tweede email op.
+        """
+        metrics = get_metrics()
         try:
-            resend.Emails.send({
-                "from": f"GripAI <{self.from_email}>",
-                "to": [to_email],
-                "subject": f"Weekrapport {company_name} | {week_str}",
-                "html": html
-            })
-            return True
+            async with metrics.timed('request', service='resend', op='send'):
+                await asyncio.to_thread(self.transport.send, message, idempotency_key)
         except Exception as e:
             print(f"Email error: {e}")
             return False
+        metrics.inc('requests', service='resend', op='send')
+        metrics.inc('bytes', len(message['html']), service='resend', direction='out')
+        return True
+    
+    async def send_reports_batch(self, reports: list[dict]) -> list[bool]:
+        """
+        Verstuur veel rapporten via het Resend batch endpoint.
+        
+        Args:
+            reports: Dicts met dezelfde velden als send_report
+                     (to_email, company_name, analysis, data, week_start, week_end),
+                     plus optioneel idempotency_key en batch_key. Rapporten met
+                     dezelfde batch_key gaan samen in één request met die sleutel.
+        
+        Returns:
+            Per rapport True als het verstuurd is, in dezelfde volgorde.
+        """
+        htmls = await asyncio.to_thread(self.renderer.render_many, [
+            {k: report[k] for k in ('company_name', 'analysis', 'data', 'week_start', 'week_end')}
+            for report in reports
+        ])
+        messages = [
+            self._message(report['to_email'], report['company_name'], report['week_start'], report['week_end'], html)
+            for report, html in zip(reports, htmls)
+        ]
+        results = [False] * len(reports)
+        chunks = self._chunks(reports)
+        sent = await asyncio.gather(*(
+            self._send_chunk([messages[i] for i in indexes], batch_key) for batch_key, indexes in chunks
+        ))
+        for (_, indexes), chunk_result in zip(chunks, sent):
+            for i, ok in zip(indexes, chunk_result):
+                results[i] = ok
+        return results
+    
+    @staticmethod
+    def batch_key(keys: list[str | None]) -> str | None:
+        """Batch sleutel afgeleid van de sleutels per bericht: zelfde chunk, zelfde sleutel."""
+        if keys and all(keys):
+            return hashlib.sha256('\n'.join(keys).encode()).hexdigest()
+        return None
+    
+    def _chunks(self, reports: list[dict]) -> list[tuple[str | None, list[int]]]:
+        # Rapporten met een vastgelegde batch_key gaan samen met die sleutel;
+        # de rest per BATCH_SIZE met een sleutel uit hun idempotency keys
+        grouped: dict[str, list[int]] = {}
+        loose = []
+        for i, report in enumerate(reports):
+            if report.get('batch_key'):
+                grouped.setdefault(report['batch_key'], []).append(i)
+            else:
+                loose.append(i)
+        chunks = list(grouped.items())
+        for start in range(0, len(loose), self.BATCH_SIZE):
+            indexes = loose[start:start + self.BATCH_SIZE]
+            chunks.append((self.batch_key([reports[i].get('idempotency_key') for i in indexes]), indexes))
+        return chunks
+    
+    async def _send_chunk(self, messages: list[dict], batch_key: str | None) -> list[bool]:
+        metrics = get_metrics()
+        async with self.batch_limiter:
+            try:
+                async with metrics.timed('request', service='resend', op='batch'):
+                    errors = await asyncio.to_thread(self.transport.send_batch, messages, batch_key)
+            except Exception as e:
+                print(f"Email batch error ({len(messages)} emails): {e}")
+                return [False] * len(messages)
+        
+        metrics.inc('requests', service='resend', op='batch')
+        metrics.inc('bytes', sum(len(message['html']) for message in messages), service='resend', direction='out')
+        metrics.inc('emails_failed', sum(1 for error in errors if error))
+        
+        for message, error in zip(messages, errors):
+            if error:
+                print(f"Email error for {message['to'][0]}: {error}")
+        return [error is None for error in errors]
+    
+    def _build_message(
+        self,
+        to_email: str,
+        company_name: str,
+        analysis: str,
+        data: dict,
+        week_start: datetime,
+        week_end: datetime
+    ) -> dict:
+        """Render het rapport tot een Resend bericht."""
+        html = self.renderer.render(company_name, analysis, data, week_start, week_end)
+        return self._message(to_email, company_name, week_start, week_end, html)
     
-    def _get_default_template(self) -> str:
-        return '''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Weekrapport {{ company_name }}</title>
-</head>
-<body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: #1a1a1a; max-width: 600px; margin: 0 auto; padding: 20px;">
-    
-    <div style="border-bottom: 2px solid #1a1a1a; padding-bottom: 20px; margin-bottom: 30px;">
-        <h1 style="margin: 0; font-size: 24px; font-weight: 600;">Weekrapport</h1>
-        <p style="margin: 5px 0 0 0; color: #666;">{{ company_name }} | {{ week_period }}</p>
-    </div>
-    
-    <div style="background: #f8f9fa; border-radius: 8px; padding: 20px; margin-bottom: 30px;">
-        <div style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 15px;">
-            <div>
-                <p style="margin: 0; color: #666; font-size: 12px; text-transform: uppercase;">Omzet</p>
-                <p style="margin: 5px 0 0 0; font-size: 20px; font-weight: 600;">{{ revenue }}</p>
-            </div>
-            <div>
-                <p style="margin: 0; color: #666; font-size: 12px; text-transform: uppercase;">Winst</p>
-                <p style="margin: 5px 0 0 0; font-size: 20px; font-weight: 600;">{{ profit }}</p>
-            </div>
-            <div>
-                <p style="margin: 0; color: #666; font-size: 12px; text-transform: uppercase;">Facturen verzonden</p>
-                <p style="margin: 5px 0 0 0; font-size: 20px; font-weight: 600;">{{ invoices_sent }}</p>
-            </div>
-            <div>
-                <p style="margin: 0; color: #666; font-size: 12px; text-transform: uppercase;">Facturen betaald</p>
-                <p style="margin: 5px 0 0 0; font-size: 20px; font-weight: 600;">{{ invoices_paid }}</p>
-            </div>
-        </div>
-    </div>
-    
-    <div style="margin-bottom: 30px;">
-        <h2 style="font-size: 16px; font-weight: 600; margin: 0 0 15px 0;">Analyse</h2>
-        <div style="color: #333;">
-            {{ analysis | replace('\n\n', '</p><p style="margin: 15px 0;">') | replace('\n', '<br>') | safe }}
-        </div>
-    </div>
-    
-    <div style="background: #fff3cd; border-radius: 8px; padding: 15px; margin-bottom: 30px;">
-        <p style="margin: 0; font-size: 14px;">
-            <strong>Openstaand:</strong> {{ outstanding }}<br>
-            <strong>Waarvan verlopen:</strong> {{ outstanding_overdue }}
-        </p>
-    </div>
-    
-    <div style="border-top: 1px solid #eee; padding-top: 20px; color: #666; font-size: 12px;">
-        <p style="margin: 0;">
-            Dit rapport is automatisch gegenereerd door GripAI.<br>
-            Vragen? Mail naar support@gripai.nl
-        </p>
-        <p style="margin: 15px 0 0 0;">
-            &copy; {{ year }} GripAI. Grip op uw bedrijf.
-        </p>
-    </div>
-    
-</body>
-</html>'''
+    def _message(self, to_email: str, company_name: str, week_start: datetime, week_end: datetime, html: str) -> dict:
+        return {
+            "from": f"GripAI <{self.from_email}>",
+            "to": [to_email],
+            "subject": f"Weekrapport {company_name} | {format_week_period(week_start, week_end)}",
+            "html": html
+        }
@@ -0,0 +1,111 @@
+"""
+GripAI - Run ledger voor hervatbare weekruns
+Houdt per (klant, week) bij welke stages klaar zijn, met de opgehaalde data
+en de analyse, zodat een herstart na een crash alleen het resterende werk
+doet en geen dubbele snapshots of emails oplevert.
+"""
+
+from datetime import datetime
+
+
+class RunLedger:
+    """Voortgang per (customer_id, week_start) in de Supabase tabel report_runs."""
+    
+    STAGES = ('fetched', 'analyzed', 'queued', 'sent', 'snapshot', 'persisted')
+    
+    def __init__(self, db, week_start: datetime, resume: bool = False, flush_size: int | None = None):
+        """
+        Args:
+            db: Database service
+            week_start: Maandag van de rapportweek
+            resume: Sla stages over die in een eerdere run al klaar waren
+            flush_size: Aantal gewijzigde klanten per upsert (default db.batch_size)
+        """
+        self.db = db
+        self.week_start = week_start.strftime('%Y-%m-%d')
+        self.resume = resume
+        self.flush_size = flush_size or db.batch_size
+        self.entries: dict[str, dict] = {}
+        self._loaded: set[str] = set()
+        self._dirty: set[str] = set()
+    
+    async def load(self, customer_ids: list[str]):
+        """Laad bestaande voortgang voor deze week."""
+        for row in await self.db.get_run_ledger(self.week_start, customer_ids):
+            row['stages'] = set(row.get('stages') or [])
+            self.entries[row['customer_id']] = row
+            self._loaded.add(row['customer_id'])
+    
+    def done(self, customer_id: str, stage: str) -> bool:
+        """True als de stage in een eerdere run klaar was en we hervatten."""
+        return self.resume and stage in self.entries.get(customer_id, {}).get('stages', set())
+    
+    def attempted(self, customer_id: str) -> bool:
+        """True als een eerdere run deze week de klant al had opgepakt (ook zonder resume)."""
+        return customer_id in self._loaded
+    
+    def get(self, customer_id: str, field: str):
+        return self.entries.get(customer_id, {}).get(field)
+    
+    async def mark(self, customer_id: str, stage: str, **fields):
+        """
+        Markeer een stage als klaar, met optionele data (weekly_data, analysis, batch_key, snapshot_id).
+        
+        Marks worden gebufferd en per flush_size klanten in één upsert
+        weggeschreven; roep flush() aan het eind van de run aan.
+        """
+        self._check(stage)
+        entry = self._entry(customer_id)
+        entry['stages'].add(stage)
+        entry.update(fields)
+        self._dirty.add(customer_id)
+        if len(self._dirty) >= self.flush_size:
+            await self.flush()
+    
+    async def mark_many(self, customer_ids: list[str], stage: str):
+        """Markeer dezelfde stage voor meerdere klanten (gebufferd, zie mark)."""
+        self._check(stage)
+        for customer_id in customer_ids:
+            self._entry(customer_id)['stages'].add(stage)
+            self._dirty.add(customer_id)
+        if len(self._dirty) >= self.flush_size:
+            await self.flush()
+    
+    async def flush(self):
+        """Schrijf alle gebufferde marks weg in één upsert."""
+        dirty, self._dirty = self._dirty, set()
+        if dirty:
+            await self._write([self._row(self.entries[customer_id]) for customer_id in dirty])
+    
+    def idempotency_key(self, customer_id: str) -> str:
+        """Vaste sleutel per klant en week, zodat een herhaalde send geen tweede email wordt."""
+        return f"weekrapport-{customer_id}-{self.week_start}"
+    
+    async def _write(self, rows: list[dict]):
+        # Ledger is best effort: een mislukte write mag de run niet stoppen,
+        # de idempotency key voorkomt alsnog een dubbele email
+        try:
+            await self.db.upsert_run_ledger(rows)
+        except Exception as e:
+            print(f"  ⚠️  Failed to update run ledger: {e}")
+    
+    def _check(self, stage: str):
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown ledger stage: {stage}")
+    
+    def _entry(self, customer_id: str) -> dict:
+        if customer_id not in self.entries:
+            self.entries[customer_id] = {'customer_id': customer_id, 'stages': set()}
+        return self.entries[customer_id]
+    
+    def _row(self, entry: dict) -> dict:
+        return {
+            'customer_id': entry['customer_id'],
+            'week_start': self.week_start,
+            'stages': sorted(entry['stages']),
+            'weekly_data': entry.get('weekly_data'),
+            'analysis': entry.get('analysis'),
+            'batch_key': entry.get('batch_key'),
+            'snapshot_id': entry.get('snapshot_id'),
+            'updated_at': datetime.now().isoformat()
+        }
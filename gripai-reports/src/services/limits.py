@@ -0,0 +1,80 @@
+"""
+GripAI - Concurrency limits en deadlines per externe dienst
+"""
+
+import asyncio
+import os
+from typing import Awaitable
+
+from services.metrics import get_metrics
+
+
+class StageLimits:
+    """Aparte semaphores voor boekhoud-API, Claude en email, gedeeld over alle klanten."""
+    
+    def __init__(
+        self,
+        accounting: int | None = None,
+        llm: int | None = None,
+        email: int | None = None,
+        deadlines: 'StageDeadlines | None' = None
+    ):
+        """
+        Args:
+            accounting: Max gelijktijdige boekhoud-fetches (default env ACCOUNTING_CONCURRENCY of 8)
+            llm: Max gelijktijdige Claude calls (default env LLM_CONCURRENCY of 4)
+            email: Max gelijktijdige email verzendingen (default env EMAIL_CONCURRENCY of 4)
+            deadlines: Deadlines per stage (default StageDeadlines uit env)
+        """
+        self.accounting = asyncio.Semaphore(accounting or int(os.getenv('ACCOUNTING_CONCURRENCY', '8')))
+        self.llm = asyncio.Semaphore(llm or int(os.getenv('LLM_CONCURRENCY', '4')))
+        self.email = asyncio.Semaphore(email or int(os.getenv('EMAIL_CONCURRENCY', '4')))
+        self.deadlines = deadlines or StageDeadlines()
+
+
+class StageDeadlines:
+    """
+    Max seconden per stage voor één klant, zodat één trage upstream de run
+    niet ophoudt. Wachten op een slot (StageLimits) telt niet mee; 0 zet
+    een deadline uit.
+    """
+    
+    def __init__(
+        self,
+        fetch: float | None = None,
+        analyze: float | None = None,
+        fallback: float | None = None,
+        send: float | None = None
+    ):
+        """
+        Args:
+            fetch: Weekdata ophalen (default env DEADLINE_FETCH of 180)
+            analyze: Claude analyse met het primaire model (default env DEADLINE_ANALYZE of 60)
+            fallback: Analyse met het fallback model na een gemiste deadline (default env DEADLINE_FALLBACK of 20)
+            send: Email verzenden (default env DEADLINE_SEND of 30)
+        """
+        self.fetch = fetch if fetch is not None else float(os.getenv('DEADLINE_FETCH', '180'))
+        self.analyze = analyze if analyze is not None else float(os.getenv('DEADLINE_ANALYZE', '60'))
+        self.fallback = fallback if fallback is not None else float(os.getenv('DEADLINE_FALLBACK', '20'))
+        self.send = send if send is not None else float(os.getenv('DEADLINE_SEND', '30'))
+    
+    async def run(self, stage: str, awaitable: Awaitable):
+        """
+        Wacht op awaitable binnen de deadline van stage.
+        
+        Raises:
+            TimeoutError: als de deadline verstrijkt; de taak is dan geannuleerd.
+        """
+        seconds = getattr(self, stage)
+        if not seconds:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, seconds)
+        except asyncio.TimeoutError:
+            get_metrics().inc('deadline_exceeded', stage=stage)
+            raise TimeoutError(f"Deadline of {seconds:g}s exceeded for {stage}")
+    
+    def budget(self) -> float | None:
+        """Max seconden werk per klant over de stages met een deadline (zonder wachttijd); None als er een uit staat."""
+        stages = (self.fetch, self.analyze, self.fallback, self.send)
+        return sum(stages) if all(stages) else None
@@ -0,0 +1,311 @@
+"""
+GripAI - Run metrics
+Latency histogrammen, tellers en optionele trace spans voor een weekrun,
+per stage, per externe dienst en per klant. Aan het eind van de run
+weggeschreven als JSON samenvatting en Prometheus textfile.
+"""
+
+import contextvars
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+
+# Klant waar de huidige taak mee bezig is; gezet door de pipeline stages
+current_customer: contextvars.ContextVar[str | None] = contextvars.ContextVar('current_customer', default=None)
+
+# Histogram buckets in seconden, van een snelle DB query tot een trage Claude call
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+PREFIX = 'gripai'
+
+
+class Histogram:
+    """Cumulatieve latency buckets, som en aantal (Prometheus histogram)."""
+    
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+    
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+    
+    def quantile(self, q: float) -> float:
+        """Benadering van een kwantiel: bovengrens van de bucket waar hij in valt."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+    
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'avg': round(self.sum / self.count, 4) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 4)
+        }
+
+
+class Metrics:
+    """
+    Verzamelt metrics voor één run.
+    
+    Metrics hebben een naam en labels (bv. service='moneybird', op='GET').
+    Histogrammen meten seconden, tellers tellen requests, bytes, tokens en
+    fouten. Per klant wordt de tijd per stage bijgehouden.
+    """
+    
+    def __init__(self, trace: bool | None = None):
+        """
+        Args:
+            trace: Bewaar ook losse spans (default env METRICS_TRACE)
+        """
+        if trace is None:
+            trace = os.getenv('METRICS_TRACE', '').lower() in ('1', 'true', 'yes')
+        self.trace = trace
+        self.histograms: dict[tuple, Histogram] = {}
+        self.counters: dict[tuple, float] = {}
+        self.customers: dict[str, dict[str, float]] = {}
+        self.spans: list[dict] = []
+        self.started = time.time()
+        self._origin = time.monotonic()
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """Verhoog een teller."""
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name: str, seconds: float, **labels):
+        """Voeg een meting toe aan een latency histogram."""
+        key = _key(name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(seconds)
+    
+    def observe_customer(self, customer_id: str, stage: str, seconds: float):
+        """Tel de tijd van een stage op bij het totaal van een klant."""
+        stages = self.customers.setdefault(customer_id, {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+    
+    @asynccontextmanager
+    async def timed(self, name: str, **labels):
+        """
+        Meet de duur van een blok als histogram '<name>_seconds'.
+        
+        Een exception telt als fout in '<name>_errors' en wordt doorgegeven.
+        Met trace aan wordt het blok ook als span bewaard, met de huidige klant.
+        """
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            self.inc(f'{name}_errors', error=error, **labels)
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            self.observe(f'{name}_seconds', elapsed, **labels)
+            if self.trace:
+                self.spans.append({
+                    'name': name,
+                    'labels': labels,
+                    'customer': current_customer.get(),
+                    'start': started - self._origin,
+                    'seconds': elapsed,
+                    'error': error
+                })
+    
+    @asynccontextmanager
+    async def stage(self, stage: str, customer_id: str):
+        """
+        Meet een stage voor één klant: histogram 'stage_seconds', het totaal
+        per klant en 'stage_errors' bij een exception. Binnen het blok is de
+        klant de huidige klant voor trace spans.
+        """
+        token = current_customer.set(customer_id)
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            self.inc('stage_errors', stage=stage)
+            raise
+        finally:
+            current_customer.reset(token)
+            elapsed = time.monotonic() - started
+            self.observe('stage_seconds', elapsed, stage=stage)
+            self.observe_customer(customer_id, stage, elapsed)
+    
+    def customer_latency(self) -> dict:
+        """p50, p99 en max van de totale stage tijd per klant, in seconden."""
+        totals = sorted(sum(stages.values()) for stages in self.customers.values())
+        if not totals:
+            return {}
+        
+        def at(q: float) -> float:
+            return round(totals[min(len(totals) - 1, int(q * len(totals)))], 3)
+        
+        return {'p50': at(0.5), 'p99': at(0.99), 'max': round(totals[-1], 3)}
+    
+    def summary(self, extra: dict | None = None) -> dict:
+        """Alle metrics als JSON-serialiseerbare dict."""
+        return {
+            'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'seconds': round(time.time() - self.started, 3),
+            'histograms': [
+                {'name': name, 'labels': dict(labels), **histogram.summary()}
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ],
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            'customers': {
+                customer_id: {stage: round(seconds, 4) for stage, seconds in stages.items()}
+                for customer_id, stages in self.customers.items()
+            },
+            **(extra or {})
+        }
+    
+    def to_prometheus(self, const_labels: dict | None = None) -> str:
+        """
+        Metrics in het Prometheus text exposition formaat (zonder per-klant data).
+        
+        Args:
+            const_labels: Labels voor elke serie, bv. {'shard': '0/4'}
+        """
+        lines = []
+        typed = set()
+        const = tuple(sorted((const_labels or {}).items()))
+        
+        def header(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+        
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = f'{PREFIX}_{name}_total'
+            header(metric, 'counter')
+            lines.append(f'{metric}{_labels(const + labels)} {value:g}')
+        
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metric = f'{PREFIX}_{name}'
+            header(metric, 'histogram')
+            labels = const + labels
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{metric}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+            lines.append(f'{metric}_sum{_labels(labels)} {histogram.sum:.6f}')
+            lines.append(f'{metric}_count{_labels(labels)} {histogram.count}')
+        
+        metric = f'{PREFIX}_run_timestamp_seconds'
+        header(metric, 'gauge')
+        lines.append(f'{metric}{_labels(const)} {time.time():.0f}')
+        return '\n'.join(lines) + '\n'
+    
+    def write(
+        self,
+        out_dir: str | None = None,
+        week_start: datetime | None = None,
+        extra: dict | None = None,
+        shard: tuple[int, int] | None = None
+    ) -> list[str]:
+        """
+        Schrijf de run metrics weg.
+        
+        - run-<week>.json: samenvatting, per week te vergelijken
+        - gripai_reports.prom: Prometheus textfile (node_exporter textfile collector)
+        - trace-<week>.json: spans in Chrome trace formaat, alleen met trace aan
+        
+        Args:
+            out_dir: Map voor de bestanden (default env METRICS_DIR of .cache/metrics)
+            shard: (index, aantal) bij een gesharde run; bestanden krijgen een
+                   shard suffix en Prometheus series een shard label
+        
+        Returns:
+            Paden van de geschreven bestanden.
+        """
+        out_dir = out_dir or os.getenv('METRICS_DIR', '.cache/metrics')
+        os.makedirs(out_dir, exist_ok=True)
+        week = (week_start or datetime.now()).strftime('%Y-%m-%d')
+        suffix = f'-shard-{shard[0]}-of-{shard[1]}' if shard else ''
+        const_labels = {'shard': f'{shard[0]}/{shard[1]}'} if shard else None
+        
+        paths = [
+            _write_atomic(os.path.join(out_dir, f'run-{week}{suffix}.json'), json.dumps(self.summary(extra), indent=2, default=str)),
+            _write_atomic(os.path.join(out_dir, f'gripai_reports{suffix.replace("-", "_")}.prom'), self.to_prometheus(const_labels))
+        ]
+        if self.trace:
+            paths.append(_write_atomic(os.path.join(out_dir, f'trace-{week}{suffix}.json'), json.dumps(self._trace_events())))
+        return paths
+    
+    def _trace_events(self) -> dict:
+        """Spans als Chrome trace events (te openen in chrome://tracing of Perfetto), één rij per klant."""
+        threads = {}
+        events = []
+        for span in self.spans:
+            name = span['customer'] or 'run'
+            if name not in threads:
+                threads[name] = len(threads) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': threads[name], 'args': {'name': name}})
+            events.append({
+                'name': f"{span['name']} {span['labels'].get('service', '')}".strip(),
+                'ph': 'X',
+                'ts': round(span['start'] * 1e6),
+                'dur': round(span['seconds'] * 1e6),
+                'pid': 1,
+                'tid': threads[name],
+                'args': {**span['labels'], 'error': span['error']}
+            })
+        return {'traceEvents': events}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _write_atomic(path: str, content: str) -> str:
+    """Schrijf via een tijdelijk bestand, zodat een collector nooit een half bestand leest."""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return path
+
+
+_metrics: Metrics | None = None
+
+
+def get_metrics() -> Metrics:
+    """Return de gedeelde metrics van deze run; maakt ze aan bij eerste gebruik."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
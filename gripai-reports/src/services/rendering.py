@@ -0,0 +1,152 @@
+"""
+GripAI - Rendering van rapport emails
+Eén geconfigureerde Jinja Environment met bytecode cache, gecachte
+Nederlandse bedrag- en datumformattering, en batch rendering over een
+worker pool.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+
+TEMPLATE_DIR = Path(__file__).parent.parent / 'templates'
+
+MONTHS_NL = ('jan', 'feb', 'mrt', 'apr', 'mei', 'jun', 'jul', 'aug', 'sep', 'okt', 'nov', 'dec')
+
+
+@lru_cache(maxsize=4096)
+def format_euro(amount: float) -> str:
+    """Bedrag in Nederlandse notatie, bijv. 24750.5 -> '€24.750,50'."""
+    formatted = f"{amount:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+    return f"€{formatted}"
+
+
+@lru_cache(maxsize=256)
+def format_week_period(week_start: datetime, week_end: datetime) -> str:
+    """Weekperiode met Nederlandse maandnamen, bijv. '06 okt - 12 okt 2026'."""
+    start = f"{week_start.day:02d} {MONTHS_NL[week_start.month - 1]}"
+    end = f"{week_end.day:02d} {MONTHS_NL[week_end.month - 1]} {week_end.year}"
+    return f"{start} - {end}"
+
+
+class ReportRenderer:
+    """Rendert rapport HTML uit templates/report.html."""
+    
+    def __init__(self, template_dir: str | None = None, cache_dir: str | None = None):
+        """
+        Args:
+            template_dir: Map met report.html (default src/templates)
+            cache_dir: Map voor de Jinja bytecode cache (default env TEMPLATE_CACHE_DIR of .cache/templates)
+        """
+        self.template_dir = Path(template_dir or TEMPLATE_DIR)
+        self.cache_dir = Path(cache_dir or os.getenv('TEMPLATE_CACHE_DIR', '.cache/templates'))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+        self.env = Environment(
+            loader=FileSystemLoader(self.template_dir),
+            autoescape=select_autoescape(['html']),
+            bytecode_cache=FileSystemBytecodeCache(str(self.cache_dir)),
+            auto_reload=False
+        )
+        self.env.filters['euro'] = format_euro
+        self.template = self.env.get_template('report.html')
+    
+    def render(
+        self,
+        company_name: str,
+        analysis: str,
+        data: dict,
+        week_start: datetime,
+        week_end: datetime
+    ) -> str:
+        """Render het rapport voor één klant."""
+        return self.template.render(
+            company_name=company_name,
+            week_period=format_week_period(week_start, week_end),
+            analysis=analysis,
+            revenue=format_euro(data.get('revenue', 0)),
+            costs=format_euro(data.get('costs', 0)),
+            profit=format_euro(data.get('profit', 0)),
+            invoices_sent=data.get('invoices_sent', 0),
+            invoices_paid=data.get('invoices_paid', 0),
+            outstanding=format_euro(data.get('outstanding_total', 0)),
+            outstanding_overdue=format_euro(data.get('outstanding_overdue', 0)),
+            year=datetime.now().year
+        )
+    
+    def render_many(self, reports: list[dict], workers: int | None = None) -> list[str]:
+        """
+        Render veel rapporten, verdeeld over een process pool.
+        
+        Args:
+            reports: Dicts met company_name, analysis, data, week_start en week_end
+            workers: Aantal processen (default env RENDER_WORKERS of 1); 1 rendert
+                     in dit proces. Een pool loont pas bij grote batches, het
+                     template zelf rendert in tientallen microseconden.
+        
+        Returns:
+            HTML per rapport, in dezelfde volgorde.
+        """
+        workers = workers or int(os.getenv('RENDER_WORKERS', '1'))
+        if workers <= 1 or len(reports) < workers * 8:
+            return [self.render(**report) for report in reports]
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(str(self.template_dir), str(self.cache_dir))
+        ) as pool:
+            return list(pool.map(_render_worker, reports, chunksize=max(1, len(reports) // (workers * 4))))
+
+
+_worker_renderer: ReportRenderer | None = None
+
+
+def _init_worker(template_dir: str, cache_dir: str):
+    global _worker_renderer
+    _worker_renderer = ReportRenderer(template_dir, cache_dir)
+
+
+def _render_worker(report: dict) -> str:
+    return _worker_renderer.render(**report)
+
+
+def render_only(reports: list[dict], out_dir: str, renderer: ReportRenderer | None = None, workers: int | None = None) -> dict:
+    """
+    Render rapporten naar HTML bestanden zonder te mailen.
+    
+    Args:
+        reports: Als render_many, plus optioneel 'name' voor de bestandsnaam
+        out_dir: Map waar de HTML bestanden komen
+    
+    Returns:
+        Dict met count, seconds, per_second en de geschreven paths.
+    """
+    renderer = renderer or ReportRenderer()
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    
+    names = [report.get('name') or f"report_{i:05d}" for i, report in enumerate(reports)]
+    payload = [{k: v for k, v in report.items() if k != 'name'} for report in reports]
+    
+    started = time.perf_counter()
+    htmls = renderer.render_many(payload, workers=workers)
+    seconds = time.perf_counter() - started
+    
+    paths = []
+    for name, html in zip(names, htmls):
+        path = out / f"{name}.html"
+        path.write_text(html, encoding='utf-8')
+        paths.append(path)
+    
+    return {
+        'count': len(htmls),
+        'seconds': seconds,
+        'per_second': len(htmls) / seconds if seconds else float('inf'),
+        'paths': paths
+    }
@@ -0,0 +1,78 @@
+"""
+GripAI - Sharding van de weekrun
+Klanten worden op een hash van hun id over N shards verdeeld, zodat
+meerdere replicas of processen elk een vast, disjunct deel van de klanten
+verwerken. De verdeling hangt alleen af van het id, niet van de volgorde
+of het aantal klanten.
+"""
+
+import hashlib
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse 'i/N' (bv. '0/4') naar (index, aantal)."""
+    index, _, count = value.partition('/')
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}: expected i/N with 0 <= i < N")
+    return index, count
+
+
+def shard_of(customer_id: str, count: int) -> int:
+    """Shard index van een klant; stabiel over processen en Python versies."""
+    digest = hashlib.sha256(str(customer_id).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def select_shard(customers: list[dict], index: int, count: int) -> list[dict]:
+    """Alleen de klanten van shard index van count."""
+    if count == 1:
+        return customers
+    return [customer for customer in customers if shard_of(customer['id'], count) == index]
+
+
+def split_shard(index: int, count: int, parts: int) -> list[tuple[int, int]]:
+    """
+    Verdeel shard index/count in parts sub-shards.
+    
+    Sub-shard j is (index + count * j) / (count * parts): dat zijn precies de
+    klanten van index/count, want hash % (count * parts) bepaalt hash % count.
+    """
+    return [(index + count * j, count * parts) for j in range(parts)]
+
+
+def merge_summaries(summaries: list[dict]) -> dict:
+    """Voeg de run samenvattingen van meerdere shards samen."""
+    merged = {
+        'customers': 0,
+        'sent': 0,
+        'shards': len(summaries),
+        'scheduler': {},
+        'http_cache': {},
+        'claude': {},
+        'latency': {},
+        'pipeline': {},
+        'unsaved': 0
+    }
+    for summary in summaries:
+        merged['customers'] += summary['customers']
+        merged['sent'] += summary['sent']
+        merged['unsaved'] += summary.get('unsaved', 0)
+        for section in ('scheduler', 'http_cache', 'claude'):
+            for key, value in summary.get(section, {}).items():
+                merged[section][key] = merged[section].get(key, 0) + value
+        # Klanttijden: per shard al een kwantiel, de slechtste shard is een bovengrens
+        for key, value in (summary.get('latency') or {}).items():
+            if value is not None:
+                merged['latency'][key] = max(merged['latency'].get(key, 0), value)
+        for stage in summary['pipeline'] or []:
+            total = merged['pipeline'].setdefault(stage['stage'], {
+                'stage': stage['stage'], 'workers': 0, 'processed': 0, 'failed': 0,
+                'max_queue_depth': 0, 'per_second': 0.0
+            })
+            # Shards draaien tegelijk: ook de throughput telt op
+            for key in ('workers', 'processed', 'failed', 'per_second'):
+                total[key] += stage[key]
+            total['max_queue_depth'] = max(total['max_queue_depth'], stage['max_queue_depth'])
+    merged['pipeline'] = list(merged['pipeline'].values()) or None
+    return merged